@@ -10,6 +10,8 @@ MOCK_MODULES: list[str] = [
     "usb_hid",
     "storage",
     "_bleio",
+    "supervisor",
+    "usb_cdc",
 ]
 
 
@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 from enum import Enum
@@ -8,6 +9,7 @@ import uvicorn
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
+from roki.cli.compiler import CompileError, compile_config
 from roki.cli.file_management import (
     copy_file,
     copy_tree,
@@ -18,12 +20,16 @@ from roki.cli.file_management import (
 )
 from roki.cli.html_generator import Generator
 from roki.cli.options import VERBOSE_OPTION
+from roki.cli.probes import format_histograms, parse_probe_lines, read_serial_lines
 from roki.cli.utils import (
     create_mount_point,
     debug_codes,
     get_devices,
+    get_serial_device,
     install_circuitpython_libs,
+    push_config,
     replace_params,
+    soft_reload,
     unmount,
 )
 from roki.tui.app import Configurator
@@ -85,10 +91,23 @@ def upload_code(
         True,
         help="Replace with default settings file ('settings.toml')",
     ),
+    compiled: bool = typer.Option(
+        False,
+        "--compile",
+        help="Upload a pre-resolved keymap compiled from 'config.json'",
+    ),
+    reload: bool = typer.Option(
+        True,
+        help="Restart the board into the new code over serial",
+    ),
 ):
     """Upload code and libs to device"""
 
     is_left_side = side in ("l", "left")
+    keymap = "keymap-left.bin" if is_left_side else "keymap-right.bin"
+
+    if compiled:
+        _compile(os.path.join(firmware_relative_tree, "config.json"))
 
     devices = get_devices()
     options = {n: dev for n, dev in enumerate(devices, start=1)}
@@ -139,6 +158,11 @@ def upload_code(
     else:
         logger.warning("Skipping config reset (config.json)")
 
+    # a stale keymap would take precedence over config.json
+    delete_file(os.path.join(dst, keymap))
+    if compiled:
+        copy_file(os.path.join(firmware_relative_tree, keymap), dst)
+
     create_tree(firmware_location)
     copy_tree(firmware_relative_tree, firmware_location, ["py", "json"])
     create_empty_file(os.path.join(dst, "roki", "__init__.py"))
@@ -163,6 +187,9 @@ def upload_code(
                         f"IS_LEFT_SIDE={int(is_left_side)}",
                         "DEBUG=0",
                         "LOG_LEVEL=0",
+                        "PROBES=0",
+                        "COMPILED_KEYMAP=0",
+                        "MAX_RESIDENT_LAYERS=0",
                     ]
                 )
             )
@@ -176,6 +203,7 @@ def upload_code(
         python_firmware_files: list[str] = [
             "keys.py",
             "kb.py",
+            "scheduler.py",
         ]
         for file in python_firmware_files:
             install_circuitpython_libs(dst, os.path.join(firmware_location, file))
@@ -189,6 +217,15 @@ def upload_code(
         logger.info("Unmounting...")
         unmount(dst)
 
+    # the firmware turns autoreload off, it only reloads its config by itself
+    if reload:
+        port = get_serial_device() or ""
+        if port:
+            logger.info(f"Restarting the board on {port}")
+            soft_reload(port)
+        else:
+            logger.warning("No serial port found, reset the board to run the new code")
+
 
 @app.command(name="run")
 def run(
@@ -267,6 +304,121 @@ def generate(
     Generator().generate_html()
 
 
+def _compile(config: str, output: str = firmware_relative_tree) -> list[str]:
+    try:
+        return compile_config(config, output)
+    except CompileError as e:
+        for error in e.errors:
+            logger.error(error)
+        raise typer.Abort()
+
+
+@app.command(name="compile")
+def compile_keymap(
+    _: int = VERBOSE_OPTION,
+    config: str = typer.Option(
+        os.path.join(firmware_relative_tree, "config.json"),
+        help="Config file to compile",
+    ),
+    output: str = typer.Option(
+        firmware_relative_tree,
+        help="Directory for the compiled keymaps",
+    ),
+):
+    """Validate config and compile a pre-resolved keymap for each side"""
+
+    for path in _compile(config, output):
+        print(path)
+
+
+@app.command()
+def simulate(
+    _: int = VERBOSE_OPTION,
+    ticks: int = typer.Option(2000, help="Scheduler ticks per keyboard half"),
+    step: int = typer.Option(1, help="Simulated milliseconds per tick"),
+    keys: int = typer.Option(20, help="Keys rolled on each side"),
+    gap: int = typer.Option(15, help="Milliseconds between rolled key presses"),
+    hold: int = typer.Option(40, help="Milliseconds each key is held"),
+    packets_per_event: int = typer.Option(
+        1,
+        help="BLE packets delivered per connection event",
+    ),
+    idle_interval: float = typer.Option(
+        30.0,
+        help="Connection interval in ms once typing stops",
+    ),
+):
+    """Simulate both keyboard halves on the host and report latency"""
+
+    from roki.simulator.session import Simulator
+
+    # letter positions on the two middle rows of each half
+    positions = (7, 8, 9, 10, 11, 13, 14, 15, 16, 17)
+    key_numbers = [positions[i % len(positions)] for i in range(keys)]
+
+    simulator = Simulator(
+        ticks=ticks,
+        step=step,
+        packets_per_event=packets_per_event,
+        idle_connection_interval=idle_interval,
+    )
+    simulator.roll("primary", key_numbers, start=10, gap=gap, hold=hold)
+    simulator.roll("secondary", key_numbers, start=10 + gap // 2, gap=gap, hold=hold)
+
+    logger.info("Running simulation...")
+    print(simulator.run().format())
+
+
+@app.command()
+def probes(
+    _: int = VERBOSE_OPTION,
+    port: str = typer.Option("", help="Serial port, auto-detected when empty"),
+    duration: float = typer.Option(15.0, help="Seconds to listen for probe dumps"),
+    file: str = typer.Option("", help="Parse a captured serial log instead"),
+):
+    """Show latency histograms dumped by the firmware (PROBES=1)"""
+
+    if file:
+        with open(file) as f:
+            lines = f.readlines()
+    else:
+        port = port or get_serial_device() or ""
+        if not port:
+            logger.error("No device found!")
+            raise typer.Abort()
+        logger.info(f"Listening on {port} for {duration} seconds...")
+        lines = read_serial_lines(port, duration)
+
+    print(format_histograms(parse_probe_lines(lines)))
+
+
+@app.command()
+def push(
+    _: int = VERBOSE_OPTION,
+    config: str = typer.Option(
+        os.path.join(firmware_relative_tree, "config.json"),
+        help="Config file to push",
+    ),
+    port: str = typer.Option("", help="Serial port, auto-detected when empty"),
+):
+    """Apply a config to the running keyboard over serial, without a reboot"""
+
+    with open(config) as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            logger.error(f"Invalid config: {e}")
+            raise typer.Abort()
+
+    port = port or get_serial_device() or ""
+    if not port:
+        logger.error("No device found!")
+        raise typer.Abort()
+
+    logger.info(f"Pushing {config} to {port}")
+    push_config(port, json.dumps(data, separators=(",", ":")).encode())
+
+
 @app.command()
 def config(
     _: int = VERBOSE_OPTION,
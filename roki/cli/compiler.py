@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import re
+import struct
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from roki.cli.config.keys import KEYS
+
+logger = logging.getLogger(__name__)
+
+LAYER_COMMAND = re.compile(
+    r"^LAYER(?:_(\d+))?_(PRESS|HOLD|TOGGLE|ONESHOT|DEFAULT|INC|DEC|EXTRAS)$",
+    re.IGNORECASE,
+)
+
+MACRO_KEY = re.compile(r"^MACRO_(\d+)$")
+
+MAX_KEYS = 255
+# same as `roki.firmware.keys.TAP_HOLD_SEPARATOR`
+TAP_HOLD_SEPARATOR = "|"
+# same as `roki.firmware.config.MAX_LAYERS`
+MAX_LAYERS = 16
+
+
+class CompileError(Exception):
+    def __init__(self, errors: list[str]) -> None:
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+
+@contextmanager
+def firmware_modules() -> Iterator[None]:
+    """Make the firmware key tables importable on the host."""
+    from roki.simulator.hardware import build_modules
+
+    with patch.dict(sys.modules, build_modules()):
+        yield
+
+
+def _layer_names(layer: dict) -> Iterator[tuple[str, object]]:
+    for side in ("primary_keys", "secondary_keys"):
+        for r, row in enumerate(layer.get(side, ())):
+            for c, name in enumerate(row):
+                yield f"{side}[{r}][{c}]", name
+    for side in ("primary_encoder", "secondary_encoder"):
+        for i, name in enumerate(layer.get(side, ())):
+            yield f"{side}[{i}]", name
+
+
+def validate_config(data: dict) -> list[str]:
+    """Check every key name against the catalog, return readable errors."""
+    errors: list[str] = []
+    layers = data.get("layers")
+    if not isinstance(layers, list) or not layers:
+        return ["'layers' must be a non-empty list"]
+    if len(layers) > MAX_LAYERS:
+        errors.append(f"At most {MAX_LAYERS} layers are supported")
+
+    known = {key.value for key in KEYS}
+    for n, layer in enumerate(layers):
+        label = f"layer {n} ({layer.get('name', 'no name')})"
+        for side in ("primary_keys", "secondary_keys"):
+            count = sum(len(row) for row in layer.get(side, ()))
+            if count > MAX_KEYS:
+                errors.append(f"{label}: too many {side} ({count})")
+        for side in ("primary_encoder", "secondary_encoder"):
+            if side in layer and len(layer[side]) != 2:
+                errors.append(f"{label}: {side} needs exactly 2 keys")
+
+        for position, name in _layer_names(layer):
+            if name is None or name == "":
+                continue
+            if not isinstance(name, str):
+                errors.append(f"{label}: {position} is not a key name: {name!r}")
+                continue
+            names = name.split(TAP_HOLD_SEPARATOR)
+            if len(names) > 2:
+                errors.append(f"{label}: {position} has more than 2 roles: {name!r}")
+            for part in names:
+                errors.extend(_validate_name(f"{label}: {position}", part, known, data))
+
+    # combos are matched on key positions, encoders have none
+    base = {
+        name
+        for position, name in _layer_names(layers[0])
+        if position.startswith(("primary_keys", "secondary_keys"))
+    }
+    for n, combo in enumerate(data.get("combos", ())):
+        label = f"combo {n}"
+        keys = combo.get("keys") if isinstance(combo, dict) else None
+        if not isinstance(keys, list) or len(keys) < 2:
+            errors.append(f"{label}: 'keys' must list at least 2 keys")
+            continue
+        for name in keys:
+            if name not in base:
+                errors.append(f"{label}: {name!r} is not on the base layer")
+        errors.extend(_validate_name(label, combo.get("key", ""), known, data))
+
+    for n, macro in enumerate(data.get("macros", ())):
+        label = f"macro {n}"
+        if isinstance(macro, str):
+            if not macro.isascii():
+                errors.append(f"{label}: only ASCII text can be typed")
+        elif isinstance(macro, list):
+            for chord in macro:
+                for name in str(chord).split("+"):
+                    if name not in known:
+                        errors.append(f"{label}: unknown key {name!r}")
+        else:
+            errors.append(f"{label}: must be a string or a list of keys")
+    return errors
+
+
+def _validate_name(label: str, name: str, known: set[str], data: dict) -> list[str]:
+    if name in known:
+        return []
+    if match := LAYER_COMMAND.match(name):
+        index = match.group(1)
+        if index is not None and int(index) >= len(data["layers"]):
+            return [f"{label} targets missing layer {index}: {name}"]
+        return []
+    if match := MACRO_KEY.match(name):
+        if int(match.group(1)) >= len(data.get("macros", ())):
+            return [f"{label} targets missing macro {match.group(1)}: {name}"]
+        return []
+    return [f"{label} unknown key {name!r}"]
+
+
+def compile_keymap(data: dict, is_left_side: bool) -> bytes:
+    """Resolve every key of one half, see `roki.firmware.config.load_keymap`."""
+    errors = validate_config(data)
+    if errors:
+        raise CompileError(errors)
+
+    with firmware_modules():
+        from roki.firmware.config import (
+            KEYMAP_MAGIC,
+            combo_positions,
+            parse_color,
+            side_key_names,
+        )
+        from roki.firmware.keys import LAYER, MACRO, NOOP, TAP_HOLD, build_key_index
+        from roki.firmware.macros import compile_macro
+
+        index = build_key_index()
+        commands: list[str] = []
+
+        def resolve(name: str | None) -> tuple[int, int]:
+            if not name:
+                return NOOP, 0
+            if LAYER_COMMAND.match(name) or TAP_HOLD_SEPARATOR in name:
+                kind = TAP_HOLD if TAP_HOLD_SEPARATOR in name else LAYER
+                if kind == LAYER:
+                    name = name.upper()
+                if name not in commands:
+                    commands.append(name)
+                return kind, commands.index(name)
+            if match := MACRO_KEY.match(name):
+                return MACRO, int(match.group(1))
+            if name not in index:
+                raise CompileError([f"{name!r} is not supported by the firmware"])
+            packed = index[name]
+            return packed >> 16, packed & 0xFFFF
+
+        body = bytearray()
+        layers = data["layers"]
+        body.append(len(layers))
+        for layer in layers:
+            name = layer.get("name", "no name").encode()
+            body.append(len(name))
+            body += name
+            body += bytes(parse_color(layer.get("color", "#000000")))
+
+            primary, secondary, encoders = side_key_names(layer, is_left_side)
+            body.append(len(primary))
+            body.append(len(secondary))
+            keys = [resolve(k) for k in (*primary, *secondary, *encoders)]
+            body += bytes(kind for kind, _ in keys)
+            body += struct.pack(f"<{len(keys)}H", *(code for _, code in keys))
+
+        combos = data.get("combos", [])
+        body.append(len(combos))
+        for combo in combos:
+            positions = combo_positions(combo["keys"], layers[0], is_left_side)
+            if positions is None:
+                raise CompileError(
+                    [f"combo keys {combo['keys']!r} are not on the base layer"]
+                )
+            body.append(len(positions))
+            body += struct.pack(f"<{len(positions)}H", *positions)
+            kind, code = resolve(combo["key"])
+            body += struct.pack("<BH", kind, code)
+
+        macros = data.get("macros", [])
+        body.append(len(macros))
+        for macro in macros:
+            steps = compile_macro(macro)
+            body += struct.pack("<H", len(steps))
+            body += steps
+
+    header = bytearray(KEYMAP_MAGIC)
+    header.append(len(commands))
+    for command in commands:
+        header.append(len(command))
+        header += command.encode()
+    return bytes(header + body)
+
+
+def compile_config(path: str, output: str) -> list[str]:
+    """Compile `path` into one keymap per half, return the written files."""
+    with firmware_modules():
+        from roki.firmware.config import keymap_file
+
+    with open(path) as f:
+        data = json.load(f)
+
+    written: list[str] = []
+    for is_left_side in (True, False):
+        keymap = compile_keymap(data, is_left_side)
+        destination = os.path.join(output, keymap_file(is_left_side))
+        with open(destination, "wb") as f:
+            f.write(keymap)
+        logger.info(f"Wrote {destination} ({len(keymap)} bytes)")
+        written.append(destination)
+    return written
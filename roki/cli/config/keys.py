@@ -501,6 +501,22 @@ LAYER_KEYS = [
         icon="layer group",
     )
     for d in ("increment", "decrement")
+] + [
+    Key(
+        name="TRANSPARENT",
+        value="TRNS",
+        description="Same key as the next active layer down.",
+        icon="layer group",
+    ),
+]
+
+MACRO_KEYS = [
+    Key(
+        name="MACRO STOP",
+        value="MACRO_STOP",
+        description="Stop typing the current macro.",
+        icon="keyboard",
+    ),
 ]
 
-KEYS = KEYBOARD_KEYS + MEDIA_KEYS + MOUSE_KEYS + LAYER_KEYS
+KEYS = KEYBOARD_KEYS + MEDIA_KEYS + MOUSE_KEYS + LAYER_KEYS + MACRO_KEYS
@@ -0,0 +1,111 @@
+import logging
+from dataclasses import dataclass
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# same marker as `roki.firmware.probes.MARKER`
+MARKER = "#probe"
+
+BAR_WIDTH = 40
+
+
+@dataclass
+class ProbeHistogram:
+    name: str
+    count: int
+    total: int
+    max: int
+    counts: list[int]
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> int:
+        """Upper bound (us) of the bucket holding the `p` percentile."""
+        target = self.count * p
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return bucket_upper_bound(bucket)
+        return 0
+
+
+def bucket_upper_bound(bucket: int) -> int:
+    return 1 << bucket
+
+
+def bucket_label(bucket: int, size: int) -> str:
+    if bucket == 0:
+        return "0 us"
+    low = 1 << (bucket - 1)
+    if bucket == size - 1:
+        return f">= {low} us"
+    return f"{low}-{(1 << bucket) - 1} us"
+
+
+def parse_probe_line(line: str) -> ProbeHistogram | None:
+    line = line.strip()
+    if not line.startswith(MARKER):
+        return None
+    try:
+        _, name, count, total, maximum, buckets = line.split()
+        return ProbeHistogram(
+            name=name,
+            count=int(count),
+            total=int(total),
+            max=int(maximum),
+            counts=[int(c) for c in buckets.split(",")],
+        )
+    except ValueError:
+        logger.warning(f"Malformed probe line: {line}")
+        return None
+
+
+def parse_probe_lines(lines: Iterable[str]) -> dict[str, ProbeHistogram]:
+    """Keep the latest dump of each histogram."""
+    histograms: dict[str, ProbeHistogram] = {}
+    for line in lines:
+        if histogram := parse_probe_line(line):
+            histograms[histogram.name] = histogram
+    return histograms
+
+
+def format_histogram(histogram: ProbeHistogram) -> str:
+    lines = [
+        f"{histogram.name}: {histogram.count} samples, "
+        f"mean {histogram.mean:.1f} us, "
+        f"p50 < {histogram.percentile(0.5)} us, "
+        f"p99 < {histogram.percentile(0.99)} us, "
+        f"max {histogram.max} us",
+    ]
+    peak = max(histogram.counts) or 1
+    size = len(histogram.counts)
+    for bucket, count in enumerate(histogram.counts):
+        if not count:
+            continue
+        bar = "#" * max(1, round(count / peak * BAR_WIDTH))
+        lines.append(f"  {bucket_label(bucket, size):>16} | {bar} {count}")
+    return "\n".join(lines)
+
+
+def format_histograms(histograms: dict[str, ProbeHistogram]) -> str:
+    if not histograms:
+        return "No probe data found."
+    return "\n\n".join(format_histogram(h) for h in histograms.values())
+
+
+def read_serial_lines(port: str, duration: float) -> list[str]:
+    import time
+
+    import serial
+
+    lines: list[str] = []
+    deadline = time.monotonic() + duration
+    with serial.Serial(port, baudrate=115200, timeout=0.5) as conn:
+        while time.monotonic() < deadline:
+            if raw := conn.readline():
+                lines.append(raw.decode("utf-8", errors="replace"))
+    return lines
@@ -115,6 +115,25 @@ def get_serial_device():
                 return ""
 
 
+def push_config(port: str, data: bytes):
+    """Send a config to the running firmware, see `ConfigReloader`."""
+    import serial
+
+    from roki.firmware.reload import FRAME_END, FRAME_START
+
+    with serial.Serial(port, baudrate=115200, timeout=0.5) as conn:
+        conn.write(FRAME_START + data + FRAME_END)
+
+
+def soft_reload(port: str):
+    """Stop the running code and reload it, as Ctrl-C then Ctrl-D would."""
+    import serial
+
+    with serial.Serial(port, baudrate=115200, timeout=0.5) as conn:
+        conn.write(b"\x03")
+        conn.write(b"\x04")
+
+
 def replace_params(code: str, params: dict[str, bool | int]) -> str:
     # identify pattern
     lines = code.splitlines()
@@ -0,0 +1,53 @@
+from array import array
+
+from roki.firmware.calibration import AXIS_MAX
+from roki.firmware.utils import SUBPIXEL_SHIFT, whole_pixels
+
+
+class Acceleration:
+    """
+    Turns thumb stick deflections in [-AXIS_MAX; AXIS_MAX] into cursor moves.
+
+    The speed of every deflection, `speed * (deflection / AXIS_MAX) ** curve`
+    px per tick, is computed once into a table in sub-pixels. The fractions
+    left after a move are carried over to the next tick, so slow movements
+    still move the cursor, and dropped when the stick is back in the middle.
+    """
+
+    __slots__ = ("table", "x", "y")
+
+    def __init__(
+        self, speed: int = 10, curve: float = 1.0, table: "array | None" = None
+    ) -> None:
+        # a second stick can share the table of the first one; "L" because
+        # speeds above 255 px per tick overflow 16 bits of sub-pixels
+        if table is None:
+            top = speed << SUBPIXEL_SHIFT
+            table = array(
+                "L",
+                (round(top * (i / AXIS_MAX) ** curve) for i in range(AXIS_MAX + 1)),
+            )
+        self.table = table
+        self.x = 0
+        self.y = 0
+
+    def move(self, x: int, y: int) -> tuple[int, int]:
+        table = self.table
+        if x > 0:
+            self.x += table[x]
+        elif x < 0:
+            self.x -= table[-x]
+        else:
+            self.x = 0
+        if y > 0:
+            self.y += table[y]
+        elif y < 0:
+            self.y -= table[-y]
+        else:
+            self.y = 0
+
+        dx = whole_pixels(self.x)
+        dy = whole_pixels(self.y)
+        self.x -= dx << SUBPIXEL_SHIFT
+        self.y -= dy << SUBPIXEL_SHIFT
+        return dx, dy
@@ -1,15 +1,53 @@
 import time
 
 import pwmio
+from adafruit_ticks import ticks_add, ticks_diff
+
+from roki.firmware.scheduler import Clock
+
+OFF = 0
+ON = 2**15
+
+NOTES: dict[str, int] = {
+    "C1": 33,
+    "D1": 37,
+    "E1": 41,
+    "F1": 44,
+    "G1": 49,
+    "A1": 55,
+    "B1": 62,
+    "C2": 65,
+    "D2": 73,
+    "E2": 82,
+    "F2": 87,
+    "G2": 98,
+    "A2": 110,
+    "B2": 123,
+    "C3": 131,
+    "D3": 147,
+    "E3": 165,
+    "F3": 175,
+    "G3": 196,
+    "A3": 220,
+    "B3": 246,
+    "C4": 262,
+    "D4": 294,
+    "E4": 330,
+    "F4": 349,
+    "G4": 392,
+    "A4": 440,
+    "B4": 494,
+}
 
 
 class Buzzer:
-    def __init__(self, pwm_pin: pwmio.PWMOut):
+    def __init__(self, pwm_pin: pwmio.PWMOut, clock: Clock | None = None):
         self.pwm_pin = pwm_pin
+        self.clock = clock or Clock()
+        self._queue: list[tuple[int, int]] = []
+        self._deadline: int | None = None
 
     def play_by_frequency(self, frequency: int, duration: float):
-        OFF = 0
-        ON = 2**15
         self.pwm_pin.duty_cycle = ON
         self.pwm_pin.frequency = frequency
         time.sleep(duration)
@@ -19,41 +57,44 @@ class Buzzer:
         time.sleep(duration)
 
     def play_by_note(self, note: str, duration: float):
-        notes = {
-            "C1": 33,
-            "D1": 37,
-            "E1": 41,
-            "F1": 44,
-            "G1": 49,
-            "A1": 55,
-            "B1": 62,
-            "C2": 65,
-            "D2": 73,
-            "E2": 82,
-            "F2": 87,
-            "G2": 98,
-            "A2": 110,
-            "B2": 123,
-            "C3": 131,
-            "D3": 147,
-            "E3": 165,
-            "F3": 175,
-            "G3": 196,
-            "A3": 220,
-            "B3": 246,
-            "C4": 262,
-            "D4": 294,
-            "E4": 330,
-            "F4": 349,
-            "G4": 392,
-            "A4": 440,
-            "B4": 494,
-        }
-        if note in notes:
-            self.play_by_frequency(notes[note], duration)
+        if note in NOTES:
+            self.play_by_frequency(NOTES[note], duration)
         else:
             self.pause(duration)
 
     def play_notes(self, notes: tuple[tuple[str, int], ...], duration: float):
         for note, multiple in notes:
             self.play_by_note(note, multiple * duration)
+
+    def queue_notes(self, notes: tuple[tuple[str, int], ...], duration: float):
+        """
+        Non-blocking version of `play_notes`, driven by `update` on the
+        scheduler clock.
+        """
+        for note, multiple in notes:
+            self._queue.append((NOTES.get(note, 0), int(multiple * duration * 1000)))
+
+    @property
+    def playing(self) -> bool:
+        return self._deadline is not None
+
+    def update(self) -> None:
+        if not self._queue and self._deadline is None:
+            return
+
+        now = self.clock.now()
+        if self._deadline is not None and ticks_diff(now, self._deadline) < 0:
+            return
+
+        if not self._queue:
+            self.pwm_pin.duty_cycle = OFF
+            self._deadline = None
+            return
+
+        frequency, duration = self._queue.pop(0)
+        if frequency:
+            self.pwm_pin.duty_cycle = ON
+            self.pwm_pin.frequency = frequency
+        else:
+            self.pwm_pin.duty_cycle = OFF
+        self._deadline = ticks_add(now, duration)
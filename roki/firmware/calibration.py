@@ -11,6 +11,11 @@ from roki.firmware.utils import Loop, blink_led
 
 logger = logging.getLogger(__name__)
 
+# normalized deflections are ints in [-AXIS_MAX; AXIS_MAX], 7 bits like the
+# thumb stick messages
+AXIS_MAX = 127
+SCALE_SHIFT = 16
+
 
 class BaseCalibration:
     def __init__(
@@ -40,8 +45,18 @@ class BaseCalibration:
         self.release_time = release_time
         self.mid_time = mid_time
 
+        # dead zone edges, ranges beyond them and their reciprocal scales,
+        # all zero until `read` so the stick stays still
+        self.lower_span_x = 0
+        self.upper_span_x = 0
+        self.lower_span_y = 0
+        self.upper_span_y = 0
+        self.lower_scale_x = 0
+        self.upper_scale_x = 0
+        self.lower_scale_y = 0
+        self.upper_scale_y = 0
+
         self.running = True
-        self._read = False
         self._limit = 0.05
         self.max_iterations = max_iterations
 
@@ -97,33 +112,51 @@ class BaseCalibration:
     def read(self) -> None:
         raise NotImplementedError
 
-    def get_normalized(self, x: int, y: int) -> tuple[float, float]:
-        if self._read is False:
-            self.read()
-
+    def get_normalized(self, x: int, y: int) -> tuple[int, int]:
+        """Deflections in [-AXIS_MAX; AXIS_MAX], call `read` first."""
         return self._get_normalized_x(x), self._get_normalized_y(y)
 
-    def _get_normalized_x(self, x: int) -> float:
+    def _get_normalized_x(self, x: int) -> int:
         if x < self.lower_mid_x:
-            return -max(
-                min((self.lower_mid_x - x) / (self.lower_mid_x - self.min_x), 1.0), 0.0
-            )
+            d = min(self.lower_mid_x - x, self.lower_span_x)
+            return -((d * self.lower_scale_x) >> SCALE_SHIFT)
         if x > self.upper_mid_x:
-            return max(
-                min((x - self.upper_mid_x) / (self.max_x - self.upper_mid_x), 1.0), 0.0
-            )
-        return 0.0
+            d = min(x - self.upper_mid_x, self.upper_span_x)
+            return (d * self.upper_scale_x) >> SCALE_SHIFT
+        return 0
 
-    def _get_normalized_y(self, y: int) -> float:
+    def _get_normalized_y(self, y: int) -> int:
         if y < self.lower_mid_y:
-            return -max(
-                min((self.lower_mid_y - y) / (self.lower_mid_y - self.min_y), 1.0), 0.0
-            )
+            d = min(self.lower_mid_y - y, self.lower_span_y)
+            return -((d * self.lower_scale_y) >> SCALE_SHIFT)
         if y > self.upper_mid_y:
-            return max(
-                min((y - self.upper_mid_y) / (self.max_y - self.upper_mid_y), 1.0), 0.0
-            )
-        return 0.0
+            d = min(y - self.upper_mid_y, self.upper_span_y)
+            return (d * self.upper_scale_y) >> SCALE_SHIFT
+        return 0
+
+    def _update_scales(self) -> None:
+        self.lower_mid_x = int(self.lower_mid_x)
+        self.upper_mid_x = int(self.upper_mid_x)
+        self.lower_mid_y = int(self.lower_mid_y)
+        self.upper_mid_y = int(self.upper_mid_y)
+
+        self.lower_span_x = max(self.lower_mid_x - int(self.min_x), 0)
+        self.upper_span_x = max(int(self.max_x) - self.upper_mid_x, 0)
+        self.lower_span_y = max(self.lower_mid_y - int(self.min_y), 0)
+        self.upper_span_y = max(int(self.max_y) - self.upper_mid_y, 0)
+
+        self.lower_scale_x = _scale(self.lower_span_x)
+        self.upper_scale_x = _scale(self.upper_span_x)
+        self.lower_scale_y = _scale(self.lower_span_y)
+        self.upper_scale_y = _scale(self.upper_span_y)
+
+
+def _scale(span: int) -> int:
+    # rounded up so the end of the range maps to AXIS_MAX, a span below
+    # 2 ** SCALE_SHIFT keeps it from going past
+    if span <= 0:
+        return 0
+    return -(-(AXIS_MAX << SCALE_SHIFT) // span)
 
 
 class Calibration(BaseCalibration):
@@ -202,3 +235,5 @@ class Calibration(BaseCalibration):
 
         del self.mid_x
         del self.mid_y
+
+        self._update_scales()
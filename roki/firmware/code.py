@@ -1,4 +1,6 @@
 import board
+import supervisor
+import usb_cdc
 
 from roki.firmware import logging
 from roki.firmware.params import Params
@@ -12,6 +14,14 @@ def main():
     from roki.firmware.config import Config
     from roki.firmware.kb import Primary, Secondary
 
+    if Params().PROBES:
+        from roki.firmware import probes
+
+        probes.install()
+
+    # config changes are applied by the running keyboard, see ConfigReloader
+    supervisor.runtime.autoreload = False
+
     # pin mapping for the nice!nano
     config = Config.read()
     roki = (Primary if config.is_left_side else Secondary)(
@@ -25,7 +35,9 @@ def main():
         columns_to_anodes=False,
         interval=0.001,
         max_events=5,
+        max_events_per_tick=5,
         connection_interval=7.5,
+        config_stream=usb_cdc.console,
     )
     roki.run()
 
@@ -0,0 +1,222 @@
+from array import array
+
+from adafruit_ticks import ticks_add
+
+from roki.firmware import logging
+from roki.firmware.keys import dispatch
+from roki.firmware.scheduler import Clock, Timer, TimerWheel
+
+try:
+    from typing import Callable, Sequence
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+# masks stay small ints on CircuitPython
+MAX_BITS = 30
+
+NO_COMBO = -1
+
+
+class Combos:
+    """
+    Keys pressed together within `term` ms send the key of a combo instead.
+
+    Every position used by a combo gets a bit, and every bit the mask of the
+    combos using it, so a press narrows the candidates with a single AND and
+    a candidate matches when its mask equals the pressed keys. Presses are
+    queued while a combo can still match and replayed through `process` as
+    soon as none can. The combo key, sent to `send` (`keys.dispatch` by
+    default), is released with the first of its keys.
+    """
+
+    __slots__ = (
+        "clock",
+        "timers",
+        "timer",
+        "process",
+        "term",
+        "bits",
+        "masks",
+        "kinds",
+        "codes",
+        "combos_of",
+        "candidates",
+        "pressed",
+        "queue",
+        "queued",
+        "fired",
+        "held",
+        "send",
+    )
+
+    def __init__(
+        self,
+        clock: Clock,
+        timers: TimerWheel,
+        combos: "Sequence[tuple[tuple[int, ...], int, int]]",
+        process: "Callable[[int, bool], None]",
+        term: int = 50,
+        size: int = 8,
+        send: "Callable[[int, int, bool], None] | None" = None,
+    ) -> None:
+        self.clock = clock
+        self.timers = timers
+        self.timer = Timer(self.expire)
+        self.process = process
+        self.term = term
+
+        # position -> bit
+        self.bits: dict[int, int] = {}
+        self.masks = array("L")
+        self.kinds = bytearray()
+        self.codes = array("H")
+        for positions, kind, code in combos:
+            mask = self._mask(positions)
+            if not mask or len(self.masks) == MAX_BITS:
+                logger.warning(f"Combo ignored: {positions}")
+                continue
+            self.masks.append(mask)
+            self.kinds.append(kind)
+            self.codes.append(code)
+
+        self.combos_of = array("L", (0 for _ in self.bits))
+        for i, mask in enumerate(self.masks):
+            for bit in range(len(self.bits)):
+                if mask & (1 << bit):
+                    self.combos_of[bit] |= 1 << i
+
+        self.candidates = 0
+        self.pressed = 0
+        self.queue = array("H", (0 for _ in range(size)))
+        self.queued = 0
+        self.fired = 0
+        self.held = 0
+        self.send = send
+
+    def _mask(self, positions: tuple[int, ...]) -> int:
+        if len(positions) < 2:
+            return 0
+        new = [p for p in positions if p not in self.bits]
+        if len(self.bits) + len(new) > MAX_BITS:
+            return 0
+        mask = 0
+        for position in positions:
+            if position not in self.bits:
+                self.bits[position] = len(self.bits)
+            mask |= 1 << self.bits[position]
+        return mask
+
+    def handle(self, position: int, pressed: bool) -> bool:
+        """Return False when the caller has to process the event."""
+        bit = self.bits.get(position, NO_COMBO)
+        if not pressed:
+            return self._handle_release(bit)
+        if bit == NO_COMBO:
+            if self.queued:
+                self.flush()
+            return False
+
+        if self.queued:
+            candidates = self.candidates & self.combos_of[bit]
+            if (
+                not candidates
+                or self.pressed & (1 << bit)
+                or self.queued == len(self.queue)
+            ):
+                self.flush()
+                return self.handle(position, pressed)
+        else:
+            candidates = self.combos_of[bit]
+            self.timers.schedule(self.timer, ticks_add(self.clock.now(), self.term))
+
+        self.candidates = candidates
+        self.pressed |= 1 << bit
+        self.queue[self.queued] = position
+        self.queued += 1
+
+        combo = self.match()
+        if combo != NO_COMBO and candidates == 1 << combo:
+            # no other candidate can still match
+            self.fire(combo)
+        return True
+
+    def _handle_release(self, bit: int) -> bool:
+        if bit != NO_COMBO and self.held & (1 << bit):
+            self._release(bit)
+            return True
+        if not self.queued:
+            return False
+        if bit != NO_COMBO and self.pressed & (1 << bit):
+            combo = self.match()
+            if combo != NO_COMBO:
+                self.fire(combo)
+                self._release(bit)
+                return True
+        self.flush()
+        return False
+
+    def match(self) -> int:
+        """Index of the candidate matching the pressed keys."""
+        candidates = self.candidates
+        i = 0
+        while candidates:
+            if candidates & 1 and self.masks[i] == self.pressed:
+                return i
+            candidates >>= 1
+            i += 1
+        return NO_COMBO
+
+    def expire(self) -> None:
+        combo = self.match()
+        if combo == NO_COMBO:
+            self.flush()
+        else:
+            self.fire(combo)
+
+    def fire(self, combo: int) -> None:
+        self._reset()
+        self._dispatch(self.kinds[combo], self.codes[combo], True)
+        self.fired |= 1 << combo
+        self.held |= self.masks[combo]
+
+    def release(self) -> None:
+        """Release the combo keys sent, forget the queued presses."""
+        self._reset()
+        fired = self.fired
+        i = 0
+        while fired:
+            if fired & 1:
+                self._dispatch(self.kinds[i], self.codes[i], False)
+            fired >>= 1
+            i += 1
+        self.fired = 0
+        self.held = 0
+
+    def flush(self) -> None:
+        """Replay the queued presses."""
+        queued = self.queued
+        self._reset()
+        for i in range(queued):
+            self.process(self.queue[i], True)
+
+    def _dispatch(self, kind: int, code: int, pressed: bool) -> None:
+        (self.send or dispatch)(kind, code, pressed)
+
+    def _reset(self) -> None:
+        self.timers.cancel(self.timer)
+        self.queued = 0
+        self.pressed = 0
+        self.candidates = 0
+
+    def _release(self, bit: int) -> None:
+        self.held &= ~(1 << bit)
+        fired = self.fired
+        i = 0
+        while fired:
+            if fired & 1 and self.masks[i] & (1 << bit):
+                self._dispatch(self.kinds[i], self.codes[i], False)
+                self.fired &= ~(1 << i)
+            fired >>= 1
+            i += 1
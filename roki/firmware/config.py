@@ -1,13 +1,38 @@
 from __future__ import annotations
 
 import json
+import os
+from array import array
 
 from roki.firmware import logging
-from roki.firmware.keys import BaseKey, init
+from roki.firmware.keys import (
+    LAYER,
+    TAP_HOLD,
+    TRANSPARENT,
+    BaseKey,
+    commands,
+    dispatch,
+    encode,
+    encode_keys,
+    init,
+    key_pool,
+    macros,
+)
+from roki.firmware.layer_handler import OnPressExtrasCommand
+from roki.firmware.macros import compile_macro
+from roki.firmware.memory import mem_free
 from roki.firmware.params import Params
 
+try:
+    from typing import Any, Callable, Iterator
+except ImportError:
+    pass
+
 logger = logging.getLogger(__name__)
 
+# pre-resolved keymap written by `roki compile`, see `load_keymap`
+KEYMAP_MAGIC = b"RKM\x01"
+
 
 def parse_color(
     color: str | list[int | str] | tuple[int | str, int | str, int | str],
@@ -28,6 +53,22 @@ def parse_color(
     raise NotImplementedError
 
 
+def _opaque_key(stack: list[Layer], name: str, index: int | None = None) -> BaseKey:
+    """First non-transparent key at `name[index]`, walking `stack` top-down."""
+    key = None
+    for layer in stack:
+        keys = getattr(layer, name)
+        if index is None:
+            key = keys
+        elif index < len(keys):
+            key = keys[index]
+        else:
+            continue
+        if key.kind != TRANSPARENT:
+            break
+    return key  # type: ignore
+
+
 class Layer:
     name: str
     color: tuple[int, int, int]
@@ -38,6 +79,47 @@ class Layer:
     secondary_encoder_cw: BaseKey
     secondary_encoder_ccw: BaseKey
 
+    ENCODERS = (
+        "primary_encoder_cw",
+        "primary_encoder_ccw",
+        "secondary_encoder_cw",
+        "secondary_encoder_ccw",
+    )
+
+    @property
+    def transparent(self) -> bool:
+        for keys in (self.primary_keys, self.secondary_keys):
+            for key in keys:
+                if key.kind == TRANSPARENT:
+                    return True
+        for name in self.ENCODERS:
+            if getattr(self, name).kind == TRANSPARENT:
+                return True
+        return False
+
+    @classmethod
+    def resolve(cls, stack: list[Layer]) -> Layer:
+        """
+        Merge the active layers, top first: transparent keys take the key of
+        the next layer down.
+        """
+        top = stack[0]
+        if len(stack) == 1 or not top.transparent:
+            return top
+        i = cls()
+        i.name = top.name
+        i.color = top.color
+        i.primary_keys = tuple(
+            _opaque_key(stack, "primary_keys", n) for n in range(len(top.primary_keys))
+        )
+        i.secondary_keys = tuple(
+            _opaque_key(stack, "secondary_keys", n)
+            for n in range(len(top.secondary_keys))
+        )
+        for name in cls.ENCODERS:
+            setattr(i, name, _opaque_key(stack, name))
+        return i
+
     @classmethod
     def from_dict(cls, data: dict) -> Layer:
         is_left_side = Params().IS_LEFT_SIDE
@@ -74,41 +156,714 @@ class Layer:
         return i
 
 
+class KeyTable:
+    """
+    Compiled keys: a type tag and a keycode per position, dispatched through
+    the `keys.PRESS` / `keys.RELEASE` tables instead of per-key objects.
+    """
+
+    __slots__ = (
+        "kinds",
+        "codes",
+    )
+
+    def __init__(self, kinds: bytearray, codes: array) -> None:
+        self.kinds = kinds
+        self.codes = codes
+
+    @classmethod
+    def from_names(cls, names: list[str | None]) -> KeyTable:
+        return cls(*encode_keys(names))
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @property
+    def transparent(self) -> bool:
+        return TRANSPARENT in self.kinds
+
+    @classmethod
+    def resolve(cls, stack: list[KeyTable]) -> KeyTable:
+        """Merge tables top first, see `Layer.resolve`."""
+        top = stack[0]
+        if len(stack) == 1 or not top.transparent:
+            return top
+        kinds = bytearray(top.kinds)
+        codes = array("H", top.codes)
+        for i in range(len(kinds)):
+            for table in stack[1:]:
+                if kinds[i] != TRANSPARENT:
+                    break
+                if i < len(table):
+                    kinds[i] = table.kinds[i]
+                    codes[i] = table.codes[i]
+        return cls(kinds, codes)
+
+    def process(self, index: int, pressed: bool) -> None:
+        dispatch(self.kinds[index], self.codes[index], pressed)
+
+    def tap(self, index: int) -> None:
+        kind = self.kinds[index]
+        code = self.codes[index]
+        dispatch(kind, code, True)
+        dispatch(kind, code, False)
+
+    def is_extras(self, index: int) -> bool:
+        return self.kinds[index] == LAYER and isinstance(
+            commands[self.codes[index]], OnPressExtrasCommand
+        )
+
+
+PRIMARY_ENCODER_CW = 0
+PRIMARY_ENCODER_CCW = 1
+SECONDARY_ENCODER_CW = 2
+SECONDARY_ENCODER_CCW = 3
+
+
+class CompiledLayer:
+    """
+    Array-backed alternative to `Layer`, the encoders share a single table
+    indexed by the `*_ENCODER_*` constants.
+    """
+
+    __slots__ = (
+        "name",
+        "color",
+        "primary_keys",
+        "secondary_keys",
+        "encoders",
+    )
+
+    name: str
+    color: tuple[int, int, int]
+    primary_keys: KeyTable
+    secondary_keys: KeyTable
+    encoders: KeyTable
+
+    @property
+    def transparent(self) -> bool:
+        return (
+            self.primary_keys.transparent
+            or self.secondary_keys.transparent
+            or self.encoders.transparent
+        )
+
+    @classmethod
+    def resolve(cls, stack: list[CompiledLayer]) -> CompiledLayer:
+        top = stack[0]
+        if len(stack) == 1 or not top.transparent:
+            return top
+        i = cls()
+        i.name = top.name
+        i.color = top.color
+        i.primary_keys = KeyTable.resolve([layer.primary_keys for layer in stack])
+        i.secondary_keys = KeyTable.resolve([layer.secondary_keys for layer in stack])
+        i.encoders = KeyTable.resolve([layer.encoders for layer in stack])
+        return i
+
+    @classmethod
+    def from_dict(cls, data: dict) -> CompiledLayer:
+        i = cls()
+        i.name = data.get("name", "no name")
+        i.color = parse_color(data.get("color", "#000000"))
+        primary, secondary, encoders = side_key_names(data, Params().IS_LEFT_SIDE)
+        i.primary_keys = KeyTable.from_names(primary)
+        i.secondary_keys = KeyTable.from_names(secondary)
+        i.encoders = KeyTable.from_names(encoders)
+        return i
+
+
+def side_key_names(
+    data: dict,
+    is_left_side: bool,
+) -> tuple[list[str | None], list[str | None], list[str | None]]:
+    """
+    Key names of a layer as seen by one half: primary keys, secondary keys
+    (both in matrix order) and the `*_ENCODER_*` table.
+    """
+    primary = [
+        k
+        for row in data.get(
+            "primary_keys" if is_left_side else "secondary_keys",
+            (("",),),
+        )
+        for k in (reversed(row) if is_left_side else row)
+    ]
+    secondary = [
+        k
+        for row in data.get(
+            "secondary_keys" if is_left_side else "primary_keys",
+            (("",),),
+        )
+        for k in (row if is_left_side else reversed(row))
+    ]
+    cw, ccw = data.get("primary_encoder", ("", ""))
+    return primary, secondary, [cw, ccw, cw, ccw]
+
+
+# key positions are `side | key_number`, the side being the board's own
+# matrix or the peripheral half
+PRIMARY_SIDE = 0
+SECONDARY_SIDE = 0x100
+
+
+def combo_positions(
+    names: list[str],
+    layer: dict,
+    is_left_side: bool,
+) -> tuple[int, ...] | None:
+    """Positions of key names of the base layer, None if one is missing."""
+    primary, secondary, _ = side_key_names(layer, is_left_side)
+    positions = []
+    for name in names:
+        if name in primary:
+            positions.append(PRIMARY_SIDE | primary.index(name))
+        elif name in secondary:
+            positions.append(SECONDARY_SIDE | secondary.index(name))
+        else:
+            return None
+    return tuple(positions)
+
+
+def parse_combos(
+    data: list[dict],
+    layers: list[dict],
+    is_left_side: bool,
+) -> list[tuple[tuple[int, ...], int, int]]:
+    """
+    Read `{"keys": ["J", "K"], "key": "ESCAPE"}` entries into
+    `(positions, kind, code)`, keys are named after the base layer.
+    """
+    combos = []
+    for combo in data:
+        positions = combo_positions(combo["keys"], layers[0], is_left_side)
+        if positions is None:
+            logger.warning(f"Combo keys not on the base layer: {combo['keys']}")
+            continue
+        kind, code = encode(combo["key"])
+        combos.append((positions, kind, code))
+    return combos
+
+
+def set_macros(steps: list[bytes]) -> None:
+    """Macros of the config, `MACRO_<n>` plays `steps[n]`."""
+    macros[:] = steps
+
+
+def keymap_file(is_left_side: bool) -> str:
+    return "keymap-left.bin" if is_left_side else "keymap-right.bin"
+
+
+def config_file(is_left_side: bool) -> str:
+    """The compiled keymap of the side when there is one, else config.json."""
+    path = keymap_file(is_left_side)
+    try:
+        os.stat(path)
+    except OSError:
+        return "config.json"
+    return path
+
+
+def layer_signature(data: dict) -> int:
+    return hash(json.dumps(data))
+
+
+class KeymapReader:
+    """Builds the layers of a compiled keymap from their bytes, see `load_keymap`."""
+
+    __slots__ = ("view", "command_codes")
+
+    def __init__(self, view: memoryview, command_codes: list[int]) -> None:
+        self.view = view
+        self.command_codes = command_codes
+
+    def signature(self, section: tuple[int, int]) -> int:
+        start, end = section
+        return hash((bytes(self.view[start:end]), tuple(self.command_codes)))
+
+    def layer(self, section: tuple[int, int]) -> CompiledLayer:
+        view = self.view
+        offset = section[0]
+        layer = CompiledLayer()
+        size = view[offset]
+        layer.name = bytes(view[offset + 1 : offset + 1 + size]).decode()
+        offset += 1 + size
+        layer.color = (view[offset], view[offset + 1], view[offset + 2])
+        primary = view[offset + 3]
+        secondary = view[offset + 4]
+        offset += 5
+
+        total = primary + secondary + 4
+        kinds = view[offset : offset + total]
+        codes = array("H", bytes(view[offset + total : offset + 3 * total]))
+
+        tables = []
+        start = 0
+        for size in (primary, secondary, 4):
+            table = KeyTable(
+                bytearray(kinds[start : start + size]),
+                codes[start : start + size],
+            )
+            for i in range(size):
+                if table.kinds[i] == LAYER or table.kinds[i] == TAP_HOLD:
+                    table.codes[i] = self.command_codes[table.codes[i]]
+            tables.append(table)
+            start += size
+        layer.primary_keys, layer.secondary_keys, layer.encoders = tables
+        return layer
+
+
+def load_keymap(
+    data: bytes,
+) -> tuple[
+    LazyLayers,
+    list[tuple[tuple[int, ...], int, int]],
+    list[bytes],
+]:
+    """
+    Read a keymap compiled on the host. Little-endian layout:
+
+        magic, command count, commands (length-prefixed names)
+        layer count, then per layer:
+            name (length-prefixed), color (3 bytes),
+            primary key count, secondary key count,
+            kinds (1 byte per key), codes (2 bytes per key)
+        combo count (optional), then per combo:
+            position count, positions (2 bytes each), kind, code (2 bytes)
+        macro count (optional), then per macro:
+            size (2 bytes), steps (see `macros.compile_macro`)
+
+    Every layer stores its primary keys, secondary keys and 4 encoder keys
+    in a single table. LAYER and TAP_HOLD codes index the command list of
+    the file, which holds layer commands and "tap|hold" names. Layers are
+    only located here and built from `data` when first used.
+    """
+    if data[: len(KEYMAP_MAGIC)] != KEYMAP_MAGIC:
+        raise ValueError("Invalid keymap")
+    view = memoryview(data)
+    offset = len(KEYMAP_MAGIC)
+
+    command_codes = []
+    count = view[offset]
+    offset += 1
+    for _ in range(count):
+        size = view[offset]
+        name = bytes(view[offset + 1 : offset + 1 + size]).decode()
+        command_codes.append(encode(name)[1])
+        offset += 1 + size
+
+    sections = []
+    count = view[offset]
+    offset += 1
+    for _ in range(count):
+        start = offset
+        offset += 1 + view[offset]
+        total = view[offset + 3] + view[offset + 4] + 4
+        offset += 5 + 3 * total
+        if offset > len(view):
+            raise ValueError("Truncated keymap")
+        sections.append((start, offset))
+    reader = KeymapReader(view, command_codes)
+    layers = LazyLayers(sections, reader.layer, reader.signature)
+
+    combos = []
+    count = view[offset] if offset < len(view) else 0
+    offset += 1
+    for _ in range(count):
+        size = view[offset]
+        positions = tuple(array("H", bytes(view[offset + 1 : offset + 1 + 2 * size])))
+        offset += 1 + 2 * size
+        kind = view[offset]
+        code = view[offset + 1] | view[offset + 2] << 8
+        offset += 3
+        if kind == LAYER or kind == TAP_HOLD:
+            code = command_codes[code]
+        combos.append((positions, kind, code))
+
+    steps = []
+    count = view[offset] if offset < len(view) else 0
+    offset += 1
+    for _ in range(count):
+        size = view[offset] | view[offset + 1] << 8
+        steps.append(bytes(view[offset + 2 : offset + 2 + size]))
+        offset += 2 + size
+    return layers, combos, steps
+
+
+# layer masks stay small ints on CircuitPython
+MAX_LAYERS = 16
+
+
+def highest_layer(mask: int) -> int:
+    """Index of the highest set bit of `mask`, 0 for an empty mask."""
+    index = 0
+    for shift in (8, 4, 2, 1):
+        if mask >> shift:
+            mask >>= shift
+            index += shift
+    return index
+
+
+def _built(layer: Layer | CompiledLayer) -> Layer | CompiledLayer:
+    return layer
+
+
+class LazyLayers:
+    """
+    The layers of a config, each built by `build` from its source the first
+    time it is used: a layer dict of config.json or the bytes of a compiled
+    layer, so boot time and RAM do not grow with layers never entered.
+
+    With `max_resident`, the least recently used layers are dropped again
+    once more are built, except those in the `pinned` mask (the active
+    ones). `on_evict` is told so that merged layers using them go as well.
+    """
+
+    __slots__ = (
+        "sources",
+        "build",
+        "sign",
+        "signed",
+        "resident",
+        "used",
+        "max_resident",
+        "pinned",
+        "on_evict",
+    )
+
+    def __init__(
+        self,
+        sources: list,
+        build: Callable[[Any], Layer | CompiledLayer],
+        sign: Callable[[Any], int] | None = None,
+        max_resident: int = 0,
+    ) -> None:
+        if len(sources) > MAX_LAYERS:
+            logger.warning(f"Only the first {MAX_LAYERS} layers are used")
+            sources = sources[:MAX_LAYERS]
+        self.sources = sources
+        self.build = build
+        self.sign = sign
+        self.signed: list[int] | None = None
+        self.resident: list[Layer | CompiledLayer | None] = [None] * len(sources)
+        # indexes of the resident layers, least recently used first
+        self.used: list[int] = []
+        self.max_resident = max_resident
+        self.pinned = 0
+        self.on_evict: Callable[[int], None] | None = None
+
+    @classmethod
+    def of(cls, layers: tuple[Layer, ...] | tuple[CompiledLayer, ...]) -> LazyLayers:
+        """Layers built already."""
+        return cls(list(layers), _built)
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def __iter__(self) -> Iterator[Layer | CompiledLayer]:
+        for i in range(len(self.sources)):
+            yield self[i]
+
+    def __getitem__(self, index: int) -> Layer | CompiledLayer:
+        layer = self.resident[index]
+        if layer is None:
+            layer = self.build(self.sources[index])
+            self.resident[index] = layer
+            self.used.append(index)
+            if self.max_resident:
+                self._evict()
+        elif self.max_resident and self.used[-1] != index:
+            self.used.remove(index)
+            self.used.append(index)
+        return layer
+
+    def signatures(self) -> list[int]:
+        """Signatures of the sources, computed the first time a reload asks."""
+        if self.signed is None:
+            sign = self.sign
+            self.signed = [] if sign is None else [sign(s) for s in self.sources]
+        return self.signed
+
+    def keep(self, index: int, layers: LazyLayers) -> None:
+        """Reuse layer `index` of `layers` if it was built."""
+        layer = layers.resident[index]
+        if layer is not None and self.resident[index] is None:
+            self.resident[index] = layer
+            self.used.append(index)
+
+    def _evict(self) -> None:
+        i = 0
+        # the layer just built stays
+        while len(self.used) > self.max_resident and i < len(self.used) - 1:
+            index = self.used[i]
+            if self.pinned & (1 << index):
+                i += 1
+                continue
+            self.used.pop(i)
+            self.resident[index] = None
+            if self.on_evict is not None:
+                self.on_evict(index)
+
+
 class Config:
+    """
+    Keymap and layer state.
+
+    Active layers are kept in a bitmask, like QMK: the default layer is
+    always on, momentary and toggled layers live in `layer_state` and a
+    one-shot layer in `oneshot_state` until the next key is released. The
+    highest active layer wins, transparent keys fall through to the layers
+    below.
+    """
+
     __slots__ = (
         "layers",
         "is_left_side",
-        "layer_index",
+        "default_layer",
+        "layer_state",
+        "oneshot_state",
+        "oneshot_used",
+        "layer_mask",
         "extras",
+        "compiled",
+        "layer",
+        "resolved_layers",
+        "combos",
+        "max_resident",
     )
 
-    layers: tuple[Layer, ...]
+    layers: LazyLayers
     is_left_side: bool
-    layer_index: int
+    default_layer: int
+    layer_state: int
+    oneshot_state: int
+    oneshot_used: bool
+    # default, momentary, toggled and one-shot layers combined
+    layer_mask: int
     extras: bool
+    compiled: bool
+    # active layers merged top-down, recomputed when the layer mask changes
+    layer: Layer | CompiledLayer
+    resolved_layers: dict[int, Layer | CompiledLayer]
+    combos: list[tuple[tuple[int, ...], int, int]]
+    # layers kept built at most, 0 for all, see `LazyLayers`
+    max_resident: int
 
-    def __init__(self, layers: list[dict] | None = None) -> None:
+    def __init__(
+        self,
+        layers: list[dict] | None = None,
+        compiled: bool = False,
+        combos: list[dict] | None = None,
+        macros: list[str | list[str]] | None = None,
+    ) -> None:
         init(self)
-        self.layer_index = 0
         self.extras = False
-        self.layers = tuple(Layer.from_dict(layer) for layer in layers or tuple())
+        self.compiled = compiled
+        self.max_resident = Params().MAX_RESIDENT_LAYERS
+        free = mem_free()
+        self.set_layers(self._lazy_layers(layers or []))
+        if self.layers:
+            logger.debug(f"Config uses {free - mem_free()} bytes, {key_pool.report()}")
 
         is_left_side = Params().IS_LEFT_SIDE
         logger.debug(f"Left side: {is_left_side}")
         self.is_left_side = is_left_side
+        self.combos = parse_combos(combos, layers, is_left_side) if combos else []
+        if macros:
+            set_macros([compile_macro(macro) for macro in macros])
 
     @property
-    def layer(self) -> Layer:
-        return self.layers[self.layer_index]
+    def layer_index(self) -> int:
+        """Highest active layer."""
+        return highest_layer(self.layer_mask)
+
+    @layer_index.setter
+    def layer_index(self, value: int) -> None:
+        self.layer_move(value)
+
+    def _lazy_layers(self, layers: list[dict]) -> LazyLayers:
+        layer_class = CompiledLayer if self.compiled else Layer
+        return LazyLayers(
+            layers, layer_class.from_dict, layer_signature, self.max_resident
+        )
+
+    def set_layers(
+        self,
+        layers: LazyLayers | tuple[Layer, ...] | tuple[CompiledLayer, ...],
+    ) -> None:
+        if not isinstance(layers, LazyLayers):
+            layers = LazyLayers.of(layers)
+        layers.on_evict = self._forget_layer
+        self.layers = layers
+        self.resolved_layers = {}
+        self.default_layer = 0
+        self.layer_state = 0
+        self.oneshot_state = 0
+        self.oneshot_used = False
+        self.layer_mask = -1
+        self.update_layer()
+
+    def is_layer_on(self, index: int) -> bool:
+        return bool(self.layer_mask & (1 << index))
+
+    def layer_on(self, index: int) -> None:
+        self.layer_state |= 1 << index
+        self.update_layer()
+
+    def layer_off(self, index: int) -> None:
+        self.layer_state &= ~(1 << index)
+        self.update_layer()
+
+    def layer_invert(self, index: int) -> None:
+        self.layer_state ^= 1 << index
+        self.update_layer()
+
+    def layer_move(self, index: int) -> None:
+        """Turn `index` on and every other non-default layer off."""
+        self.layer_state = 1 << index
+        self.oneshot_state = 0
+        self.oneshot_used = False
+        self.update_layer()
+
+    def set_default_layer(self, index: int) -> None:
+        self.default_layer = index
+        self.update_layer()
+
+    def oneshot_on(self, index: int) -> None:
+        """Activate `index` until the next key is released."""
+        self.oneshot_state = 1 << index
+        self.oneshot_used = False
+        self.update_layer()
+
+    def oneshot_off(self) -> None:
+        self.oneshot_state = 0
+        self.oneshot_used = False
+        self.update_layer()
+
+    def update_layer(self) -> None:
+        mask = self.layer_state | self.oneshot_state | (1 << self.default_layer)
+        mask &= (1 << len(self.layers)) - 1
+        if mask == self.layer_mask:
+            return
+        self.layer_mask = mask
+        self.layers.pinned = mask
+        self.layer = self.resolve_layer(mask)
+
+    def layer_stack(self, mask: int) -> list[int]:
+        """Indexes of the layers set in `mask`, top first."""
+        stack = []
+        while mask:
+            index = highest_layer(mask)
+            stack.append(index)
+            mask &= ~(1 << index)
+        return stack
+
+    def resolve_layer(self, mask: int) -> Layer | CompiledLayer:
+        if not mask:
+            return None  # type: ignore
+        layer = self.resolved_layers.get(mask)
+        if layer is None:
+            layer_class = CompiledLayer if self.compiled else Layer
+            layer = layer_class.resolve(  # type: ignore
+                [self.layers[i] for i in self.layer_stack(mask)]
+            )
+            self.resolved_layers[mask] = layer
+        return layer
+
+    def _forget_layer(self, index: int) -> None:
+        for mask in [mask for mask in self.resolved_layers if mask & (1 << index)]:
+            del self.resolved_layers[mask]
+
+    def reload(
+        self,
+        layers: list[dict],
+        combos: list[dict] | None = None,
+        macros: list[str | list[str]] | None = None,
+    ) -> int:
+        """
+        Swap in the layers of a new config. Unchanged layers are kept, the
+        changed ones are built right away so that errors show up before the
+        swap. The active layers stay on, return the mask of the changed
+        layers.
+        """
+        new_layers = self._lazy_layers(layers)
+        changed = self._compare_layers(new_layers)
+        # everything is parsed before the swap, an error keeps the old config
+        new_combos = parse_combos(combos, layers, self.is_left_side) if combos else []
+        steps = [compile_macro(macro) for macro in macros or ()]
+        self._swap_layers(new_layers, changed)
+        self.combos = new_combos
+        set_macros(steps)
+        return changed
+
+    def reload_keymap(self, data: bytes) -> int:
+        """`reload` for a keymap compiled on the host."""
+        new_layers, combos, steps = load_keymap(data)
+        new_layers.max_resident = self.max_resident
+        changed = self._compare_layers(new_layers)
+        self._swap_layers(new_layers, changed)
+        self.combos = combos
+        set_macros(steps)
+        return changed
+
+    def _compare_layers(self, layers: LazyLayers) -> int:
+        """Mask of the layers that differ, builds them."""
+        signatures = layers.signatures()
+        current = self.layers.signatures()
+        # building changed layers must not evict the active ones being kept
+        layers.pinned = self.layer_mask & ((1 << len(layers)) - 1)
+        changed = 0
+        for i in range(max(len(layers), len(self.layers))):
+            if i < len(layers) and i < len(current) and signatures[i] == current[i]:
+                layers.keep(i, self.layers)
+            else:
+                changed |= 1 << i
+                if i < len(layers):
+                    # built now, a broken layer fails before the swap
+                    layers[i]
+        return changed
+
+    def _swap_layers(self, layers: LazyLayers, changed: int) -> None:
+        layers.on_evict = self._forget_layer
+        self.layers = layers
+
+        # merged layers stay valid as long as none of their layers changed
+        for mask in [mask for mask in self.resolved_layers if mask & changed]:
+            del self.resolved_layers[mask]
+        if self.default_layer >= len(layers):
+            self.default_layer = 0
+        self.oneshot_state = 0
+        self.oneshot_used = False
+        self.layer_mask = -1
+        self.update_layer()
+
+    @classmethod
+    def from_keymap(cls, data: bytes) -> Config:
+        config = cls(compiled=True)
+        layers, config.combos, steps = load_keymap(data)
+        layers.max_resident = config.max_resident
+        config.set_layers(layers)
+        set_macros(steps)
+        return config
 
     @classmethod
     def read(cls) -> Config:
         global _config
         if _config is None:
-            with open("config.json") as file:
+            path = config_file(Params().IS_LEFT_SIDE)
+            if path != "config.json":
+                logger.info(f"Loading compiled keymap {path}")
+                with open(path, "rb") as file:
+                    _config = cls.from_keymap(file.read())
+                return _config
+
+            with open(path) as file:
                 config: dict = json.load(file)
             _config = cls(
                 layers=config.get("layers", []),
+                compiled=Params().COMPILED_KEYMAP,
+                combos=config.get("combos", []),
+                macros=config.get("macros", []),
             )
         return _config
 
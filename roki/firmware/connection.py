@@ -0,0 +1,110 @@
+import _bleio
+from adafruit_ticks import ticks_diff
+
+from roki.firmware import logging
+
+try:
+    from typing import TYPE_CHECKING
+
+    if TYPE_CHECKING:
+        from adafruit_ble import BLEConnection
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionTuner:
+    """
+    Switches the link to the secondary half between `fast_interval` ms while
+    typing and `idle_interval` ms once nothing happened for `idle_after` ms.
+
+    The fast interval keeps secondary keys quick, the idle one wakes the radio
+    of both halves less often. The time spent at each interval gives the
+    connection events, the main draw of an idle link, see `connection_events`.
+    Peripheral latency is not negotiated, `BLEConnection` only exposes the
+    interval.
+    """
+
+    __slots__ = (
+        "fast_interval",
+        "idle_interval",
+        "idle_after",
+        "connection",
+        "interval",
+        "last_activity",
+        "since",
+        "fast_ms",
+        "idle_ms",
+        "switches",
+    )
+
+    def __init__(
+        self,
+        fast_interval: float = 7.5,
+        idle_interval: float = 30.0,
+        idle_after: int = 1000,
+        now: int = 0,
+    ) -> None:
+        self.fast_interval = fast_interval
+        self.idle_interval = idle_interval
+        self.idle_after = idle_after
+        self.connection: "BLEConnection | None" = None
+        self.interval = fast_interval
+        self.last_activity = now
+        self.since = now
+        self.fast_ms = 0
+        self.idle_ms = 0
+        self.switches = 0
+
+    def attach(self, connection: "BLEConnection", now: int) -> None:
+        """Track a new connection, set up at the fast interval."""
+        self.connection = connection
+        self._account(now)
+        self.interval = self.fast_interval
+        self.last_activity = now
+
+    def touch(self, now: int) -> None:
+        self.last_activity = now
+        if self.interval != self.fast_interval:
+            self._switch(self.fast_interval, now)
+
+    def update(self, now: int) -> None:
+        if (
+            self.interval == self.fast_interval
+            and self.idle_interval != self.fast_interval
+            and ticks_diff(now, self.last_activity) >= self.idle_after
+        ):
+            self._switch(self.idle_interval, now)
+
+    @property
+    def connection_events(self) -> int:
+        """Connection events so far, as if each interval was granted."""
+        return int(
+            self.fast_ms / self.fast_interval + self.idle_ms / self.idle_interval
+        )
+
+    def _account(self, now: int) -> None:
+        elapsed = ticks_diff(now, self.since)
+        if self.interval == self.fast_interval:
+            self.fast_ms += elapsed
+        else:
+            self.idle_ms += elapsed
+        self.since = now
+
+    def _switch(self, interval: float, now: int) -> None:
+        self._account(now)
+        self.interval = interval
+        self.switches += 1
+        if self.connection is None or not self.connection.connected:
+            return
+        try:
+            self.connection.connection_interval = interval
+        except _bleio.BluetoothError as e:
+            logger.warning(f"Connection interval not changed: {e}")
+            return
+        logger.debug(
+            f"Connection interval {interval} ms "
+            f"({self.fast_ms} ms fast, {self.idle_ms} ms idle, "
+            f"{self.connection_events} events)"
+        )
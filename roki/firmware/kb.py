@@ -5,27 +5,75 @@ from adafruit_ble import BLEConnection, BLERadio
 from adafruit_ble.advertising import Advertisement
 from adafruit_ble.advertising.standard import ProvideServicesAdvertisement
 from adafruit_ble.services.standard.device_info import DeviceInfoService
+from adafruit_ticks import ticks_diff
 from analogio import AnalogIn
 from digitalio import DigitalInOut, Direction, Pull
-from keypad import KeyMatrix
+from keypad import Event, KeyMatrix
 from pwmio import PWMOut
 
-from roki.firmware import logging
+from roki.firmware import logging, probes
+from roki.firmware.acceleration import Acceleration
 from roki.firmware.buzzer import Buzzer
 from roki.firmware.calibration import BaseCalibration, Calibration
-from roki.firmware.config import Config
-from roki.firmware.keys import BaseKey, LayerHandlerKey
+from roki.firmware.combos import Combos
+from roki.firmware.config import (
+    PRIMARY_ENCODER_CCW,
+    PRIMARY_ENCODER_CW,
+    SECONDARY_ENCODER_CCW,
+    SECONDARY_ENCODER_CW,
+    SECONDARY_SIDE,
+    Config,
+    KeyTable,
+    config_file,
+)
+from roki.firmware.connection import ConnectionTuner
+from roki.firmware.keys import (
+    TAP_HOLD,
+    BaseKey,
+    LayerHandlerKey,
+    batch_reports,
+    dispatch,
+    flush_reports,
+    move_mouse,
+    play_macros,
+    release_all,
+    set_macro_rate,
+    set_mouse_keys,
+)
 from roki.firmware.layer_handler import OnPressExtrasCommand
-from roki.firmware.messages import ENCODER, KEY, THUMB_STICK
-from roki.firmware.service import RokiService
+from roki.firmware.memory import AllocationMonitor, IdleCollector
+from roki.firmware.messages import ENCODER, KEY, MATRIX, THUMB_STICK
+from roki.firmware.params import Params
+from roki.firmware.reload import ConfigReloader
+from roki.firmware.scheduler import Clock, Scheduler, StepClock, TimerWheel
+from roki.firmware.service import (
+    EVENT_SIZE,
+    HEADER_SIZE,
+    MAX_PACKET_SIZE,
+    MIN_PACKET_SIZE,
+    PACKET_BUFFER_SIZE,
+    SEQUENCE_MASK,
+    PacketSequence,
+    RokiService,
+    read_sequence,
+    write_sequence,
+)
+from roki.firmware.tap_hold import NO_KEY, TapHold
 from roki.firmware.utils import (
-    Cycle,
     Debouncer,
     Loop,
-    decode_float,
-    encode_float,
+    decode_axis,
+    encode_axis,
 )
 
+try:
+    from typing import TYPE_CHECKING
+
+    if TYPE_CHECKING:
+        from usb_cdc import Serial
+except ImportError:
+    pass
+
 logger = logging.getLogger(__name__)
 
 
@@ -42,16 +90,54 @@ class Roki:
         columns_to_anodes: bool = False,
         interval: float = 0.01,
         max_events: int = 5,
+        max_events_per_tick: int = 5,
         connection_interval: float = 7.5,
         calibration_class: type[BaseCalibration] = Calibration,
         max_iterations_main_loop: int = 0,
         max_iterations_ble: int = 0,
+        key_scan_period: int = 0,
+        ble_period: int = 0,
+        encoder_period: int = 2,
+        thumb_stick_period: int = 10,
+        buzzer_period: int = 5,
+        probes_period: int = 10_000,
+        memory_monitor_iterations: int = 1000,
+        gc_period: int = 10,
+        gc_idle_after: int = 50,
+        gc_min_free: int = 16_384,
+        coalesce_reports: bool = True,
+        tapping_term: int = 200,
+        permissive_hold: bool = True,
+        combo_term: int = 50,
+        macro_period: int = 10,
+        macro_rate: int = 1,
+        mouse_speed: int = 10,
+        mouse_curve: float = 1.0,
+        mouse_key_period: int = 16,
+        mouse_key_speed: int = 1000,
+        mouse_key_scroll_speed: int = 20,
+        mouse_key_ramp_time: int = 500,
+        config_stream: "Serial | None" = None,
+        reload_period: int = 100,
+        config_check_period: int = 1000,
+        snapshot_period: int = 500,
+        thumb_stick_send_period: int = 20,
+        thumb_stick_threshold: int = 2,
+        idle_connection_interval: float = 30.0,
+        connection_idle_after: int = 1000,
     ):
+        # bounded runs (tests) use a deterministic clock that moves one scan
+        # interval per scheduler tick
+        self.clock: Clock = (
+            StepClock(max(int(interval * 1000), 1)) if max_iterations_ble else Clock()
+        )
         self.buzzer = Buzzer(
-            PWMOut(getattr(board, buzzer_pin), variable_frequency=True)
+            PWMOut(getattr(board, buzzer_pin), variable_frequency=True), self.clock
         )
         self.row_count = len(row_pins)
         self.col_count = len(column_pins)
+        # keys held on the secondary half, one bit per key number
+        self.matrix = bytearray((self.row_count * self.col_count + 7) // 8)
         a, b = encoder_pins
         self.encoder = rotaryio.IncrementalEncoder(
             getattr(board, a), getattr(board, b), encoder_divisor
@@ -75,6 +161,8 @@ class Roki:
 
         self.encoder_position = Debouncer(self.encoder.position)
         self.connection_interval = connection_interval
+        self.idle_connection_interval = idle_connection_interval
+        self.connection_idle_after = connection_idle_after
         self.key_matrix = KeyMatrix(
             row_pins=tuple(getattr(board, pin) for pin in row_pins),
             column_pins=tuple(getattr(board, pin) for pin in column_pins),
@@ -82,18 +170,65 @@ class Roki:
             interval=interval,
             max_events=max_events,
         )
+        self.max_events_per_tick = max_events_per_tick
+        self.key_event = Event()
+        self.key_queue_depth = 0
+        self.max_key_queue_depth = 0
         self.config: Config = config
         self.ble = BLERadio()
-        self.mouse_speed = 10
+        self.acceleration = Acceleration(mouse_speed, mouse_curve)
+        self.secondary_acceleration = Acceleration(table=self.acceleration.table)
         self.max_iterations_main_loop = max_iterations_main_loop
         self.max_iterations_ble = max_iterations_ble
 
+        self.key_scan_period = key_scan_period
+        self.ble_period = ble_period
+        self.encoder_period = encoder_period
+        self.thumb_stick_period = thumb_stick_period
+        self.buzzer_period = buzzer_period
+        self.probes_period = probes_period
+        self.coalesce_reports = coalesce_reports
+        self.gc_period = gc_period
+        self.snapshot_period = snapshot_period
+        self.thumb_stick_send_period = thumb_stick_send_period
+        self.thumb_stick_threshold = thumb_stick_threshold
+        # last thumb stick position sent by the secondary
+        self.secondary_x = 0
+        self.secondary_y = 0
+
+        self.scheduler = Scheduler(self.clock, max_iterations_ble)
+        self.memory_monitor = AllocationMonitor(memory_monitor_iterations)
+        self.idle_collector = IdleCollector(gc_idle_after, gc_min_free)
+        self.timers = TimerWheel(self.clock.now())
+        self.tapping_term = tapping_term
+        self.permissive_hold = permissive_hold
+        self.combo_term = combo_term
+        self.macro_period = macro_period
+        self.macro_rate = macro_rate
+        self.mouse_key_period = mouse_key_period
+        self.mouse_key_speed = mouse_key_speed
+        self.mouse_key_scroll_speed = mouse_key_scroll_speed
+        self.mouse_key_ramp_time = mouse_key_ramp_time
+        self.reload_period = reload_period
+        self.config_reloader = ConfigReloader(
+            config,
+            lambda: config_file(config.is_left_side),
+            config_stream,
+            self.reset_keys,
+            config_check_period,
+            self.clock.now(),
+        )
+
     def run(self):
         logger.info("Preparing...")
 
         self.start_calibration()
 
         logger.info("Running...")
+        self.setup_probes()
+        self.setup_memory_monitor()
+        self.setup_idle_collector()
+        self.setup_config_reloader()
         self.notify_main_loop_start()
         self.run_main_loop()
 
@@ -108,7 +243,7 @@ class Roki:
         )
 
     def notify_error(self):
-        self.buzzer.play_notes(
+        self.buzzer.queue_notes(
             (
                 ("C1", 2),
                 ("", 1),
@@ -119,8 +254,69 @@ class Roki:
 
     def run_main_loop(self): ...
 
+    def setup_tasks(self): ...
+
+    def setup_probes(self):
+        if probes.installed():
+            self.scheduler.add("probes", probes.dump, self.probes_period, priority=9)
+
+    def setup_memory_monitor(self):
+        if Params().DEBUG:
+            self.scheduler.add("memory", self.memory_monitor.update, 0, priority=8)
+
+    def setup_idle_collector(self):
+        self.scheduler.add("gc", self.collect_when_idle, self.gc_period, priority=10)
+
+    def collect_when_idle(self):
+        self.idle_collector.update(self.clock.now())
+
+    def setup_config_reloader(self):
+        self.scheduler.add("reload", self.reload_config, self.reload_period, priority=9)
+
+    def reload_config(self):
+        self.config_reloader.update(self.clock.now())
+
+    def reset_keys(self):
+        """Release what was pressed with the layers before a config reload."""
+        release_all()
+
+    def set_matrix_key(self, key_number: int, pressed: bool) -> None:
+        index = key_number >> 3
+        if index >= len(self.matrix):
+            return
+        if pressed:
+            self.matrix[index] |= 1 << (key_number & 7)
+        else:
+            self.matrix[index] &= ~(1 << (key_number & 7))
+
+    def mark_activity(self):
+        self.idle_collector.touch(self.clock.now())
+
+    def is_connected(self) -> bool:
+        return self.ble.connected
+
+    def is_disconnected(self) -> bool:
+        return not self.ble.connected
+
+    def update_key_queue_depth(self):
+        self.key_queue_depth = len(self.key_matrix.events)
+        if self.key_queue_depth > self.max_key_queue_depth:
+            self.max_key_queue_depth = self.key_queue_depth
+            logger.debug(f"Max key queue depth: {self.max_key_queue_depth}")
+
+    def next_key_event(self) -> bool:
+        """Read the next matrix event into the reused `key_event`."""
+        if self.key_matrix.events.get_into(self.key_event):
+            self.mark_activity()
+            return True
+        return False
+
     def start_calibration(self):
         self.calibration.start()
+        try:
+            self.calibration.read()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Thumb stick not calibrated: {e}")
 
     def disconnect(self):
         if self.ble.connected:
@@ -131,6 +327,57 @@ class Roki:
 
 
 class Primary(Roki):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tap_hold = TapHold(
+            self.clock,
+            self.timers,
+            self.tap_hold_at,
+            self._process_position,
+            self.tapping_term,
+            self.permissive_hold,
+            send=self._dispatch,
+        )
+        self.combos = Combos(
+            self.clock,
+            self.timers,
+            self.config.combos,
+            self._handle_tap_hold,
+            self.combo_term,
+            send=self._dispatch,
+        )
+        # the layer table each held key was pressed on, primary then secondary
+        self.key_count = self.row_count * self.col_count
+        self.pressed_on: list[tuple[BaseKey, ...] | KeyTable | None] = [None] * (
+            2 * self.key_count
+        )
+        self.connection_tuner = ConnectionTuner(
+            self.connection_interval,
+            self.idle_connection_interval,
+            self.connection_idle_after,
+            self.clock.now(),
+        )
+
+    def reset_keys(self):
+        self.tap_hold.reset()
+        self.combos.release()
+        # combo positions come from the new config
+        self.combos = Combos(
+            self.clock,
+            self.timers,
+            self.config.combos,
+            self._handle_tap_hold,
+            self.combo_term,
+            send=self._dispatch,
+        )
+        for i in range(len(self.pressed_on)):
+            self.pressed_on[i] = None
+        super().reset_keys()
+
+    def mark_activity(self):
+        super().mark_activity()
+        self.connection_tuner.touch(self.clock.now())
+
     def run_main_loop(self):
         from roki.firmware.keys import hid
 
@@ -153,46 +400,95 @@ class Primary(Roki):
         self.disconnect()
 
         self.peripheral_conn = self.connect_to_peripheral_side(self.connection_interval)
+        # queued notes play from the buzzer task, the loop does not wait
         self._notify_peripheral_connection()
 
         logger.info("Advertising...")
         self.ble.start_advertising(advertisement, scan_response)
-        self.buffer = bytearray(4)
-        self.current_counter = 0
+        self.buffer = bytearray(MAX_PACKET_SIZE)
+        self.sequence = PacketSequence()
+        self.setup_tasks()
+
+        wait_for_connection = Loop(self.max_iterations_ble, self.is_connected)
+        is_disconnected = self.is_disconnected
 
         for _ in Loop(self.max_iterations_main_loop).iterate():
-            for _ in Loop(
-                self.max_iterations_ble,
-                lambda: self.ble.connected,
-            ).iterate():
-                pass
+            for _ in wait_for_connection.iterate():
+                self.buzzer.update()
 
-            for _ in Loop(
-                self.max_iterations_ble,
-                lambda: not self.ble.connected,
-            ).iterate():
-                self.process_primary_keys()
-                if self.config.extras:
-                    self.process_primary_encoder()
-                    self.process_primary_thumb_stick()
-
-                if self.peripheral_conn.connected:
-                    counter, message_id, payload_1, payload_2 = self.get_message()
-
-                    if counter and self.current_counter != counter:
-                        self.current_counter = counter
-                        self._handle_message(message_id, payload_1, payload_2)
-                else:
-                    self.peripheral_conn = self.connect_to_peripheral_side(
-                        self.connection_interval
-                    )
+            self.scheduler.run_until(is_disconnected)
 
             # disconnected
             self.notify_error()
             self.ble.start_advertising(advertisement)
 
+    def setup_tasks(self):
+        self.scheduler.add(
+            "keys", self.process_primary_keys, self.key_scan_period, priority=0
+        )
+        self.scheduler.add(
+            "ble", self.process_peripheral_messages, self.ble_period, priority=1
+        )
+        self.scheduler.add(
+            "encoder", self.process_primary_encoder, self.encoder_period, priority=2
+        )
+        self.scheduler.add(
+            "thumb_stick",
+            self.process_primary_thumb_stick,
+            self.thumb_stick_period,
+            priority=3,
+        )
+        # the secondary only sends changes, its position moves the cursor here
+        self.scheduler.add(
+            "secondary_thumb_stick",
+            self.process_secondary_thumb_stick,
+            self.thumb_stick_period,
+            priority=3,
+        )
+        self.scheduler.add("timers", self.update_timers, 0, priority=1)
+        self.scheduler.add(
+            "connection", self.update_connection, self.ble_period, priority=6
+        )
+        self.scheduler.add("buzzer", self.buzzer.update, self.buzzer_period, priority=4)
+        # long macros are typed a few steps at a time
+        set_macro_rate(self.macro_rate)
+        self.scheduler.add("macros", play_macros, self.macro_period, priority=4)
+        # held mouse movement keys move on the clock, not on key events
+        set_mouse_keys(
+            self.mouse_key_period,
+            self.mouse_key_speed,
+            self.mouse_key_scroll_speed,
+            self.mouse_key_ramp_time,
+        )
+        self.scheduler.add("mouse_keys", move_mouse, self.mouse_key_period, priority=3)
+        # every HID change of the tick goes out in one report per device
+        batch_reports(self.coalesce_reports)
+        self.scheduler.add("reports", flush_reports, 0, priority=5)
+
+    def process_peripheral_messages(self):
+        if not self.peripheral_conn.connected:
+            self.peripheral_conn = self.connect_to_peripheral_side(
+                self.connection_interval
+            )
+            self.sequence.reset()
+            self.secondary_x = self.secondary_y = 0
+            return
+
+        buffer = self.buffer
+        sequence = self.sequence
+        # the packet buffer holds at most that many, drain them all
+        for _ in range(PACKET_BUFFER_SIZE):
+            size = self.get_message()
+            if not size:
+                return
+            if not sequence.accept(read_sequence(buffer)):
+                continue
+            # a packet holds every event the secondary had to send
+            for i in range(HEADER_SIZE, size - EVENT_SIZE + 1, EVENT_SIZE):
+                self._handle_message(buffer[i], buffer[i + 1], buffer[i + 2])
+
     def _notify_peripheral_connection(self):
-        self.buzzer.play_notes(
+        self.buzzer.queue_notes(
             (
                 ("C3", 2),
                 ("", 1),
@@ -201,15 +497,26 @@ class Primary(Roki):
             0.05,
         )
 
-    def get_message(self) -> tuple[int, int, int, int]:
+    def get_message(self) -> int:
         service: RokiService = self.peripheral_conn[RokiService]  # type: ignore
         return service.readinto(self.buffer)
 
     def _handle_message(self, message_id: int, payload_1: int, payload_2: int) -> None:
         if message_id == KEY:
-            key = self.config.layer.secondary_keys[payload_1]
-            self._process_key(key, bool(payload_2))
+            self.mark_activity()
+            self.set_matrix_key(payload_1, bool(payload_2))
+            self._handle_key(SECONDARY_SIDE | payload_1, bool(payload_2))
+        elif message_id == MATRIX:
+            self._handle_matrix(payload_1, payload_2)
         elif message_id == ENCODER:
+            self.mark_activity()
+            if self.config.compiled:
+                encoders = self.config.layer.encoders
+                for _ in range(payload_1):
+                    encoders.tap(SECONDARY_ENCODER_CW)
+                for _ in range(payload_2):
+                    encoders.tap(SECONDARY_ENCODER_CCW)
+                return
             for _ in range(payload_1):
                 self.config.layer.secondary_encoder_cw.press()
                 self.config.layer.secondary_encoder_cw.release()
@@ -217,24 +524,58 @@ class Primary(Roki):
                 self.config.layer.secondary_encoder_ccw.press()
                 self.config.layer.secondary_encoder_ccw.release()
         elif message_id == THUMB_STICK:
-            self._process_thumb_stick(decode_float(payload_1), decode_float(payload_2))
+            # applied every tick by `process_secondary_thumb_stick`
+            self.secondary_x = decode_axis(payload_1)
+            self.secondary_y = decode_axis(payload_2)
+
+    def _handle_matrix(self, index: int, bits: int) -> None:
+        """
+        Apply the keys of a snapshot that differ from the events received,
+        e.g. a release lost with a packet or during a disconnect.
+        """
+        if index >= len(self.matrix):
+            return
+        changed = self.matrix[index] ^ bits
+        if not changed:
+            return
+        self.matrix[index] = bits
+        for bit in range(8):
+            if changed & (1 << bit):
+                key_number = index * 8 + bit
+                logger.warning(f"Secondary key {key_number} out of sync")
+                self._handle_key(SECONDARY_SIDE | key_number, bool(bits & (1 << bit)))
 
     def process_primary_thumb_stick(self):
+        if not self.config.extras:
+            return
         x, y = self.calibration.get_normalized(
             self.thumb_stick_x.value, self.thumb_stick_y.value
         )
-        self._process_thumb_stick(x, y)
+        self._process_thumb_stick(self.acceleration, x, y)
+
+    def process_secondary_thumb_stick(self):
+        acceleration = self.secondary_acceleration
+        if not (self.secondary_x or self.secondary_y):
+            # centred most of the time, drop the fractions as `move` would
+            # without allocating its tuple
+            acceleration.x = acceleration.y = 0
+            return
+        self._process_thumb_stick(acceleration, self.secondary_x, self.secondary_y)
 
-    def _process_thumb_stick(self, x: float, y: float) -> None:
+    def _process_thumb_stick(self, acceleration: Acceleration, x: int, y: int) -> None:
         from .keys import mouse
 
         if mouse is None:  # pragma: no cover
             return
 
-        if x != 0 or y != 0:
-            mouse.move(int(x * self.mouse_speed), int(y * self.mouse_speed))
+        dx, dy = acceleration.move(x, y)
+        if dx or dy:
+            self.mark_activity()
+            mouse.move(dx, dy)
 
     def process_primary_encoder(self):
+        if not self.config.extras:
+            return
         self.encoder_position.update(self.encoder.position)
         if self.encoder_position.rose:
             for _ in range(self.encoder_position.diff):
@@ -244,17 +585,99 @@ class Primary(Roki):
                 self._process_encoder_ccw()
 
     def _process_encoder_cw(self):
+        if self.config.compiled:
+            self.config.layer.encoders.tap(PRIMARY_ENCODER_CW)
+            return
         self.config.layer.primary_encoder_cw.press()
         self.config.layer.primary_encoder_cw.release()
 
     def _process_encoder_ccw(self):
+        if self.config.compiled:
+            self.config.layer.encoders.tap(PRIMARY_ENCODER_CCW)
+            return
         self.config.layer.primary_encoder_ccw.press()
         self.config.layer.primary_encoder_ccw.release()
 
     def process_primary_keys(self):
-        if event := self.key_matrix.events.get():
-            key = self.config.layer.primary_keys[event.key_number]
-            self._process_key(key, event.pressed)
+        self.update_key_queue_depth()
+        event = self.key_event
+        for _ in range(self.max_events_per_tick):
+            if not self.next_key_event():
+                break
+            self._handle_key(event.key_number, event.pressed)
+
+    def update_timers(self):
+        self.timers.update(self.clock.now())
+
+    def update_connection(self):
+        # snapshots keep arriving while idle, only events count as activity
+        self.connection_tuner.update(self.clock.now())
+
+    def _keys_at(self, position: int) -> tuple[BaseKey, ...] | KeyTable:
+        if position & SECONDARY_SIDE:
+            return self.config.layer.secondary_keys
+        return self.config.layer.primary_keys
+
+    def tap_hold_at(self, position: int) -> int:
+        keys = self._keys_at(position)
+        key_number = position & 0xFF
+        if self.config.compiled:
+            if keys.kinds[key_number] == TAP_HOLD:  # type: ignore
+                return keys.codes[key_number]  # type: ignore
+            return NO_KEY
+        key = keys[key_number]  # type: ignore
+        return key.key_code if key.kind == TAP_HOLD else NO_KEY
+
+    def _handle_key(self, position: int, pressed: bool) -> None:
+        if not self.combos.handle(position, pressed):
+            self._handle_tap_hold(position, pressed)
+
+    def _handle_tap_hold(self, position: int, pressed: bool) -> None:
+        if not self.tap_hold.handle(position, pressed):
+            self._process_position(position, pressed)
+
+    def _process_position(self, position: int, pressed: bool) -> None:
+        key_number = position & 0xFF
+        config = self.config
+        keys = self._held_keys_at(position, key_number, pressed)
+        self._use_oneshot(pressed)
+        if config.compiled:
+            keys.process(key_number, pressed)  # type: ignore
+        else:
+            self._process_key(keys[key_number], pressed)  # type: ignore
+        self._end_oneshot(pressed)
+
+    def _held_keys_at(
+        self, position: int, key_number: int, pressed: bool
+    ) -> tuple[BaseKey, ...] | KeyTable:
+        """
+        The layer table to use for a key: a release goes to the table of its
+        press, so a key outlasting a layer (e.g. one-shot) is not stuck.
+        """
+        index = key_number + self.key_count if position & SECONDARY_SIDE else key_number
+        if index >= len(self.pressed_on):
+            return self._keys_at(position)
+        if pressed:
+            keys = self.pressed_on[index] = self._keys_at(position)
+            return keys
+        keys = self.pressed_on[index] or self._keys_at(position)
+        self.pressed_on[index] = None
+        return keys
+
+    def _dispatch(self, kind: int, code: int, pressed: bool) -> None:
+        """Sends keys decided by tap-hold and combos."""
+        self._use_oneshot(pressed)
+        dispatch(kind, code, pressed)
+        self._end_oneshot(pressed)
+
+    def _use_oneshot(self, pressed: bool) -> None:
+        # a one-shot layer is dropped once the next key is released
+        if pressed and self.config.oneshot_state:
+            self.config.oneshot_used = True
+
+    def _end_oneshot(self, pressed: bool) -> None:
+        if not pressed and self.config.oneshot_used:
+            self.config.oneshot_off()
 
     def _process_key(self, key: BaseKey, pressed: bool):
         if pressed:
@@ -274,6 +697,7 @@ class Primary(Roki):
                 if RokiService in adv.services:  # type: ignore
                     peripheral_conn = self.ble.connect(adv)
                     peripheral_conn.connection_interval = connection_interval
+                    self.connection_tuner.attach(peripheral_conn, self.clock.now())
                     logger.info("Connected")
                     break
             self.ble.stop_scan()
@@ -287,8 +711,19 @@ class Secondary(Roki):
 
         self.disconnect()
 
-        self.counter = Cycle()
-        self.send_thumb_stick_message = False
+        self.sequence = 0
+        self.tx_buffer = bytearray(MAX_PACKET_SIZE)
+        self.tx_size = HEADER_SIZE
+        self.set_packet_size(MIN_PACKET_SIZE)
+        # thumb stick position waiting for room in a packet
+        self.stick_x = 0
+        self.stick_y = 0
+        self.stick_pending = False
+        self.stick_sent_at = self.clock.now()
+        self.setup_tasks()
+
+        wait_for_connection = Loop(self.max_iterations_ble, self.is_connected)
+        is_disconnected = self.is_disconnected
 
         for _ in Loop(self.max_iterations_main_loop).iterate():
             logger.info("Advertise Roki peripheral...")
@@ -299,63 +734,156 @@ class Secondary(Roki):
                 logger.error(str(e))
                 continue
 
-            for _ in Loop(
-                self.max_iterations_ble,
-                lambda: self.ble.connected,
-            ).iterate():
+            for _ in wait_for_connection.iterate():
                 pass
 
             logger.info("Connected")
-            for _ in Loop(
-                self.max_iterations_ble,
-                lambda: not self.ble.connected,
-            ).iterate():
-                self.process_keys()
-                if self.config.extras:
-                    self.process_encoder()
-                    self.process_thumb_stick()
+            self.set_packet_size(self.service.packet_size())
+            self.tx_size = HEADER_SIZE
+            # a packet per connection event at most, events in between wait
+            interval = self.negotiated_interval()
+            self.flush_task.period = self.ble_period or max(int(interval), 1)
+            logger.debug(f"Flushing every {self.flush_task.period} ms")
+            self.scheduler.run_until(is_disconnected)
+
+    def set_packet_size(self, size: int) -> None:
+        self.packet_size = size
+        # a view per packet length, so sending does not allocate one
+        buffer = memoryview(self.tx_buffer)
+        self.tx_views = [
+            buffer[: HEADER_SIZE + n * EVENT_SIZE]
+            for n in range((size - HEADER_SIZE) // EVENT_SIZE + 1)
+        ]
+
+    def negotiated_interval(self) -> float:
+        """Interval of the link to the primary, the requested one if unknown."""
+        for connection in self.ble.connections:
+            if connection and connection.connected:
+                return connection.connection_interval
+        return self.connection_interval
+
+    def setup_tasks(self):
+        self.scheduler.add("keys", self.process_keys, self.key_scan_period, priority=0)
+        self.scheduler.add(
+            "encoder", self.process_encoder, self.encoder_period, priority=2
+        )
+        self.scheduler.add(
+            "thumb_stick", self.process_thumb_stick, self.thumb_stick_period, priority=3
+        )
+        self.scheduler.add("buzzer", self.buzzer.update, self.buzzer_period, priority=4)
+        # held keys are sent on change and periodically, so the primary
+        # recovers from lost packets
+        if self.snapshot_period:
+            self.scheduler.add(
+                "matrix", self.send_snapshot, self.snapshot_period, priority=4
+            )
+        # events of the tick go out together, after every producer ran
+        self.flush_task = self.scheduler.add(
+            "ble", self.flush_messages, self.ble_period, priority=5
+        )
 
     def process_encoder(self):
+        if not self.config.extras:
+            return
         self.encoder_position.update(self.encoder.position)
         if self.encoder_position.rose:
-            message_id = ENCODER
-            payload = self.encoder_position.diff
-            self.send_message(message_id, (payload, 0))
+            self.send_message(ENCODER, self.encoder_position.diff, 0)
         elif self.encoder_position.fell:
-            message_id = ENCODER
-            payload = -self.encoder_position.diff
-            self.send_message(message_id, (0, payload))
+            self.send_message(ENCODER, 0, -self.encoder_position.diff)
 
     def process_keys(self):
-        if event := self.key_matrix.events.get():
-            key = self.config.layer.secondary_keys[event.key_number]
+        self.update_key_queue_depth()
+        event = self.key_event
+        changed = False
+        for _ in range(self.max_events_per_tick):
+            if not self.next_key_event():
+                break
             # TODO: avoid check at this level
-            if (
-                isinstance(key, LayerHandlerKey)
-                and isinstance(key.key_code, OnPressExtrasCommand)
-                and event.pressed
-            ):
+            if event.pressed and self._is_extras_key(event.key_number):
                 self.config.extras = not self.config.extras
             else:
-                message_id = KEY
-                payload = int(event.pressed)
-                self.send_message(message_id, (event.key_number, payload))
+                self.set_matrix_key(event.key_number, event.pressed)
+                self.send_message(KEY, event.key_number, int(event.pressed))
+                changed = True
+        if changed and self.snapshot_period:
+            self.send_matrix()
+
+    def _is_extras_key(self, index: int) -> bool:
+        if self.config.compiled:
+            return self.config.layer.secondary_keys.is_extras(index)
+        key = self.config.layer.secondary_keys[index]
+        return isinstance(key, LayerHandlerKey) and isinstance(
+            key.key_code, OnPressExtrasCommand
+        )
 
     def process_thumb_stick(self):
-        x, y = self.calibration.get_normalized(
-            self.thumb_stick_x.value, self.thumb_stick_y.value
-        )
-        message_id = THUMB_STICK
-        if x != 0 or y != 0:
-            self.send_message(message_id, (encode_float(x), encode_float(y)))
-            self.send_thumb_stick_message = True
-        elif self.send_thumb_stick_message:
-            self.send_message(message_id, (0, 0))
-            self.send_thumb_stick_message = False
-
-    def send_message(self, message_id: int, payload: tuple[int, int]):
-        self.counter.increment()
-        payload_1, payload_2 = payload
-        self.service.write(
-            bytes((self.counter.value, message_id, abs(payload_1), abs(payload_2)))
-        )
+        """
+        Send the position at most every `thumb_stick_send_period` ms, and only
+        when an axis moved by `thumb_stick_threshold` or the stick is back in
+        the middle. The primary keeps moving the cursor in between.
+        """
+        x = y = 0
+        if self.config.extras:
+            x, y = self.calibration.get_normalized(
+                self.thumb_stick_x.value, self.thumb_stick_y.value
+            )
+        now = self.clock.now()
+        if x or y:
+            if ticks_diff(now, self.stick_sent_at) < self.thumb_stick_send_period:
+                return
+            threshold = self.thumb_stick_threshold
+            if abs(x - self.stick_x) < threshold and abs(y - self.stick_y) < threshold:
+                return
+        elif not (self.stick_x or self.stick_y):
+            return
+        self.mark_activity()
+        self.stick_x = x
+        self.stick_y = y
+        self.stick_sent_at = now
+        self.stick_pending = True
+
+    def send_message(self, message_id: int, payload_1: int, payload_2: int):
+        """Queue an event for the next packet, see `flush_messages`."""
+        self.mark_activity()
+        self._queue_message(message_id, payload_1, payload_2)
+
+    def send_snapshot(self):
+        self.send_matrix()
+        # repeats the position too, in case going back to the middle was lost
+        self.stick_pending = True
+
+    def send_matrix(self):
+        """Queue the held keys, a `MATRIX` event per byte of the bitmap."""
+        matrix = self.matrix
+        for i in range(len(matrix)):
+            self._queue_message(MATRIX, i, matrix[i])
+
+    def _queue_message(self, message_id: int, payload_1: int, payload_2: int):
+        if self.tx_size + EVENT_SIZE > self.packet_size:
+            self.flush_messages()
+        buffer = self.tx_buffer
+        size = self.tx_size
+        buffer[size] = message_id
+        buffer[size + 1] = abs(payload_1)
+        buffer[size + 2] = abs(payload_2)
+        self.tx_size = size + EVENT_SIZE
+
+    def flush_messages(self) -> bool:
+        """
+        Send the queued events in a single notification, up to the MTU of the
+        connection, instead of a packet per event.
+        """
+        # the thumb stick only takes the room left by other events
+        if self.stick_pending and self.tx_size + EVENT_SIZE <= self.packet_size:
+            self._queue_message(
+                THUMB_STICK, encode_axis(self.stick_x), encode_axis(self.stick_y)
+            )
+            self.stick_pending = False
+        if self.tx_size == HEADER_SIZE:
+            return False
+        self.sequence = (self.sequence + 1) & SEQUENCE_MASK
+        buffer = self.tx_buffer
+        write_sequence(buffer, self.sequence)
+        self.service.write(self.tx_views[(self.tx_size - HEADER_SIZE) // EVENT_SIZE])
+        self.tx_size = HEADER_SIZE
+        return True
@@ -1,16 +1,20 @@
 from __future__ import annotations
 
+from array import array
+
 import usb_hid
 from adafruit_ble.services.standard.hid import HIDService
-from adafruit_hid.consumer_control import ConsumerControl as Media
+from adafruit_hid.consumer_control import ConsumerControl as _Media
 from adafruit_hid.consumer_control_code import ConsumerControlCode as MediaKey
-from adafruit_hid.keyboard import Keyboard
+from adafruit_hid.keyboard import Keyboard as _Keyboard
 from adafruit_hid.keycode import Keycode
 from adafruit_hid.mouse import Mouse as _Mouse
 
 from roki.firmware import logging
 from roki.firmware.layer_handler import Command, Commands, LayerHandler
+from roki.firmware.macros import MacroPlayer
 from roki.firmware.params import Params
+from roki.firmware.utils import SUBPIXEL_SHIFT, whole_pixels
 
 try:
     from typing import Literal, Sequence, Type, TypeAlias
@@ -21,39 +25,244 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# type tags of the compiled keymap, see `encode`
+NOOP = 0
+KEYBOARD = 1
+MOUSE = 2
+MEDIA = 3
+LAYER = 4
+TRANSPARENT = 5
+TAP_HOLD = 6
+MACRO = 7
+
+# falls through to the next active layer down
+TRANSPARENT_NAME = "TRNS"
+# "A|LEFT_CONTROL": A when tapped, LEFT_CONTROL when held
+TAP_HOLD_SEPARATOR = "|"
+# "MACRO_0" plays the first macro of the config, "MACRO_STOP" cancels
+MACRO_PREFIX = "MACRO_"
+MACRO_STOP_NAME = "MACRO_STOP"
+MACRO_STOP = 0xFFFF
+
+# mouse movements are stored as codes above the button bitmask
+MOUSE_MOVEMENT = 0x100
+MOUSE_MOVEMENTS: tuple[DPad, ...] = ("u", "d", "l", "r", "su", "sd")
+# bits of the held movements, in `MOUSE_MOVEMENTS` order
+MOVE_UP = 1 << 0
+MOVE_DOWN = 1 << 1
+MOVE_LEFT = 1 << 2
+MOVE_RIGHT = 1 << 3
+SCROLL_UP = 1 << 4
+SCROLL_DOWN = 1 << 5
+
+
+class BatchedReports:
+    """
+    Holds back HID reports while `batched` so that all changes of a scan
+    tick go out as a single report on `flush`.
+
+    A press is never merged with a later release, otherwise a tap within
+    one tick would never reach the host: the pending report is sent first.
+    """
+
+    batched: bool
+    dirty: bool
+    pending_press: bool
+
+    def _init_batch(self) -> None:
+        self.batched = False
+        self.dirty = False
+        self.pending_press = False
+
+    def _send_report(self) -> None:
+        raise NotImplementedError()
+
+    def _queue(self, press: bool) -> None:
+        if not self.batched:
+            self._send_report()
+            return
+        self.dirty = True
+        if press:
+            self.pending_press = True
+
+    def _flush_presses(self) -> None:
+        if self.pending_press:
+            self.flush()
+
+    def flush(self) -> bool:
+        """Send the held back report, True if there was one."""
+        if not self.dirty:
+            return False
+        self._send_report()
+        self.dirty = False
+        self.pending_press = False
+        return True
+
+
+class Keyboard(BatchedReports, _Keyboard):
+    def __init__(self, devices: Sequence[usb_hid.Device], timeout: int = None) -> None:  # type: ignore
+        super().__init__(devices, timeout)
+        self._init_batch()
+
+    def press(self, *keycodes: int) -> None:
+        for keycode in keycodes:
+            self._add_keycode_to_report(keycode)
+        self._queue(True)
+
+    def release(self, *keycodes: int) -> None:
+        self._flush_presses()
+        for keycode in keycodes:
+            self._remove_keycode_from_report(keycode)
+        self._queue(False)
+
+    def release_all(self) -> None:
+        self._flush_presses()
+        for i in range(8):
+            self.report[i] = 0
+        self._queue(False)
+
+    def _send_report(self) -> None:
+        self._keyboard_device.send_report(self.report)
+
+
+class Media(BatchedReports, _Media):
+    def __init__(self, devices: Sequence[usb_hid.Device], timeout: int = None) -> None:  # type: ignore
+        super().__init__(devices, timeout)
+        self._init_batch()
+
+    def press(self, consumer_code: int) -> None:
+        # only one code fits in the report
+        self._flush_presses()
+        self._report[0] = consumer_code & 0xFF
+        self._report[1] = consumer_code >> 8
+        self._queue(True)
+
+    def release(self) -> None:
+        self._flush_presses()
+        self._report[0] = 0
+        self._report[1] = 0
+        self._queue(False)
+
+    def _send_report(self) -> None:
+        self._consumer_device.send_report(self._report)
+
+
+class Mouse(BatchedReports, _Mouse):
+    """
+    Mouse movement keys move the cursor while held: `update` runs every
+    `period` ms and moves by the held directions at a speed ramping up to
+    `movement_speed` px/s (`scroll_speed` notches/s) over `ramp_time` ms.
+    Diagonals go out in a single report at the same overall speed.
+    """
 
-class Mouse(_Mouse):
     def __init__(
         self,
         devices: Sequence[usb_hid.Device],
         timeout: int = 2,
-        mouse_movement: int = 20,
-        mouse_scroll: int = 2,
+        period: int = 16,
+        movement_speed: int = 1000,
+        scroll_speed: int = 20,
+        ramp_time: int = 500,
     ) -> None:
-        self.mouse_movement = mouse_movement
-        self.mouse_scroll = mouse_scroll
+        self.x = 0
+        self.y = 0
+        self.wheel = 0
+        self.held = 0
+        self.steps = 0
+        # sub-pixels not moved yet
+        self.remainder_x = 0
+        self.remainder_y = 0
+        self.remainder_wheel = 0
+        self.configure(period, movement_speed, scroll_speed, ramp_time)
         super().__init__(devices, timeout)
+        self._init_batch()
+
+    def configure(
+        self, period: int, movement_speed: int, scroll_speed: int, ramp_time: int
+    ) -> None:
+        # full speeds in sub-pixels per update
+        self.movement = (movement_speed << SUBPIXEL_SHIFT) * period // 1000
+        self.scroll = (scroll_speed << SUBPIXEL_SHIFT) * period // 1000
+        self.ramp = max(ramp_time // period, 1)
+
+    def move(self, x: int = 0, y: int = 0, wheel: int = 0) -> None:
+        if not self.batched:
+            return super().move(x, y, wheel)
+        # relative movements add up until the next flush
+        self.x += x
+        self.y += y
+        self.wheel += wheel
+
+    def flush(self) -> bool:
+        if self.x or self.y or self.wheel:
+            x, y, wheel = self.x, self.y, self.wheel
+            self.x = self.y = self.wheel = 0
+            # movement reports carry the buttons as well
+            super().move(x, y, wheel)
+            self.dirty = False
+            self.pending_press = False
+            return True
+        return super().flush()
 
     def press(self, buttons: int | DPad) -> None:
         if isinstance(buttons, str):
-            if buttons == "u":
-                self.move(y=-self.mouse_movement)
-            elif buttons == "d":
-                self.move(y=self.mouse_movement)
-            elif buttons == "l":
-                self.move(x=-self.mouse_movement)
-            elif buttons == "r":
-                self.move(x=self.mouse_movement)
-            elif buttons == "su":
-                self.move(wheel=self.mouse_scroll)
-            elif buttons == "sd":
-                self.move(wheel=-self.mouse_scroll)
+            self.hold(1 << MOUSE_MOVEMENTS.index(buttons))
         else:
-            return super().press(buttons)
+            self.report[0] |= buttons
+            self._queue(True)
 
     def release(self, buttons: int | DPad) -> None:
-        if isinstance(buttons, int):
-            return super().release(buttons)
+        if isinstance(buttons, str):
+            self.unhold(1 << MOUSE_MOVEMENTS.index(buttons))
+        else:
+            self._flush_presses()
+            self.report[0] &= ~buttons
+            self._queue(False)
+
+    def hold(self, movement: int) -> None:
+        self.held |= movement
+
+    def unhold(self, movement: int) -> None:
+        self.held &= ~movement
+        if not self.held:
+            self.steps = 0
+            self.remainder_x = self.remainder_y = self.remainder_wheel = 0
+
+    def update(self) -> None:
+        held = self.held
+        if not held:
+            return
+        if self.steps < self.ramp:
+            self.steps += 1
+
+        x = bool(held & MOVE_RIGHT) - bool(held & MOVE_LEFT)
+        y = bool(held & MOVE_DOWN) - bool(held & MOVE_UP)
+        wheel = bool(held & SCROLL_UP) - bool(held & SCROLL_DOWN)
+        speed = self.movement * self.steps // self.ramp
+        if x and y:
+            # 181 / 256 ~ 1 / sqrt(2)
+            speed = (speed * 181) >> 8
+        self.remainder_x += x * speed
+        self.remainder_y += y * speed
+        self.remainder_wheel += wheel * (self.scroll * self.steps // self.ramp)
+
+        x = whole_pixels(self.remainder_x)
+        y = whole_pixels(self.remainder_y)
+        wheel = whole_pixels(self.remainder_wheel)
+        if x or y or wheel:
+            self.remainder_x -= x << SUBPIXEL_SHIFT
+            self.remainder_y -= y << SUBPIXEL_SHIFT
+            self.remainder_wheel -= wheel << SUBPIXEL_SHIFT
+            self.move(x, y, wheel)
+
+    def release_all(self) -> None:
+        self.unhold(self.held)
+        self._flush_presses()
+        self.report[0] = 0
+        self._queue(False)
+
+    def _send_report(self) -> None:
+        self._send_no_move()
 
 
 class KeyboardCode:
@@ -104,6 +313,7 @@ kb: Keyboard = None  # type: ignore lazy initialization
 mouse: Mouse = None  # type: ignore lazy initialization
 media: Media = None  # type: ignore lazy initialization
 lh: LayerHandler = None  # type: ignore lazy initialization
+player: MacroPlayer = None  # type: ignore lazy initialization
 
 
 hid: HIDService | None = None
@@ -111,28 +321,30 @@ hid: HIDService | None = None
 
 class BaseKey:
     key_code: int | DPad | Command
+    kind = NOOP
 
     __slots__ = ("key_code",)
 
     @classmethod
     def build(cls, key: str | None) -> BaseKey:
-        if not key:
-            return NoopKey()
-
-        sender_map: tuple[tuple[Code, Type[BaseKey]], ...] = (
-            (KeyboardCode(), KeyboardKey),
-            (MouseButton(), MouseKey),
-            (MediaFunction(), MultiMediaKey),
-            (Commands(), LayerHandlerKey),
-        )
-
-        for code, key_class in sender_map:
-            if key in code:
-                key_code = code.get(key)
+        kind, code = encode(key)
+        return key_pool.get(kind, code)
 
-                return key_class(key_code)
-
-        return NoopKey()
+    @classmethod
+    def create(cls, kind: int, code: int) -> BaseKey:
+        if kind == NOOP:
+            return NoopKey()
+        if kind == TRANSPARENT:
+            return TransparentKey()
+        if kind == MOUSE and code >= MOUSE_MOVEMENT:
+            return MouseKey(MOUSE_MOVEMENTS[code - MOUSE_MOVEMENT])
+        if kind == LAYER:
+            return LayerHandlerKey(commands[code])
+        if kind == TAP_HOLD:
+            return TapHoldKey(code)
+        if kind == MACRO:
+            return MacroKey(code)
+        return KEY_CLASSES[kind](code)
 
     def __init__(self, key_code: int | DPad | Command):
         self.key_code = key_code
@@ -155,8 +367,15 @@ class NoopKey(BaseKey):
         pass
 
 
+class TransparentKey(NoopKey):
+    """Replaced by the key below it when layers are resolved."""
+
+    kind = TRANSPARENT
+
+
 class MouseKey(BaseKey):
     key_code: int | DPad
+    kind = MOUSE
 
     def press(self):
         global mouse
@@ -164,11 +383,12 @@ class MouseKey(BaseKey):
 
     def release(self):
         global mouse
-        mouse.press(self.key_code)
+        mouse.release(self.key_code)
 
 
 class KeyboardKey(BaseKey):
     key_code: int
+    kind = KEYBOARD
 
     def press(self):
         global kb
@@ -181,6 +401,7 @@ class KeyboardKey(BaseKey):
 
 class MultiMediaKey(BaseKey):
     key_code: int
+    kind = MEDIA
 
     def press(self):
         global media
@@ -193,6 +414,7 @@ class MultiMediaKey(BaseKey):
 
 class LayerHandlerKey(BaseKey):
     key_code: Command
+    kind = LAYER
 
     def press(self):
         global lh
@@ -207,11 +429,292 @@ class LayerHandlerKey(BaseKey):
         lh.on_release(self.key_code)
 
 
+class TapHoldKey(BaseKey):
+    """
+    Dual-role key, `key_code` indexes `tap_holds`. The main loop decides
+    between tap and hold, see `roki.firmware.tap_hold`; pressed on its own
+    it behaves like its tap key.
+    """
+
+    key_code: int
+    kind = TAP_HOLD
+
+    def press(self):
+        _tap_hold_press(self.key_code)
+
+    def release(self):
+        _tap_hold_release(self.key_code)
+
+
+class MacroKey(BaseKey):
+    """Plays `macros[key_code]` in the background, see `MacroPlayer`."""
+
+    key_code: int
+    kind = MACRO
+
+    def press(self):
+        _macro_press(self.key_code)
+
+    def release(self):
+        pass
+
+
+# indexed by type tag
+KEY_CLASSES: tuple[Type[BaseKey], ...] = (
+    NoopKey,
+    KeyboardKey,
+    MouseKey,
+    MultiMediaKey,
+    LayerHandlerKey,
+    TransparentKey,
+    TapHoldKey,
+    MacroKey,
+)
+
+
+class KeyPool:
+    """
+    Interned keys: every `(kind, code)` pair gets a single instance, shared
+    by all layers and both sides. Keys are never mutated after creation.
+    """
+
+    __slots__ = (
+        "keys",
+        "requests",
+    )
+
+    def __init__(self) -> None:
+        self.keys: dict[int, BaseKey] = {}
+        self.requests = 0
+
+    def get(self, kind: int, code: int) -> BaseKey:
+        self.requests += 1
+        packed = kind << 16 | code
+        key = self.keys.get(packed)
+        if key is None:
+            key = self.keys[packed] = BaseKey.create(kind, code)
+        return key
+
+    def report(self) -> str:
+        return f"{self.requests} keys requested, {len(self.keys)} unique instances"
+
+
+key_pool = KeyPool()
+
+# layer commands, a LAYER code is an index in this list
+commands: list[Command] = []
+
+# `(tap kind, tap code, hold kind, hold code)`, a TAP_HOLD code is an index
+# in this list
+tap_holds: list[tuple[int, int, int, int]] = []
+
+# compiled steps of the config macros, a MACRO code is an index in this list
+macros: list[bytes] = []
+
+# key name -> `kind << 16 | code`, see `build_key_index`
+key_index: dict[str, int] = {}
+
+
+def build_key_index() -> dict[str, int]:
+    """
+    Resolve every keyboard, mouse and media name once. On name clashes
+    keyboard codes win over mouse buttons, and those over media codes.
+    """
+    if key_index:
+        return key_index
+    for kind, registry in ((MEDIA, MediaKey), (MOUSE, Mouse)):
+        for name in dir(registry):
+            code = getattr(registry, name)
+            if name.isupper() and isinstance(code, int):
+                key_index[name] = kind << 16 | code
+    for name, movement in MouseButton.movement.items():
+        code = MOUSE_MOVEMENT + MOUSE_MOVEMENTS.index(movement)
+        key_index[name] = MOUSE << 16 | code
+    for name in dir(Keycode):
+        code = getattr(Keycode, name)
+        if name.isupper() and isinstance(code, int):
+            key_index[name] = KEYBOARD << 16 | code
+    key_index[TRANSPARENT_NAME] = TRANSPARENT << 16
+    key_index[MACRO_STOP_NAME] = MACRO << 16 | MACRO_STOP
+    return key_index
+
+
+def encode(name: str | None) -> tuple[int, int]:
+    """Resolve a key name into the `(kind, code)` pair of the compiled keymap."""
+    if not name:
+        return NOOP, 0
+    index = key_index or build_key_index()
+    packed = index.get(name)
+    if packed is None:
+        packed = NOOP << 16
+        # before layer commands, the tap may be one
+        if TAP_HOLD_SEPARATOR in name:
+            tap, hold = name.split(TAP_HOLD_SEPARATOR, 1)
+            packed = TAP_HOLD << 16 | len(tap_holds)
+            tap_holds.append(encode(tap) + encode(hold))
+        elif name in Commands():
+            # layer commands are parsed on first use, then indexed too
+            packed = LAYER << 16 | len(commands)
+            commands.append(Commands().get(name))
+        elif name.startswith(MACRO_PREFIX) and name[len(MACRO_PREFIX) :].isdigit():
+            packed = MACRO << 16 | int(name[len(MACRO_PREFIX) :])
+        index[name] = packed
+    return packed >> 16, packed & 0xFFFF
+
+
+def encode_keys(names: Sequence[str | None]) -> tuple[bytearray, array]:
+    """Compile key names into parallel type-tag and keycode tables."""
+    kinds = bytearray(len(names))
+    codes = array("H", (0 for _ in names))
+    for i, name in enumerate(names):
+        kinds[i], codes[i] = encode(name)
+    return kinds, codes
+
+
+def _noop(code: int) -> None:
+    pass
+
+
+def _keyboard_press(code: int) -> None:
+    kb.press(code)
+
+
+def _keyboard_release(code: int) -> None:
+    kb.release(code)
+
+
+def _mouse_press(code: int) -> None:
+    if code < MOUSE_MOVEMENT:
+        mouse.press(code)
+    else:
+        mouse.hold(1 << (code - MOUSE_MOVEMENT))
+
+
+def _mouse_release(code: int) -> None:
+    if code < MOUSE_MOVEMENT:
+        mouse.release(code)
+    else:
+        mouse.unhold(1 << (code - MOUSE_MOVEMENT))
+
+
+def _media_press(code: int) -> None:
+    media.press(code)
+
+
+def _media_release(code: int) -> None:
+    media.release()
+
+
+def _layer_press(code: int) -> None:
+    kb.release_all()
+    lh.on_press(commands[code])
+
+
+def _layer_release(code: int) -> None:
+    kb.release_all()
+    lh.on_release(commands[code])
+
+
+def _tap_hold_press(code: int) -> None:
+    tap_kind, tap_code, _, _ = tap_holds[code]
+    dispatch(tap_kind, tap_code, True)
+
+
+def _tap_hold_release(code: int) -> None:
+    tap_kind, tap_code, _, _ = tap_holds[code]
+    dispatch(tap_kind, tap_code, False)
+
+
+def _macro_press(code: int) -> None:
+    if code == MACRO_STOP:
+        player.stop()
+    elif code < len(macros):
+        player.play(macros[code])
+
+
+# indexed by type tag
+PRESS = (
+    _noop,
+    _keyboard_press,
+    _mouse_press,
+    _media_press,
+    _layer_press,
+    _noop,
+    _tap_hold_press,
+    _macro_press,
+)
+RELEASE = (
+    _noop,
+    _keyboard_release,
+    _mouse_release,
+    _media_release,
+    _layer_release,
+    _noop,
+    _tap_hold_release,
+    _noop,
+)
+
+
+def dispatch(kind: int, code: int, pressed: bool) -> None:
+    if pressed:
+        PRESS[kind](code)
+    else:
+        RELEASE[kind](code)
+
+
+def batch_reports(batched: bool) -> None:
+    for device in (kb, mouse, media):
+        if device is not None:
+            device.flush()
+            device.batched = batched
+
+
+def flush_reports() -> bool:
+    """Send the reports held back during the current scan tick, if any."""
+    if kb is None:
+        return False
+    # no short-circuit, every device is flushed
+    return kb.flush() | mouse.flush() | media.flush()
+
+
+def release_all() -> None:
+    """Release every key, mouse button and held mouse movement."""
+    if kb is not None:
+        kb.release_all()
+        mouse.release_all()
+        media.release()
+
+
+def set_macro_rate(rate: int) -> None:
+    if player is not None:
+        player.rate = rate
+
+
+def set_mouse_keys(
+    period: int, movement_speed: int, scroll_speed: int, ramp_time: int
+) -> None:
+    if mouse is not None:
+        mouse.configure(period, movement_speed, scroll_speed, ramp_time)
+
+
+def move_mouse() -> None:
+    """Move by the held mouse movement keys, see `Mouse.update`."""
+    if mouse is not None and mouse.held:
+        mouse.update()
+
+
+def play_macros() -> None:
+    """Send the next macro steps, see `MacroPlayer.update`."""
+    if player is not None and player.playing:
+        player.update()
+
+
 def init(c: Config):
     global kb
     global mouse
     global media
     global lh
+    global player
     global hid
 
     if hid is None:
@@ -220,6 +723,7 @@ def init(c: Config):
         mouse = Mouse(hid.devices)
         media = Media(hid.devices)
         lh = LayerHandler(c)
+        player = MacroPlayer(kb)
 
 
 if Params().DEBUG:
@@ -10,16 +10,11 @@ except Exception:
 
 
 class LayerHandler:
-    __slots__ = (
-        "_prev",
-        "config",
-    )
+    __slots__ = ("config",)
 
-    _prev: int
     config: Config
 
     def __init__(self, config: Config) -> None:
-        self._prev = 0
         self.config = config
 
     def on_press(self, command: Command) -> None:
@@ -44,19 +39,13 @@ class Commands:
             else:
                 raise NotImplementedError()
 
-            command_classes: dict[str, type[Command]] = {
-                "press": OnPressCommand,
-                "hold": OnHoldCommand,
-                "inc": OnPressIncrementCommand,
-                "dec": OnPressDecrementCommand,
-                "extras": OnPressExtrasCommand,
-            }
-            return command_classes[type_.lower()](int(index))
+            return COMMAND_CLASSES[type_.lower()](int(index))
 
         return Command(0)
 
     def __contains__(self, n: str) -> bool:
-        return n.lower().startswith("layer_")
+        # "LAYER_1_TOGGLE|LEFT_SHIFT" is a tap-hold key, see `keys.encode`
+        return n.lower().startswith("layer_") and "|" not in n
 
 
 class Command:
@@ -75,13 +64,13 @@ class Command:
 
 
 class OnPressCommand(Command):
+    """Move to the layer, only the default layer stays below it."""
+
     def __init__(self, index: int):
         self.index = index
 
     def press(self, lh: LayerHandler):
-        if self.index != lh.config.layer_index:
-            lh._prev = lh.config.layer_index
-            lh.config.layer_index = self.index
+        lh.config.layer_move(self.index)
 
     def release(self, lh: LayerHandler):
         pass
@@ -94,7 +83,7 @@ class OnPressIncrementCommand(OnPressCommand):
     def press(self, lh: LayerHandler):
         index = lh.config.layer_index + 1
         max_layer = len(lh.config.layers) - 1
-        lh.config.layer_index = min(index, max_layer)
+        lh.config.layer_move(min(index, max_layer))
 
 
 class OnPressDecrementCommand(OnPressCommand):
@@ -103,12 +92,34 @@ class OnPressDecrementCommand(OnPressCommand):
 
     def press(self, lh: LayerHandler):
         index = lh.config.layer_index - 1
-        lh.config.layer_index = max(index, 0)
+        lh.config.layer_move(max(index, 0))
 
 
 class OnHoldCommand(OnPressCommand):
+    """Momentary layer, active while the key is held."""
+
+    def press(self, lh: LayerHandler):
+        lh.config.layer_on(self.index)
+
     def release(self, lh: LayerHandler):
-        lh.config.layer_index = lh._prev
+        lh.config.layer_off(self.index)
+
+
+class OnPressToggleCommand(OnPressCommand):
+    def press(self, lh: LayerHandler):
+        lh.config.layer_invert(self.index)
+
+
+class OnPressOneShotCommand(OnPressCommand):
+    """Layer active for the next key only."""
+
+    def press(self, lh: LayerHandler):
+        lh.config.oneshot_on(self.index)
+
+
+class OnPressDefaultCommand(OnPressCommand):
+    def press(self, lh: LayerHandler):
+        lh.config.set_default_layer(self.index)
 
 
 class OnPressExtrasCommand(OnPressCommand):
@@ -117,3 +128,15 @@ class OnPressExtrasCommand(OnPressCommand):
 
     def press(self, lh: LayerHandler):
         lh.config.extras = not lh.config.extras
+
+
+COMMAND_CLASSES: dict[str, type[Command]] = {
+    "press": OnPressCommand,
+    "hold": OnHoldCommand,
+    "toggle": OnPressToggleCommand,
+    "oneshot": OnPressOneShotCommand,
+    "default": OnPressDefaultCommand,
+    "inc": OnPressIncrementCommand,
+    "dec": OnPressDecrementCommand,
+    "extras": OnPressExtrasCommand,
+}
@@ -0,0 +1,120 @@
+from adafruit_hid.keyboard_layout_us import KeyboardLayoutUS
+from adafruit_hid.keycode import Keycode
+
+from roki.firmware import logging
+
+try:
+    from typing import TYPE_CHECKING, Sequence
+
+    if TYPE_CHECKING:
+        from roki.firmware.keys import Keyboard
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+# keycodes pressed together by a step, 0 for none
+STEP_SIZE = 4
+MAX_STEPS = 256
+
+SHIFT_FLAG = 0x80
+
+
+def compile_macro(
+    definition: "str | Sequence[str]", max_steps: int = MAX_STEPS
+) -> bytes:
+    """
+    Steps of a macro, `STEP_SIZE` keycodes each. A string is typed with the
+    US layout, a list holds key names or chords like "LEFT_CONTROL+C".
+    """
+    steps = bytearray()
+    if isinstance(definition, str):
+        for char in definition:
+            code = ord(char)
+            keycode = KeyboardLayoutUS.ASCII_TO_KEYCODE[code] if code < 128 else 0
+            if not keycode:
+                logger.warning(f"Cannot type {char!r}")
+                continue
+            steps.append(Keycode.SHIFT if keycode & SHIFT_FLAG else 0)
+            steps.append(keycode & ~SHIFT_FLAG)
+            steps.extend(bytes(STEP_SIZE - 2))
+    else:
+        for chord in definition:
+            names = chord.split("+")
+            if len(names) > STEP_SIZE:
+                logger.warning(f"At most {STEP_SIZE} keys per step: {chord}")
+            for i in range(STEP_SIZE):
+                keycode = getattr(Keycode, names[i], 0) if i < len(names) else 0
+                if i < len(names) and not keycode:
+                    logger.warning(f"Unknown key in macro: {names[i]}")
+                steps.append(keycode)
+
+    if len(steps) > max_steps * STEP_SIZE:
+        logger.warning(f"Macro truncated to {max_steps} steps")
+        return bytes(steps[: max_steps * STEP_SIZE])
+    return bytes(steps)
+
+
+class MacroPlayer:
+    """
+    Types macros in the background: `play` copies the steps into a queue
+    allocated once, `update` sends at most `rate` steps (a press and a
+    release report each) per call, so scanning and BLE keep running while
+    a long macro plays. Macros played in a row are queued up to the queue
+    size, `stop` drops what is left.
+    """
+
+    __slots__ = (
+        "keyboard",
+        "rate",
+        "queue",
+        "head",
+        "tail",
+    )
+
+    def __init__(
+        self,
+        keyboard: "Keyboard",
+        max_steps: int = MAX_STEPS,
+        rate: int = 1,
+    ) -> None:
+        self.keyboard = keyboard
+        self.rate = rate
+        self.queue = bytearray(max_steps * STEP_SIZE)
+        # byte offsets of the next step and of the end of the queue
+        self.head = 0
+        self.tail = 0
+
+    @property
+    def playing(self) -> bool:
+        return self.head != self.tail
+
+    def play(self, steps: bytes) -> None:
+        if not self.playing:
+            self.head = self.tail = 0
+        size = min(len(steps), len(self.queue) - self.tail)
+        if size < len(steps):
+            logger.warning("Macro queue full, macro truncated")
+        self.queue[self.tail : self.tail + size] = memoryview(steps)[:size]
+        self.tail += size
+
+    def stop(self) -> None:
+        self.head = self.tail = 0
+
+    def update(self) -> None:
+        queue = self.queue
+        keyboard = self.keyboard
+        for _ in range(self.rate):
+            if self.head == self.tail:
+                return
+            start = self.head
+            end = start + STEP_SIZE
+            self.head = end
+            for i in range(start, end):
+                if queue[i]:
+                    keyboard.press(queue[i])
+            for i in range(start, end):
+                if queue[i]:
+                    keyboard.release(queue[i])
+            # the same key in the next step needs a release report in between
+            keyboard.flush()
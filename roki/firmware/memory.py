@@ -0,0 +1,123 @@
+from gc import collect
+from time import monotonic_ns
+
+from adafruit_ticks import ticks_diff
+
+from roki.firmware import logging
+
+try:
+    from gc import mem_free  # type: ignore
+except ImportError:  # CPython
+
+    def mem_free() -> int:
+        return 0
+
+
+logger = logging.getLogger(__name__)
+
+
+class AllocationMonitor:
+    """
+    Debug counter of heap usage: every `every` updates it samples
+    `gc.mem_free()` and keeps the bytes allocated since the previous sample.
+
+    A negative delta means a collection ran in between, which is counted
+    separately. A steady-state loop should report zero allocations.
+    """
+
+    __slots__ = (
+        "every",
+        "iterations",
+        "last_free",
+        "allocated",
+        "max_allocated",
+        "collections",
+    )
+
+    def __init__(self, every: int = 1000) -> None:
+        self.every = every
+        self.iterations = 0
+        self.last_free = mem_free()
+        self.allocated = 0
+        self.max_allocated = 0
+        self.collections = 0
+
+    def update(self) -> None:
+        self.iterations += 1
+        if self.iterations < self.every:
+            return
+        self.iterations = 0
+
+        free = mem_free()
+        delta = self.last_free - free
+        self.last_free = free
+
+        if delta < 0:
+            self.collections += 1
+            return
+
+        self.allocated = delta
+        if delta > self.max_allocated:
+            self.max_allocated = delta
+        if delta:
+            logger.debug(
+                f"Allocated {delta} bytes in {self.every} iterations "
+                f"(max {self.max_allocated}, collections {self.collections})"
+            )
+
+
+class IdleCollector:
+    """
+    Runs `gc.collect()` in quiet windows instead of letting the VM collect
+    in the middle of a keystroke.
+
+    `touch` is called whenever a matrix or BLE event is handled. Once nothing
+    happened for `idle_after` ms, the next `update` collects if free memory
+    is below `min_free` bytes, at most once per idle window.
+    """
+
+    __slots__ = (
+        "idle_after",
+        "min_free",
+        "last_activity",
+        "collected",
+        "collections",
+        "last_duration",
+        "max_duration",
+    )
+
+    def __init__(self, idle_after: int = 50, min_free: int = 16_384) -> None:
+        self.idle_after = idle_after
+        self.min_free = min_free
+        self.last_activity = 0
+        self.collected = False
+        self.collections = 0
+        self.last_duration = 0
+        self.max_duration = 0
+
+    def touch(self, now: int) -> None:
+        self.last_activity = now
+        self.collected = False
+
+    def is_idle(self, now: int) -> bool:
+        return ticks_diff(now, self.last_activity) >= self.idle_after
+
+    def update(self, now: int) -> None:
+        if self.collected or not self.is_idle(now):
+            return
+        self.collected = True
+        if mem_free() < self.min_free:
+            self.collect()
+
+    def collect(self) -> int:
+        """Collect and return how long it took, in microseconds."""
+        start = monotonic_ns()
+        collect()
+        duration = (monotonic_ns() - start) // 1000
+
+        self.collections += 1
+        self.last_duration = duration
+        if duration > self.max_duration:
+            self.max_duration = duration
+        logger.debug(f"Idle collection took {duration} us, {mem_free()} bytes free")
+        return duration
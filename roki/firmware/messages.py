@@ -1,3 +1,4 @@
 KEY = 1
 ENCODER = 2
 THUMB_STICK = 3
+MATRIX = 4
@@ -7,6 +7,9 @@ class Params:
     IS_LEFT_SIDE: bool
     DEBUG: bool
     LOG_LEVEL: int
+    PROBES: bool
+    COMPILED_KEYMAP: bool
+    MAX_RESIDENT_LAYERS: int
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -20,11 +23,17 @@ class Params:
         is_left_side: bool = True,
         debug: bool = False,
         log_level: int = 0,
+        probes: bool = False,
+        compiled_keymap: bool = False,
+        max_resident_layers: int = 0,
     ):
         if not self.init_done:
             self.IS_LEFT_SIDE = is_left_side
             self.DEBUG = debug
             self.LOG_LEVEL = log_level
+            self.PROBES = probes
+            self.COMPILED_KEYMAP = compiled_keymap
+            self.MAX_RESIDENT_LAYERS = max_resident_layers
             self.init_done = True
 
     @classmethod
@@ -33,4 +42,7 @@ class Params:
             is_left_side=bool(int(os.getenv("IS_LEFT_SIDE", 1))),
             debug=bool(int(os.getenv("DEBUG", 0))),
             log_level=bool(int(os.getenv("LOG_LEVEL", 0))),
+            probes=bool(int(os.getenv("PROBES", 0))),
+            compiled_keymap=bool(int(os.getenv("COMPILED_KEYMAP", 0))),
+            max_resident_layers=int(os.getenv("MAX_RESIDENT_LAYERS", 0)),
         )
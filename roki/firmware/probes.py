@@ -0,0 +1,157 @@
+from array import array
+from time import monotonic_ns
+
+from adafruit_ticks import ticks_diff, ticks_ms
+
+from roki.firmware import logging
+
+try:
+    from typing import Callable
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+MARKER = "#probe"
+BUCKETS = 16
+
+
+class Histogram:
+    """
+    Fixed-size histogram of microsecond samples.
+
+    Bucket `i` counts samples in [2**(i-1); 2**i), bucket 0 counts zeros and
+    the last bucket collects everything above.
+    """
+
+    __slots__ = (
+        "name",
+        "counts",
+        "count",
+        "total",
+        "max",
+    )
+
+    def __init__(self, name: str, size: int = BUCKETS) -> None:
+        self.name = name
+        self.counts = array("L", (0 for _ in range(size)))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        last = len(self.counts) - 1
+        bucket = 0
+        v = value
+        while v and bucket < last:
+            v >>= 1
+            bucket += 1
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def reset(self) -> None:
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def dump(self) -> str:
+        buckets = ",".join(str(c) for c in self.counts)
+        return f"{MARKER} {self.name} {self.count} {self.total} {self.max} {buckets}"
+
+
+histograms: dict[str, Histogram] = {}
+
+
+def get_histogram(name: str) -> Histogram:
+    if name not in histograms:
+        histograms[name] = Histogram(name)
+    return histograms[name]
+
+
+def timed(
+    cls: type,
+    method_name: str,
+    histogram: Histogram,
+    when: "Callable[[object], bool] | None" = None,
+) -> None:
+    """
+    Replace `cls.method_name` with a wrapper recording its duration. `cls`
+    may also be a module, to time a function where it is imported.
+
+    With `when`, only calls whose result satisfies it are recorded.
+    """
+    method = getattr(cls, method_name)
+
+    def wrapper(*args):
+        start = monotonic_ns()
+        result = method(*args)
+        if when is None or when(result):
+            histogram.record((monotonic_ns() - start) // 1000)
+        return result
+
+    setattr(cls, method_name, wrapper)
+
+
+def aged(cls: type, method_name: str, histogram: Histogram) -> None:
+    """
+    Wrap the keypad event reader, recording how long each event waited in
+    the queue since the matrix scan.
+    """
+    method = getattr(cls, method_name)
+
+    def wrapper(self):
+        if result := method(self):
+            age = ticks_diff(ticks_ms(), self.key_event.timestamp)
+            histogram.record(age * 1000)
+        return result
+
+    setattr(cls, method_name, wrapper)
+
+
+def install() -> None:
+    """
+    Instrument the firmware stages. Nothing is wrapped until this is called,
+    so disabled probes cost nothing on the hot path.
+    """
+    from roki.firmware import config, kb
+    from roki.firmware.kb import Primary, Roki, Secondary
+    from roki.firmware.keys import (
+        KeyboardKey,
+        LayerHandlerKey,
+        MouseKey,
+        MultiMediaKey,
+    )
+    from roki.firmware.memory import IdleCollector
+
+    if histograms:
+        return
+
+    logger.info("Installing latency probes")
+
+    aged(Roki, "next_key_event", get_histogram("matrix"))
+    timed(Secondary, "flush_messages", get_histogram("ble_send"), bool)
+    timed(Primary, "get_message", get_histogram("ble_receive"), bool)
+    timed(IdleCollector, "collect", get_histogram("gc"))
+    key_press = get_histogram("key_press")
+    for key_class in (KeyboardKey, MouseKey, MultiMediaKey, LayerHandlerKey):
+        timed(key_class, "press", key_press)
+    # compiled keymaps, tap-hold and combos skip the key classes
+    dispatch = get_histogram("dispatch")
+    timed(config, "dispatch", dispatch)
+    timed(kb, "dispatch", dispatch)
+    # batched reports leave the board here, once per scan tick
+    timed(kb, "flush_reports", get_histogram("report"), bool)
+
+
+def installed() -> bool:
+    return bool(histograms)
+
+
+def dump() -> None:
+    for histogram in histograms.values():
+        print(histogram.dump())
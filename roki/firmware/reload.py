@@ -0,0 +1,144 @@
+import json
+import os
+
+from adafruit_ticks import ticks_diff
+
+from roki.firmware import logging
+from roki.firmware.config import KEYMAP_MAGIC, Config
+
+try:
+    from typing import TYPE_CHECKING, Callable
+
+    if TYPE_CHECKING:
+        from usb_cdc import Serial
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+# config JSON pushed over serial goes between these bytes, see `roki push`
+FRAME_START = b"\x02"
+FRAME_END = b"\x03"
+MAX_FRAME = 16_384
+
+
+class ConfigReloader:
+    """
+    Applies a new config without a reboot or a reconnect.
+
+    Every `period` ms, `update` checks the size and mtime of the file that
+    `locate` returns, looked up each time since an upload may swap a keymap
+    for config.json. It also reads config JSON pushed over `stream` (e.g.
+    `usb_cdc.console`) between `FRAME_START` and `FRAME_END`. Only the layers
+    that changed are rebuilt, see `Config.reload`, and `on_reload` runs right
+    after the swap so that keys held with the old layers can be released.
+    """
+
+    __slots__ = (
+        "config",
+        "locate",
+        "path",
+        "stream",
+        "on_reload",
+        "period",
+        "last_check",
+        "file_state",
+        "frame",
+        "reloads",
+    )
+
+    def __init__(
+        self,
+        config: Config,
+        locate: "Callable[[], str]",
+        stream: "Serial | None" = None,
+        on_reload: "Callable[[], None] | None" = None,
+        period: int = 1000,
+        now: int = 0,
+    ) -> None:
+        self.config = config
+        self.locate = locate
+        self.path = locate()
+        self.stream = stream
+        self.on_reload = on_reload
+        self.period = period
+        self.last_check = now
+        self.file_state = self._file_state()
+        # bytes of the frame being received, None between frames
+        self.frame: bytearray | None = None
+        self.reloads = 0
+
+    def _file_state(self) -> tuple[str, int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        # size, mtime
+        return self.path, stat[6], stat[8]
+
+    def update(self, now: int) -> None:
+        if self.stream is not None and self.stream.in_waiting:
+            self._receive(self.stream.read(self.stream.in_waiting))
+
+        if ticks_diff(now, self.last_check) < self.period:
+            return
+        self.last_check = now
+        self.path = self.locate()
+        state = self._file_state()
+        if state == self.file_state:
+            return
+        self.file_state = state
+        if state is None:
+            return
+        logger.info(f"{self.path} changed")
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except OSError as e:
+            logger.error(f"Cannot read {self.path}: {e}")
+            return
+        self.apply(data)
+
+    def _receive(self, data: bytes) -> None:
+        while data:
+            if self.frame is None:
+                start = data.find(FRAME_START)
+                if start < 0:
+                    return
+                self.frame = bytearray()
+                data = data[start + 1 :]
+            end = data.find(FRAME_END)
+            if end < 0:
+                self.frame.extend(data)
+                if len(self.frame) > MAX_FRAME:
+                    logger.error(f"Pushed config over {MAX_FRAME} bytes, dropped")
+                    self.frame = None
+                return
+            self.frame.extend(data[:end])
+            frame = self.frame
+            self.frame = None
+            logger.info("Config pushed over serial")
+            self.apply(bytes(frame))
+            data = data[end + 1 :]
+
+    def apply(self, data: bytes) -> bool:
+        """Reload from a compiled keymap or config JSON."""
+        try:
+            if data[: len(KEYMAP_MAGIC)] == KEYMAP_MAGIC:
+                changed = self.config.reload_keymap(data)
+            else:
+                content = json.loads(data.decode())
+                changed = self.config.reload(
+                    content.get("layers", []),
+                    content.get("combos", []),
+                    content.get("macros", []),
+                )
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            logger.error(f"Config not reloaded: {e}")
+            return False
+
+        if self.on_reload is not None:
+            self.on_reload()
+        self.reloads += 1
+        logger.info(f"Config reloaded, changed layers: {changed:b}")
+        return True
@@ -0,0 +1,219 @@
+from adafruit_ticks import ticks_add, ticks_diff, ticks_ms
+
+from roki.firmware import logging
+from roki.firmware.utils import Loop
+
+try:
+    from typing import Callable
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+
+class Clock:
+    __slots__ = tuple()
+
+    def now(self) -> int:
+        return ticks_ms()
+
+    def advance(self) -> None:
+        pass
+
+
+class StepClock(Clock):
+    """
+    Deterministic clock: time only moves when `advance` is called.
+    """
+
+    __slots__ = (
+        "value",
+        "step",
+    )
+
+    def __init__(self, step: int = 1, initial_value: int = 0) -> None:
+        self.value = initial_value
+        self.step = step
+
+    def now(self) -> int:
+        return self.value
+
+    def advance(self) -> None:
+        self.value = ticks_add(self.value, self.step)
+
+
+class Task:
+    __slots__ = (
+        "name",
+        "callback",
+        "period",
+        "priority",
+        "deadline",
+        "runs",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        callback: "Callable[[], None]",
+        period: int = 0,
+        priority: int = 0,
+    ) -> None:
+        self.name = name
+        self.callback = callback
+        self.period = period
+        self.priority = priority
+        self.deadline = 0
+        self.runs = 0
+
+    def is_due(self, now: int) -> bool:
+        return ticks_diff(now, self.deadline) >= 0
+
+    def run(self, now: int) -> None:
+        self.deadline = ticks_add(now, self.period)
+        self.runs += 1
+        self.callback()
+
+
+class Timer:
+    __slots__ = (
+        "callback",
+        "deadline",
+        "bucket",
+    )
+
+    def __init__(self, callback: "Callable[[], None]") -> None:
+        self.callback = callback
+        self.deadline = 0
+        # index of the wheel bucket holding the timer, -1 when not scheduled
+        self.bucket = -1
+
+    @property
+    def active(self) -> bool:
+        return self.bucket >= 0
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel for short `ticks_ms` deadlines.
+
+    Timers are spread over `slots` buckets of `resolution` ms, so `update`
+    only looks at the buckets the clock moved through since the previous
+    call instead of every scheduled timer. Deadlines further than a full
+    turn stay in their bucket until they are due.
+    """
+
+    __slots__ = (
+        "slots",
+        "resolution",
+        "buckets",
+        "cursor",
+        "now",
+        "count",
+    )
+
+    def __init__(self, now: int = 0, slots: int = 16, resolution: int = 10) -> None:
+        self.slots = slots
+        self.resolution = resolution
+        self.buckets: list[list[Timer]] = [[] for _ in range(slots)]
+        self.cursor = 0
+        self.now = now
+        self.count = 0
+
+    def schedule(self, timer: Timer, deadline: int) -> None:
+        if timer.active:
+            self.cancel(timer)
+        steps = max(ticks_diff(deadline, self.now), 0) // self.resolution
+        timer.deadline = deadline
+        timer.bucket = (self.cursor + steps) % self.slots
+        self.buckets[timer.bucket].append(timer)
+        self.count += 1
+
+    def cancel(self, timer: Timer) -> None:
+        if timer.active:
+            self.buckets[timer.bucket].remove(timer)
+            timer.bucket = -1
+            self.count -= 1
+
+    def update(self, now: int) -> None:
+        """Fire the timers due at `now`."""
+        steps = ticks_diff(now, self.now) // self.resolution
+        if steps < 0:
+            return
+        self.now = ticks_add(self.now, steps * self.resolution)
+        if not self.count:
+            self.cursor = (self.cursor + steps) % self.slots
+            return
+        # a full turn visits every bucket
+        for step in range(min(steps, self.slots - 1) + 1):
+            bucket = self.buckets[(self.cursor + step) % self.slots]
+            i = 0
+            while i < len(bucket):
+                timer = bucket[i]
+                if ticks_diff(now, timer.deadline) < 0:
+                    i += 1
+                    continue
+                bucket.pop(i)
+                timer.bucket = -1
+                self.count -= 1
+                timer.callback()
+        self.cursor = (self.cursor + steps) % self.slots
+
+
+class Scheduler:
+    """
+    Cooperative scheduler for the main loop.
+
+    Every task has a period (ms) and a priority (lower runs first). On each
+    tick the due tasks run in priority order.
+    """
+
+    __slots__ = (
+        "clock",
+        "tasks",
+        "max_ticks",
+    )
+
+    def __init__(self, clock: Clock | None = None, max_ticks: int = 0) -> None:
+        self.clock = clock or Clock()
+        self.tasks: list[Task] = []
+        self.max_ticks = max_ticks
+
+    def add(
+        self,
+        name: str,
+        callback: "Callable[[], None]",
+        period: int = 0,
+        priority: int = 0,
+    ) -> Task:
+        task = Task(name, callback, period, priority)
+        index = len(self.tasks)
+        for i, t in enumerate(self.tasks):
+            if t.priority > priority:
+                index = i
+                break
+        self.tasks.insert(index, task)
+        return task
+
+    def get(self, name: str) -> Task:
+        for task in self.tasks:
+            if task.name == name:
+                return task
+        raise KeyError(name)
+
+    def reset(self) -> None:
+        now = self.clock.now()
+        for task in self.tasks:
+            task.deadline = now
+
+    def tick(self) -> None:
+        now = self.clock.now()
+        for task in self.tasks:
+            if task.is_due(now):
+                task.run(now)
+        self.clock.advance()
+
+    def run_until(self, stop_when: "Callable[[], bool]") -> None:
+        self.reset()
+        for _ in Loop(self.max_ticks, stop_when).iterate():
+            self.tick()
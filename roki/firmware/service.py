@@ -4,7 +4,20 @@ from adafruit_ble.characteristics import Characteristic, ComplexCharacteristic
 from adafruit_ble.services import Service
 from adafruit_ble.uuid import VendorUUID
 
-BUFFER_SIZE = 4
+from roki.firmware import logging
+
+logger = logging.getLogger(__name__)
+
+# a packet is a 16-bit sequence number followed by events of message id and
+# two payloads
+HEADER_SIZE = 2
+EVENT_SIZE = 3
+SEQUENCE_MASK = 0xFFFF
+# packets queued on the receiving side before the oldest are overwritten
+PACKET_BUFFER_SIZE = 8
+# payload of a notification with the default ATT MTU (23) and the largest one
+MIN_PACKET_SIZE = 20
+MAX_PACKET_SIZE = 244
 
 
 class PacketBufferUUID(VendorUUID):
@@ -20,7 +33,7 @@ class PacketBufferCharacteristic(ComplexCharacteristic):
         self,
         *,
         uuid=None,
-        buffer_size=4,
+        buffer_size=PACKET_BUFFER_SIZE,
         properties=Characteristic.WRITE_NO_RESPONSE
         | Characteristic.NOTIFY
         | Characteristic.READ,
@@ -33,7 +46,7 @@ class PacketBufferCharacteristic(ComplexCharacteristic):
             properties=properties,
             read_perm=read_perm,
             write_perm=write_perm,
-            max_length=BUFFER_SIZE,
+            max_length=MAX_PACKET_SIZE,
             fixed_length=False,
         )
 
@@ -42,19 +55,67 @@ class PacketBufferCharacteristic(ComplexCharacteristic):
         return _bleio.PacketBuffer(
             bound_characteristic,
             buffer_size=self.buffer_size,
-            max_packet_size=BUFFER_SIZE,
+            max_packet_size=MAX_PACKET_SIZE,
         )
 
 
+def write_sequence(buffer: bytearray, sequence: int) -> None:
+    buffer[0] = sequence >> 8
+    buffer[1] = sequence & 0xFF
+
+
+def read_sequence(buffer: bytearray) -> int:
+    return buffer[0] << 8 | buffer[1]
+
+
+class PacketSequence:
+    """
+    Tracks the sequence numbers of received packets. A packet is accepted
+    when it is newer than the last one; skipped numbers count as lost and
+    repeated or older ones as duplicates.
+    """
+
+    __slots__ = ("last", "received", "lost", "duplicates")
+
+    def __init__(self) -> None:
+        self.last = -1
+        self.received = 0
+        self.lost = 0
+        self.duplicates = 0
+
+    def reset(self) -> None:
+        """Forget the last number, e.g. on a new connection, keeping counters."""
+        self.last = -1
+
+    def accept(self, sequence: int) -> bool:
+        if self.last >= 0:
+            gap = (sequence - self.last) & SEQUENCE_MASK
+            # half the range ahead is new, the other half is a late repeat
+            if gap == 0 or gap > SEQUENCE_MASK >> 1:
+                self.duplicates += 1
+                return False
+            if gap > 1:
+                self.lost += gap - 1
+                logger.warning(f"Lost {gap - 1} packets from the secondary")
+        self.last = sequence
+        self.received += 1
+        return True
+
+
 class RokiService(Service):
     uuid = PacketBufferUUID(0x0001)
 
     packets = PacketBufferCharacteristic(uuid=PacketBufferUUID(0x0101))
 
-    def readinto(self, buf: bytearray) -> tuple[int, int, int, int]:
-        if self.packets.readinto(buf):  # type: ignore
-            return buf[0], buf[1], buf[2], buf[3]
-        return (0, 0, 0, 0)
+    def readinto(self, buf: bytearray) -> int:
+        return self.packets.readinto(buf) or 0  # type: ignore
 
     def write(self, buf: bytes, *, header: bytes | None = None) -> int:
         return self.packets.write(buf, header=header)  # type: ignore
+
+    def packet_size(self) -> int:
+        """Largest packet the connection takes, known once the MTU is negotiated."""
+        length = self.packets.outgoing_packet_length  # type: ignore
+        if not length:
+            return MIN_PACKET_SIZE
+        return min(length, MAX_PACKET_SIZE)
@@ -0,0 +1,183 @@
+from array import array
+
+from adafruit_ticks import ticks_add, ticks_diff
+
+from roki.firmware import logging
+from roki.firmware.keys import dispatch, tap_holds
+from roki.firmware.scheduler import Clock, Timer, TimerWheel
+
+try:
+    from typing import Callable
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+NO_KEY = -1
+
+
+class TapHold:
+    """
+    Decides between the tap and the hold key of dual-role keys without
+    blocking the main loop.
+
+    Pressing a tap-hold key starts a `term` ms timer on the timer wheel and
+    queues the events of the other keys. The key is held once the timer
+    fires, tapped when released before. With `permissive_hold`, another key
+    pressed and released while it is down selects hold right away. Queued
+    events are then replayed through `process`, so a layer selected by the
+    hold key applies to them.
+
+    `lookup` returns the `keys.tap_holds` index of the key at a position,
+    or -1. Positions are `side | key_number`, see `config.SECONDARY_SIDE`.
+    Decided keys go to `send`, `keys.dispatch` by default.
+    """
+
+    __slots__ = (
+        "clock",
+        "timers",
+        "timer",
+        "lookup",
+        "process",
+        "term",
+        "permissive_hold",
+        "pending",
+        "definition",
+        "queue",
+        "queued",
+        "held",
+        "send",
+    )
+
+    def __init__(
+        self,
+        clock: Clock,
+        timers: TimerWheel,
+        lookup: "Callable[[int], int]",
+        process: "Callable[[int, bool], None]",
+        term: int = 200,
+        permissive_hold: bool = True,
+        size: int = 16,
+        send: "Callable[[int, int, bool], None] | None" = None,
+    ) -> None:
+        self.clock = clock
+        self.timers = timers
+        self.timer = Timer(self.expire)
+        self.lookup = lookup
+        self.process = process
+        self.term = term
+        self.permissive_hold = permissive_hold
+        self.pending = NO_KEY
+        self.definition = 0
+        # `position << 1 | pressed` of the events waiting for a decision
+        self.queue = array("H", (0 for _ in range(size)))
+        self.queued = 0
+        # position -> definition of the keys resolved as hold
+        self.held: dict[int, int] = {}
+        self.send = send
+
+    def handle(self, position: int, pressed: bool) -> bool:
+        """Return False when the event is not for the engine."""
+        if self.pending == NO_KEY:
+            return self._start(position, pressed)
+        if self.queued == len(self.queue):
+            self.decide(True)
+            return self.handle(position, pressed)
+        self.queue[self.queued] = position << 1 | pressed
+        self.queued += 1
+        self._scan()
+        return True
+
+    def reset(self) -> None:
+        """Release the keys held, forget the pending and queued ones."""
+        self.timers.cancel(self.timer)
+        self.pending = NO_KEY
+        self.queued = 0
+        for definition in self.held.values():
+            _, _, hold_kind, hold_code = tap_holds[definition]
+            self._dispatch(hold_kind, hold_code, False)
+        self.held.clear()
+
+    def expire(self) -> None:
+        if self.pending != NO_KEY:
+            self.decide(True)
+
+    def decide(self, hold: bool, released: bool = False) -> None:
+        self.timers.cancel(self.timer)
+        position = self.pending
+        definition = self.definition
+        self.pending = NO_KEY
+        tap_kind, tap_code, hold_kind, hold_code = tap_holds[definition]
+        if hold:
+            self._dispatch(hold_kind, hold_code, True)
+            if released:
+                self._dispatch(hold_kind, hold_code, False)
+            else:
+                self.held[position] = definition
+        else:
+            self._dispatch(tap_kind, tap_code, True)
+            self._dispatch(tap_kind, tap_code, False)
+        self._drain()
+
+    def _dispatch(self, kind: int, code: int, pressed: bool) -> None:
+        (self.send or dispatch)(kind, code, pressed)
+
+    def _start(self, position: int, pressed: bool) -> bool:
+        if not pressed:
+            definition = self.held.pop(position, NO_KEY)
+            if definition == NO_KEY:
+                return False
+            _, _, hold_kind, hold_code = tap_holds[definition]
+            self._dispatch(hold_kind, hold_code, False)
+            return True
+
+        definition = self.lookup(position)
+        if definition == NO_KEY:
+            return False
+        self.pending = position
+        self.definition = definition
+        self.timers.schedule(self.timer, ticks_add(self.clock.now(), self.term))
+        # replayed events may already hold the release
+        self._scan()
+        return True
+
+    def _scan(self) -> None:
+        """Decide as soon as the queued events allow it."""
+        queue = self.queue
+        for i in range(self.queued):
+            packed = queue[i]
+            if packed & 1:
+                continue
+            position = packed >> 1
+            if position == self.pending:
+                self._remove(i)
+                expired = ticks_diff(self.clock.now(), self.timer.deadline) >= 0
+                self.decide(expired, released=True)
+                return
+            if self.permissive_hold and self._pressed_before(position, i):
+                self.decide(True)
+                return
+
+    def _pressed_before(self, position: int, end: int) -> bool:
+        pressed = position << 1 | 1
+        for i in range(end):
+            if self.queue[i] == pressed:
+                return True
+        return False
+
+    def _remove(self, index: int) -> int:
+        queue = self.queue
+        packed = queue[index]
+        self.queued -= 1
+        for i in range(index, self.queued):
+            queue[i] = queue[i + 1]
+        return packed
+
+    def _drain(self) -> None:
+        """Replay queued events until empty or a new decision is pending."""
+        while self.queued and self.pending == NO_KEY:
+            packed = self._remove(0)
+            position = packed >> 1
+            pressed = bool(packed & 1)
+            if not self.handle(position, pressed):
+                self.process(position, pressed)
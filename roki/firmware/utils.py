@@ -31,25 +31,12 @@ class Loop:
 
     def iterate(self):
         for i in count():
-            logger.debug(f"Iteration: {i}")
-
             if (0 < self.max_iterations <= i) or self.sentinel():
                 break
 
             yield i
 
 
-class Cycle:
-    def __init__(self, initial_value: int = 0, limit: int = 100) -> None:
-        self.value = initial_value
-        self.limit = limit
-
-    def increment(self):
-        self.value += 1
-        if self.value >= self.limit:
-            self.value = 0
-
-
 class Debouncer:
     __slots__ = (
         "value",
@@ -96,22 +83,36 @@ def decode_vector(i: int):
     return x, i - (x << 4)
 
 
-def encode_float(value: float):
+# cursor and wheel speeds are kept in 1/256 steps
+SUBPIXEL_SHIFT = 8
+
+
+def whole_pixels(subpixels: int):
+    """
+    Whole steps of a sub-pixel amount, rounded towards zero so that both
+    directions need the same amount to move
+    """
+    if subpixels < 0:
+        return -(-subpixels >> SUBPIXEL_SHIFT)
+    return subpixels >> SUBPIXEL_SHIFT
+
+
+def encode_axis(value: int):
     """
-    [-1.0; 1.0] -> [0; 255]
+    [-127; 127] -> [0; 255], the sign in the top bit
     """
-    negative = int(value < 0)
-    value = round(abs(value) * (2**7 - 1))
-    return (negative << 7) + value
+    if value < 0:
+        return 0x80 | -value
+    return value
 
 
-def decode_float(value: int):
+def decode_axis(value: int):
     """
-    [0; 255] -> [-1.0; 1.0]
+    [0; 255] -> [-127; 127]
     """
-    negative = value >> 7
-    value -= negative << 7
-    return (1, -1)[negative] * (value / (2**7 - 1))
+    if value & 0x80:
+        return -(value & 0x7F)
+    return value
 
 
 def blink_led(led_pin: str = "LED", delay: float = 0.3, times: int = 10):
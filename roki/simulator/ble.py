@@ -0,0 +1,167 @@
+"""
+In-memory BLE stack connecting a simulated primary and secondary half.
+
+Packets only cross the link on connection events, every `interval` ms, and at
+most `packets_per_event` of them per event and direction.
+"""
+
+from collections import deque
+from collections.abc import Iterator
+from typing import Any
+
+from roki.firmware.service import MIN_PACKET_SIZE, PACKET_BUFFER_SIZE, RokiService
+from roki.simulator.hardware import SimulatedTime
+
+
+class Channel:
+    """One direction of the link: packets in the air plus the receive buffer."""
+
+    def __init__(self, link: "Link") -> None:
+        self.link = link
+        self.air: deque[tuple[int, bytes]] = deque()
+        self.received: deque[bytes] = deque()
+        self.next_event = 0.0
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.events = 0
+
+    def send(self, packet: bytes) -> None:
+        self.air.append((self.link.clock.value, packet))
+        self.sent += 1
+
+    def pump(self) -> None:
+        link = self.link
+        now = link.clock.value
+        while self.next_event <= now:
+            for _ in range(link.packets_per_event):
+                if not self.air or self.air[0][0] > self.next_event:
+                    break
+                _, packet = self.air.popleft()
+                if len(self.received) >= link.buffer_size:
+                    self.received.popleft()
+                    self.dropped += 1
+                self.received.append(packet)
+                self.delivered += 1
+            self.next_event += link.interval
+            self.events += 1
+
+
+class PacketBuffer:
+    """One end of the link, with the `_bleio.PacketBuffer` read/write API."""
+
+    def __init__(
+        self,
+        incoming: Channel,
+        outgoing: Channel,
+        max_packet_size: int = MIN_PACKET_SIZE,
+    ) -> None:
+        self.incoming = incoming
+        self.outgoing = outgoing
+        self.incoming_packet_length = max_packet_size
+        self.outgoing_packet_length = max_packet_size
+        self.packet_size = max_packet_size
+
+    def readinto(self, buf: bytearray) -> int:
+        self.incoming.pump()
+        if not self.incoming.received:
+            return 0
+        packet = self.incoming.received.popleft()
+        size = min(len(packet), len(buf))
+        buf[:size] = packet[:size]
+        return size
+
+    def write(self, data: bytes, *, header: bytes | None = None) -> int:
+        packet = (bytes(header or b"") + bytes(data))[: self.outgoing_packet_length]
+        self.outgoing.send(packet)
+        return len(packet)
+
+
+class LoopbackService(RokiService):
+    """`RokiService` bound to a loopback packet buffer instead of a radio."""
+
+    def __init__(self, packets: PacketBuffer) -> None:
+        self.packets = packets
+
+
+class Link:
+    def __init__(
+        self,
+        clock: SimulatedTime,
+        interval: float = 7.5,
+        packets_per_event: int = 1,
+        buffer_size: int = PACKET_BUFFER_SIZE,
+        packet_size: int = MIN_PACKET_SIZE,
+    ) -> None:
+        self.clock = clock
+        self.interval = interval
+        self.packets_per_event = packets_per_event
+        self.buffer_size = buffer_size
+        self.connected = True
+        self.to_primary = Channel(self)
+        self.to_secondary = Channel(self)
+        self.primary = PacketBuffer(self.to_primary, self.to_secondary, packet_size)
+        self.secondary = PacketBuffer(self.to_secondary, self.to_primary, packet_size)
+
+    def peripheral_service(self) -> LoopbackService:
+        return LoopbackService(self.secondary)
+
+
+class Advertisement:
+    def __init__(self, *services: Any) -> None:
+        self.services = list(services)
+        self.appearance = 0
+        self.complete_name = ""
+
+
+class Connection:
+    def __init__(self, link: Link) -> None:
+        self.link = link
+        self.service = LoopbackService(link.primary)
+
+    @property
+    def connected(self) -> bool:
+        return self.link.connected
+
+    @property
+    def connection_interval(self) -> float:
+        return self.link.interval
+
+    @connection_interval.setter
+    def connection_interval(self, value: float) -> None:
+        self.link.interval = value
+
+    def __getitem__(self, _: Any) -> LoopbackService:
+        return self.service
+
+    def disconnect(self) -> None:
+        self.link.connected = False
+
+
+class Radio:
+    def __init__(self, link: Link) -> None:
+        self.link = link
+        self.name = ""
+        self.advertising = False
+        self.connections: list[Connection] = []
+
+    @property
+    def connected(self) -> bool:
+        return self.link.connected
+
+    def start_advertising(self, *_: Any, **__: Any) -> None:
+        self.advertising = True
+
+    def stop_advertising(self) -> None:
+        self.advertising = False
+
+    def start_scan(self, *_: Any, **__: Any) -> Iterator[Advertisement]:
+        yield Advertisement(self.link.peripheral_service)
+
+    def stop_scan(self) -> None:
+        pass
+
+    def connect(self, _: Advertisement) -> Connection:
+        connection = Connection(self.link)
+        self.connections.append(connection)
+        return connection
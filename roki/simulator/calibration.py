@@ -0,0 +1,14 @@
+from roki.firmware.calibration import BaseCalibration
+from roki.simulator.hardware import ADC_CENTER
+
+
+class SimCalibration(BaseCalibration):
+    """Calibration for the simulated ADC: full 16-bit range around the center."""
+
+    def read(self) -> None:
+        self.min_x = self.min_y = 0.0
+        self.max_x = self.max_y = float(2**16 - 1)
+        delta = ADC_CENTER * self._limit
+        self.lower_mid_x = self.lower_mid_y = ADC_CENTER - delta
+        self.upper_mid_x = self.upper_mid_y = ADC_CENTER + delta
+        self._update_scales()
@@ -0,0 +1,309 @@
+"""
+Host-side models of the CircuitPython hardware modules used by the firmware.
+
+Every peripheral reads the shared simulated time from a clock object exposing
+a `value` attribute (milliseconds), so scripted inputs line up with the
+scheduler ticks of both halves.
+"""
+
+import types
+from bisect import bisect_right
+from collections import deque
+from typing import Any, Iterable, Protocol
+from unittest.mock import MagicMock
+
+ADC_CENTER = 2**15
+
+
+class SimulatedTime(Protocol):
+    value: int
+
+
+class Timeline:
+    """Step function of scripted `(time_ms, value)` points."""
+
+    def __init__(self, default: Any) -> None:
+        self.default = default
+        self.times: list[int] = []
+        self.values: list[Any] = []
+        self.clock: SimulatedTime | None = None
+
+    def set(self, at: int, value: Any) -> None:
+        index = bisect_right(self.times, at)
+        self.times.insert(index, at)
+        self.values.insert(index, value)
+
+    @property
+    def value(self) -> Any:
+        if self.clock is None:
+            return self.default
+        index = bisect_right(self.times, self.clock.value)
+        return self.values[index - 1] if index else self.default
+
+
+class Pin(str):
+    pass
+
+
+def _board_getattr(name: str) -> Pin:
+    if name.startswith("__"):
+        raise AttributeError(name)
+    return Pin(name)
+
+
+class Direction:
+    INPUT = "INPUT"
+    OUTPUT = "OUTPUT"
+
+
+class Pull:
+    UP = "UP"
+    DOWN = "DOWN"
+
+
+class DigitalInOut:
+    def __init__(self, pin: Pin) -> None:
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self.pull = None
+        # inputs are pulled up, so "not pressed" reads high
+        self.value = True
+
+    def switch_to_output(self, value: bool = False, **_: Any) -> None:
+        self.direction = Direction.OUTPUT
+        self.value = value
+
+    def deinit(self) -> None:
+        pass
+
+
+class AnalogIn:
+    def __init__(self, pin: Pin) -> None:
+        self.pin = pin
+        self.timeline = Timeline(ADC_CENTER)
+
+    @property
+    def value(self) -> int:
+        return self.timeline.value
+
+    def deinit(self) -> None:
+        pass
+
+
+class IncrementalEncoder:
+    def __init__(self, pin_a: Pin, pin_b: Pin, divisor: int = 4) -> None:
+        self.pins = (pin_a, pin_b)
+        self.divisor = divisor
+        self.timeline = Timeline(0)
+
+    @property
+    def position(self) -> int:
+        return self.timeline.value
+
+    def deinit(self) -> None:
+        pass
+
+
+class PWMOut:
+    def __init__(
+        self,
+        pin: Pin,
+        *,
+        duty_cycle: int = 0,
+        frequency: int = 500,
+        variable_frequency: bool = False,
+    ) -> None:
+        self.pin = pin
+        self._duty_cycle = duty_cycle
+        self.frequency = frequency
+        self.variable_frequency = variable_frequency
+        self.tones = 0
+
+    @property
+    def duty_cycle(self) -> int:
+        return self._duty_cycle
+
+    @duty_cycle.setter
+    def duty_cycle(self, value: int) -> None:
+        if value and not self._duty_cycle:
+            self.tones += 1
+        self._duty_cycle = value
+
+    def deinit(self) -> None:
+        pass
+
+
+class Event:
+    __slots__ = (
+        "key_number",
+        "pressed",
+        "timestamp",
+    )
+
+    def __init__(self, key_number: int = 0, pressed: bool = True, timestamp: int = 0):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = timestamp
+
+    @property
+    def released(self) -> bool:
+        return not self.pressed
+
+    def __repr__(self) -> str:
+        state = "pressed" if self.pressed else "released"
+        return f"<Event: key_number {self.key_number} {state}>"
+
+
+class EventQueue:
+    """
+    Scripted keypad queue: events move from the script into the queue once
+    the simulated time reaches them, and overflow past `max_events`.
+    """
+
+    def __init__(self, max_events: int) -> None:
+        self.max_events = max_events
+        self.clock: SimulatedTime | None = None
+        self._script: list[Event] = []
+        self._queue: deque[Event] = deque()
+        self._overflowed = False
+
+    def schedule(self, events: Iterable[Event]) -> None:
+        self._script.extend(events)
+        self._script.sort(key=lambda e: e.timestamp)
+
+    def _collect(self) -> None:
+        if self.clock is None:
+            return
+        now = self.clock.value
+        while self._script and self._script[0].timestamp <= now:
+            event = self._script.pop(0)
+            if len(self._queue) < self.max_events:
+                self._queue.append(event)
+            else:
+                self._overflowed = True
+
+    def get(self) -> Event | None:
+        self._collect()
+        if self._queue:
+            return self._queue.popleft()
+        return None
+
+    def get_into(self, event: Event) -> bool:
+        if e := self.get():
+            event.key_number = e.key_number
+            event.pressed = e.pressed
+            event.timestamp = e.timestamp
+            return True
+        return False
+
+    def clear(self) -> None:
+        self._queue.clear()
+        self._overflowed = False
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __len__(self) -> int:
+        self._collect()
+        return len(self._queue)
+
+    @property
+    def overflowed(self) -> bool:
+        return self._overflowed
+
+    @property
+    def pending(self) -> int:
+        return len(self._script) + len(self._queue)
+
+
+class KeyMatrix:
+    def __init__(
+        self,
+        row_pins: tuple[Pin, ...],
+        column_pins: tuple[Pin, ...],
+        columns_to_anodes: bool = True,
+        interval: float = 0.02,
+        max_events: int = 64,
+        **_: Any,
+    ) -> None:
+        self.key_count = len(row_pins) * len(column_pins)
+        self.interval = interval
+        self.events = EventQueue(max_events)
+
+    def reset(self) -> None:
+        self.events.clear()
+
+    def deinit(self) -> None:
+        pass
+
+
+class BluetoothError(Exception):
+    pass
+
+
+class HIDDevice:
+    """`usb_hid.Device` stand-in that records every report with its time."""
+
+    def __init__(self, usage_page: int, usage: int) -> None:
+        self.usage_page = usage_page
+        self.usage = usage
+        self.clock: SimulatedTime | None = None
+        self.reports: list[tuple[int, bytes]] = []
+
+    def send_report(self, report: bytes, report_id: int | None = None) -> None:
+        now = self.clock.value if self.clock else 0
+        self.reports.append((now, bytes(report)))
+
+
+class HIDService:
+    def __init__(self) -> None:
+        self.keyboard = HIDDevice(0x01, 0x06)
+        self.mouse = HIDDevice(0x01, 0x02)
+        self.consumer_control = HIDDevice(0x0C, 0x01)
+        self.devices = [self.keyboard, self.mouse, self.consumer_control]
+
+
+def _module(name: str, **attributes: Any) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def _fallback_module(name: str, **attributes: Any) -> types.ModuleType:
+    """Module whose unmodeled attributes resolve to mocks."""
+    module = _module(name, **attributes)
+    fallback = MagicMock(name=name)
+
+    def __getattr__(attr: str) -> Any:
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(fallback, attr)
+
+    module.__getattr__ = __getattr__  # type: ignore
+    return module
+
+
+def build_modules() -> dict[str, types.ModuleType]:
+    board = _module("board", board_id="simulator")
+    board.__getattr__ = _board_getattr  # type: ignore
+    return {
+        "board": board,
+        "digitalio": _module(
+            "digitalio",
+            DigitalInOut=DigitalInOut,
+            Direction=Direction,
+            Pull=Pull,
+        ),
+        "analogio": _module("analogio", AnalogIn=AnalogIn),
+        "rotaryio": _module("rotaryio", IncrementalEncoder=IncrementalEncoder),
+        "pwmio": _module("pwmio", PWMOut=PWMOut),
+        "keypad": _module(
+            "keypad",
+            Event=Event,
+            EventQueue=EventQueue,
+            KeyMatrix=KeyMatrix,
+        ),
+        "usb_hid": _module("usb_hid", Device=HIDDevice, devices=[]),
+        "storage": _module("storage", remount=lambda *_, **__: None),
+        "_bleio": _fallback_module("_bleio", BluetoothError=BluetoothError),
+    }
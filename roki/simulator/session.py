@@ -0,0 +1,427 @@
+"""
+End-to-end firmware simulation: a `Primary` and a `Secondary` half run their
+real `run_main_loop` on CPython, wired through simulated hardware and a
+loopback BLE link.
+
+Both halves run in their own thread but take strict turns on every scheduler
+tick (secondary first), so a session is repeatable: latencies are reported in
+simulated milliseconds, while loop rate is measured on the host clock.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from statistics import mean, median
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Literal, Sequence
+from unittest.mock import patch
+
+from roki.simulator.hardware import Event, build_modules
+
+if TYPE_CHECKING:
+    from roki.firmware.config import Config
+    from roki.firmware.kb import Roki
+    from roki.simulator.ble import Link
+    from roki.simulator.hardware import HIDService
+
+Side = Literal["primary", "secondary"]
+
+DEFAULT_CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "firmware", "config.json"
+)
+
+ROW_PINS = ("P0_24", "P1_00", "P0_11", "P1_04", "P1_06")
+COLUMN_PINS = ("P0_09", "P0_10", "P1_11", "P1_13", "P1_15", "P0_02")
+
+
+class LockstepClock:
+    """
+    Simulated time shared by several threads that take turns every tick.
+
+    Each party gets a view with the `Clock` interface: `now` blocks until it
+    is that party's turn, `advance` hands the turn to the next party. Time
+    moves by `step` ms once every active party has ticked.
+    """
+
+    def __init__(self, step: int = 1, parties: int = 2, timeout: float = 10.0):
+        self.value = 0
+        self.step = step
+        self.parties = parties
+        self.timeout = timeout
+        self.busy_ns = [0] * parties
+        self._turn = 0
+        self._active = set(range(parties))
+        self._started_ns = 0
+        self._condition = threading.Condition()
+
+    def view(self, index: int) -> "LockstepClockView":
+        return LockstepClockView(self, index)
+
+    def wait(self, index: int) -> int:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._turn == index, self.timeout):
+                raise RuntimeError("Simulation stalled waiting for its turn")
+            if not self._started_ns:
+                self._started_ns = time.perf_counter_ns()
+            return self.value
+
+    def advance(self, index: int) -> None:
+        with self._condition:
+            if self._turn != index:
+                return
+            if self._started_ns:
+                self.busy_ns[index] += time.perf_counter_ns() - self._started_ns
+                self._started_ns = 0
+            self._pass_turn(index)
+            self._condition.notify_all()
+
+    def leave(self, index: int) -> None:
+        with self._condition:
+            self._active.discard(index)
+            if self._turn == index:
+                self._started_ns = 0
+                self._pass_turn(index)
+            self._condition.notify_all()
+
+    def _pass_turn(self, index: int) -> None:
+        turn = index
+        for _ in range(self.parties):
+            turn = (turn + 1) % self.parties
+            if turn == 0:
+                self.value += self.step
+            if turn in self._active:
+                break
+        self._turn = turn
+
+
+class LockstepClockView:
+    __slots__ = (
+        "clock",
+        "index",
+    )
+
+    def __init__(self, clock: LockstepClock, index: int) -> None:
+        self.clock = clock
+        self.index = index
+
+    def now(self) -> int:
+        return self.clock.wait(self.index)
+
+    def advance(self) -> None:
+        self.clock.advance(self.index)
+
+
+class LockstepClockReader:
+    """
+    Shared time for the firmware timers, read during the party's own turn so
+    it does not wait for one like `LockstepClockView`.
+    """
+
+    __slots__ = ("clock",)
+
+    def __init__(self, clock: LockstepClock) -> None:
+        self.clock = clock
+
+    def now(self) -> int:
+        return self.clock.value
+
+    def advance(self) -> None:
+        pass
+
+
+@dataclass
+class SimulationReport:
+    ticks: int
+    step_ms: int
+    wall_time_s: float
+    busy_time_s: dict[str, float]
+    messages_sent: int
+    messages_received: int
+    messages_dropped: int
+    connection_events: int
+    hid_reports: int
+    key_presses: int
+    latencies_ms: dict[str, list[int]] = field(default_factory=dict)
+
+    @property
+    def loop_rate_hz(self) -> dict[str, float]:
+        return {
+            side: (self.ticks / busy if busy else 0.0)
+            for side, busy in self.busy_time_s.items()
+        }
+
+    def latency_summary(self, side: Side) -> tuple[float, float, float]:
+        values = self.latencies_ms.get(side) or [0]
+        return min(values), median(values), max(values)
+
+    def format(self) -> str:
+        lines = [
+            f"Simulated time: {self.ticks * self.step_ms} ms "
+            f"({self.ticks} ticks of {self.step_ms} ms)",
+            f"Host wall time: {self.wall_time_s:.3f} s",
+        ]
+        for side, rate in self.loop_rate_hz.items():
+            lines.append(f"Loop rate ({side}): {rate:,.0f} ticks/s")
+        lines.append(
+            f"BLE messages: {self.messages_sent} sent, "
+            f"{self.messages_received} received, {self.messages_dropped} dropped"
+        )
+        lines.append(f"BLE connection events: {self.connection_events}")
+        lines.append(f"HID reports: {self.hid_reports}")
+        lines.append(f"Key presses: {self.key_presses}")
+        for side, values in self.latencies_ms.items():
+            if not values:
+                continue
+            low, mid, high = self.latency_summary(side)  # type: ignore
+            lines.append(
+                f"Latency ({side}): min {low} ms, median {mid} ms, "
+                f"mean {mean(values):.2f} ms, max {high} ms "
+                f"({len(values)} samples)"
+            )
+        return "\n".join(lines)
+
+
+class Simulator:
+    """
+    Script inputs for both halves, then `run` a session.
+
+    Times are simulated milliseconds from the start of the main loop.
+    """
+
+    def __init__(
+        self,
+        ticks: int = 1000,
+        step: int = 1,
+        extras: bool = False,
+        config_path: str = DEFAULT_CONFIG,
+        packets_per_event: int = 1,
+        buffer_size: int = 8,
+        **roki_options: Any,
+    ) -> None:
+        self.ticks = ticks
+        self.step = step
+        self.extras = extras
+        self.config_path = config_path
+        self.packets_per_event = packets_per_event
+        self.buffer_size = buffer_size
+        self.roki_options = roki_options
+        self.events: dict[Side, list[Event]] = {"primary": [], "secondary": []}
+        self.thumb_stick: dict[Side, list[tuple[int, int, int]]] = {
+            "primary": [],
+            "secondary": [],
+        }
+        self.encoder: dict[Side, list[tuple[int, int]]] = {
+            "primary": [],
+            "secondary": [],
+        }
+
+    def tap(self, side: Side, key_number: int, at: int, hold: int = 30) -> None:
+        self.events[side].append(Event(key_number, True, at))
+        self.events[side].append(Event(key_number, False, at + hold))
+
+    def roll(
+        self,
+        side: Side,
+        key_numbers: Sequence[int],
+        start: int = 0,
+        gap: int = 10,
+        hold: int = 30,
+    ) -> None:
+        for i, key_number in enumerate(key_numbers):
+            self.tap(side, key_number, start + i * gap, hold)
+
+    def tilt(self, side: Side, at: int, x: int, y: int) -> None:
+        self.thumb_stick[side].append((at, x, y))
+
+    def turn(self, side: Side, at: int, position: int) -> None:
+        self.encoder[side].append((at, position))
+
+    def run(self) -> SimulationReport:
+        with ExitStack() as stack:
+            stack.enter_context(patch.dict(sys.modules, build_modules()))
+            return self._run(stack)
+
+    def _run(self, stack: ExitStack) -> SimulationReport:
+        import adafruit_hid
+
+        from roki.firmware import buzzer, calibration, kb, keys
+        from roki.firmware.config import Config
+        from roki.simulator import hardware
+        from roki.simulator.ble import Advertisement, Link, Radio
+        from roki.simulator.calibration import SimCalibration
+
+        clock = LockstepClock(self.step)
+        link = Link(
+            clock,
+            packets_per_event=self.packets_per_event,
+            buffer_size=self.buffer_size,
+        )
+
+        for target, name, value in (
+            (adafruit_hid, "Device", None),
+            (buzzer, "time", SimpleNamespace(sleep=lambda _: None)),
+            (calibration, "time", SimpleNamespace(sleep=lambda _: None)),
+            (kb, "_bleio", sys.modules["_bleio"]),
+            (kb, "board", sys.modules["board"]),
+            (kb, "rotaryio", sys.modules["rotaryio"]),
+            (kb, "AnalogIn", hardware.AnalogIn),
+            (kb, "DigitalInOut", hardware.DigitalInOut),
+            (kb, "Event", hardware.Event),
+            (kb, "KeyMatrix", hardware.KeyMatrix),
+            (kb, "PWMOut", hardware.PWMOut),
+            (kb, "StepClock", lambda *_: LockstepClockReader(clock)),
+            (kb, "BLERadio", lambda: Radio(link)),
+            (kb, "RokiService", link.peripheral_service),
+            (kb, "DeviceInfoService", lambda **_: None),
+            (kb, "Advertisement", Advertisement),
+            (kb, "ProvideServicesAdvertisement", Advertisement),
+            (keys, "HIDService", hardware.HIDService),
+            (keys, "hid", None),
+            (keys, "kb", None),
+            (keys, "mouse", None),
+            (keys, "media", None),
+            (keys, "lh", None),
+        ):
+            stack.enter_context(patch.object(target, name, value))
+
+        with open(self.config_path) as file:
+            config = Config(layers=json.load(file).get("layers", []))
+        config.extras = self.extras
+
+        hid: "HIDService" = keys.hid  # type: ignore
+        for device in hid.devices:
+            device.clock = clock
+
+        halves: dict[Side, "Roki"] = {
+            "secondary": self._build(kb.Secondary, config, clock, 0, SimCalibration),
+            "primary": self._build(kb.Primary, config, clock, 1, SimCalibration),
+        }
+
+        errors: list[BaseException] = []
+
+        def target(roki: "Roki", index: int) -> None:
+            try:
+                roki.run_main_loop()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                clock.leave(index)
+
+        threads = [
+            threading.Thread(target=target, args=(roki, index), daemon=True)
+            for index, roki in enumerate(halves.values())
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - started
+
+        if errors:
+            raise errors[0]
+
+        return self._report(config, hid, link, clock, wall_time)
+
+    def _build(
+        self,
+        cls: type["Roki"],
+        config: "Config",
+        clock: LockstepClock,
+        index: int,
+        calibration_class: type,
+    ) -> "Roki":
+        side: Side = "secondary" if index == 0 else "primary"
+        options = {
+            "interval": self.step / 1000,
+            "max_events": 16,
+            **self.roki_options,
+        }
+        roki = cls(
+            config=config,
+            row_pins=ROW_PINS,
+            column_pins=COLUMN_PINS,
+            buzzer_pin="P0_06",
+            thumb_stick_pins=("P0_22", "AIN7", "AIN5"),
+            encoder_pins=("P0_17", "P0_20"),
+            calibration_class=calibration_class,
+            max_iterations_main_loop=1,
+            max_iterations_ble=self.ticks,
+            **options,
+        )
+        roki.scheduler.clock = clock.view(index)
+        # run_main_loop skips the calibration step of run()
+        roki.calibration.read()
+
+        events = roki.key_matrix.events
+        events.clock = clock  # type: ignore
+        events.schedule(self.events[side])  # type: ignore
+
+        for axis in ("x", "y"):
+            getattr(roki, f"thumb_stick_{axis}").timeline.clock = clock
+        for at, x, y in self.thumb_stick[side]:
+            roki.thumb_stick_x.timeline.set(at, x)  # type: ignore
+            roki.thumb_stick_y.timeline.set(at, y)  # type: ignore
+
+        roki.encoder.timeline.clock = clock
+        for at, position in self.encoder[side]:
+            roki.encoder.timeline.set(at, position)
+        return roki
+
+    def _report(
+        self,
+        config: "Config",
+        hid: "HIDService",
+        link: "Link",
+        clock: LockstepClock,
+        wall_time: float,
+    ) -> SimulationReport:
+        latencies: dict[str, list[int]] = {}
+        key_presses = 0
+        for side, events in self.events.items():
+            keys = getattr(config.layers[0], f"{side}_keys")
+            latencies[side] = []
+            for event in events:
+                if not event.pressed:
+                    continue
+                key_presses += 1
+                latency = self._latency(keys[event.key_number], event.timestamp, hid)
+                if latency is not None:
+                    latencies[side].append(latency)
+
+        return SimulationReport(
+            ticks=self.ticks,
+            step_ms=self.step,
+            wall_time_s=wall_time,
+            busy_time_s={
+                "secondary": clock.busy_ns[0] / 1e9,
+                "primary": clock.busy_ns[1] / 1e9,
+            },
+            messages_sent=link.to_primary.sent,
+            messages_received=link.to_primary.delivered,
+            messages_dropped=link.to_primary.dropped,
+            connection_events=link.to_primary.events,
+            hid_reports=sum(len(device.reports) for device in hid.devices),
+            key_presses=key_presses,
+            latencies_ms=latencies,
+        )
+
+    def _latency(self, key: Any, at: int, hid: "HIDService") -> int | None:
+        from adafruit_hid.keycode import Keycode
+
+        from roki.firmware.keys import KeyboardKey
+
+        if not isinstance(key, KeyboardKey):
+            return None
+
+        modifier = Keycode.modifier_bit(key.key_code)
+        for when, report in hid.keyboard.reports:
+            if when < at:
+                continue
+            if (modifier and report[0] & modifier) or key.key_code in report[2:]:
+                return when - at
+        return None
@@ -1,3 +1,4 @@
+import os
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -105,6 +106,16 @@ def mock_generate():
         yield m
 
 
+@pytest.fixture(autouse=True)
+def mock_soft_reload():
+    with (
+        patch("roki.cli.app.get_serial_device") as m_port,
+        patch("roki.cli.app.soft_reload") as m,
+    ):
+        m_port.return_value = "/dev/ttyACM0"
+        yield m
+
+
 @pytest.fixture(autouse=True)
 def mock_uvicorn():
     with patch("roki.cli.app.uvicorn") as m:
@@ -142,6 +153,7 @@ def test_app_upload(
     mock_create_mount_point: MagicMock,
     mock_install_circuitpython_libs: MagicMock,
     mock_unmount: MagicMock,
+    mock_soft_reload: MagicMock,
 ):
     side = "right"
     result = runner.invoke(app, ["upload", "--side", side])
@@ -157,6 +169,20 @@ def test_app_upload(
     mock_unmount.assert_called()
     mock_create_mount_point.assert_called()
     mock_get_devices.assert_called()
+    mock_soft_reload.assert_called_once_with("/dev/ttyACM0")
+
+
+def test_app_upload_deletes_stale_keymap(
+    runner: CliRunner,
+    app: typer.Typer,
+    mock_get_devices: MagicMock,
+    mock_delete_file: MagicMock,
+):
+    result = runner.invoke(app, ["upload", "--side", "right", "--no-default-config"])
+
+    assert result.exit_code == 0
+    deleted = [os.path.basename(c.args[0]) for c in mock_delete_file.call_args_list]
+    assert "keymap-right.bin" in deleted
 
 
 def test_app_upload_no_devices(
@@ -265,3 +291,87 @@ def test_app_config(
 
     assert result.exit_code == 0
     mock_config_run.assert_called()
+
+
+def test_app_simulate(
+    runner: CliRunner,
+    app: typer.Typer,
+):
+    result = runner.invoke(app, ["simulate", "--ticks", "200", "--keys", "4"])
+
+    assert result.exit_code == 0
+    assert "Latency (secondary)" in result.stdout
+
+
+def test_app_probes_from_file(
+    runner: CliRunner,
+    app: typer.Typer,
+    tmp_path,
+):
+    log = tmp_path / "serial.log"
+    log.write_text("Running...\n#probe key_press 2 30 20 0,0,0,0,1,1\n")
+
+    result = runner.invoke(app, ["probes", "--file", str(log)])
+
+    assert result.exit_code == 0
+    assert "key_press: 2 samples" in result.stdout
+
+
+def test_app_compile(
+    runner: CliRunner,
+    app: typer.Typer,
+    tmp_path,
+):
+    result = runner.invoke(app, ["compile", "--output", str(tmp_path)])
+
+    assert result.exit_code == 0
+    assert (tmp_path / "keymap-left.bin").exists()
+    assert (tmp_path / "keymap-right.bin").exists()
+
+
+def test_app_compile_invalid(
+    runner: CliRunner,
+    app: typer.Typer,
+    tmp_path,
+):
+    config = tmp_path / "config.json"
+    config.write_text('{"layers": [{"primary_keys": [["NOPE"]]}]}')
+
+    result = runner.invoke(
+        app, ["compile", "--config", str(config), "--output", str(tmp_path)]
+    )
+
+    assert result.exit_code != 0
+    assert not (tmp_path / "keymap-left.bin").exists()
+
+
+def test_app_push(
+    runner: CliRunner,
+    app: typer.Typer,
+    tmp_path,
+):
+    config = tmp_path / "config.json"
+    config.write_text('{\n  "layers": []\n}')
+
+    with patch("roki.cli.app.push_config") as m:
+        result = runner.invoke(
+            app, ["push", "--config", str(config), "--port", "/dev/ttyACM0"]
+        )
+
+    assert result.exit_code == 0
+    m.assert_called_once_with("/dev/ttyACM0", b'{"layers":[]}')
+
+
+def test_app_push_invalid(
+    runner: CliRunner,
+    app: typer.Typer,
+    tmp_path,
+):
+    config = tmp_path / "config.json"
+    config.write_text("{")
+
+    with patch("roki.cli.app.push_config") as m:
+        result = runner.invoke(app, ["push", "--config", str(config), "--port", "x"])
+
+    assert result.exit_code == 1
+    m.assert_not_called()
@@ -0,0 +1,200 @@
+import json
+
+import pytest
+
+from roki.cli.compiler import (
+    CompileError,
+    compile_config,
+    compile_keymap,
+    firmware_modules,
+    validate_config,
+)
+
+
+@pytest.fixture
+def config() -> dict:
+    with open("roki/firmware/config.json") as f:
+        return json.load(f)
+
+
+def test_validate_config(config: dict):
+    assert validate_config(config) == []
+
+
+def test_validate_config_errors(config: dict):
+    layer = config["layers"][0]
+    layer["primary_keys"][0][1] = "NOT_A_KEY"
+    layer["secondary_keys"][1][0] = "LAYER_9_HOLD"
+    layer["primary_encoder"] = ["MUTE"]
+
+    errors = validate_config(config)
+
+    assert len(errors) == 3
+    assert "primary_keys[0][1] unknown key 'NOT_A_KEY'" in errors[1]
+    assert "missing layer 9" in errors[2]
+    assert validate_config({}) == ["'layers' must be a non-empty list"]
+
+
+def test_compile_keymap_invalid(config: dict):
+    config["layers"][0]["primary_keys"][0][0] = "NOPE"
+
+    with pytest.raises(CompileError) as e:
+        compile_keymap(config, is_left_side=True)
+
+    assert len(e.value.errors) == 1
+
+
+@pytest.mark.parametrize("is_left_side", [True, False])
+def test_compile_keymap_round_trip(config: dict, is_left_side: bool):
+    keymap = compile_keymap(config, is_left_side)
+
+    with firmware_modules():
+        from roki.firmware.config import (
+            KeyTable,
+            load_keymap,
+            parse_color,
+            side_key_names,
+        )
+
+        layers, combos, macros = load_keymap(keymap)
+        assert combos == []
+        assert macros == []
+
+        assert len(layers) == len(config["layers"])
+        for layer, data in zip(layers, config["layers"]):
+            primary, secondary, encoders = side_key_names(data, is_left_side)
+            assert layer.name == data["name"]
+            assert layer.color == parse_color(data["color"])
+            for table, names in (
+                (layer.primary_keys, primary),
+                (layer.secondary_keys, secondary),
+                (layer.encoders, encoders),
+            ):
+                expected = KeyTable.from_names(names)
+                assert table.kinds == expected.kinds
+                assert table.codes == expected.codes
+
+
+def test_load_keymap_invalid():
+    with firmware_modules():
+        from roki.firmware.config import load_keymap
+
+        with pytest.raises(ValueError):
+            load_keymap(b"{}")
+
+
+def test_compile_config(tmp_path):
+    written = compile_config("roki/firmware/config.json", str(tmp_path))
+
+    assert [p.rsplit("/", 1)[-1] for p in written] == [
+        "keymap-left.bin",
+        "keymap-right.bin",
+    ]
+    assert (tmp_path / "keymap-left.bin").read_bytes().startswith(b"RKM")
+
+
+def test_compile_keymap_tap_hold(config: dict):
+    layer = config["layers"][0]
+    layer["primary_keys"][2][1] = "A|LEFT_CONTROL"
+    layer["primary_keys"][2][2] = "S|LAYER_1_HOLD"
+    assert validate_config(config) == []
+
+    keymap = compile_keymap(config, is_left_side=False)
+
+    with firmware_modules():
+        from roki.firmware.config import KeyTable, load_keymap, side_key_names
+        from roki.firmware.keys import TAP_HOLD, encode, tap_holds
+
+        table = load_keymap(keymap)[0][0].secondary_keys
+        expected = KeyTable.from_names(side_key_names(layer, False)[1])
+        assert table.kinds == expected.kinds
+        assert table.codes == expected.codes
+
+        kind, code = encode("A|LEFT_CONTROL")
+        assert kind == TAP_HOLD
+        assert tap_holds[code] == encode("A") + encode("LEFT_CONTROL")
+
+
+def test_validate_config_tap_hold_errors(config: dict):
+    layer = config["layers"][0]
+    layer["primary_keys"][2][1] = "A|NOPE"
+    layer["primary_keys"][2][2] = "A|B|C"
+
+    errors = validate_config(config)
+
+    assert len(errors) == 2
+    assert "unknown key 'NOPE'" in errors[0]
+    assert "more than 2 roles" in errors[1]
+
+
+def test_compile_keymap_combos(config: dict):
+    config["combos"] = [
+        {"keys": ["J", "K"], "key": "ESCAPE"},
+        {"keys": ["A", "S"], "key": "LAYER_1_HOLD"},
+    ]
+    assert validate_config(config) == []
+
+    keymap = compile_keymap(config, is_left_side=True)
+
+    with firmware_modules():
+        from roki.firmware.config import load_keymap, parse_combos
+
+        _, combos, _ = load_keymap(keymap)
+        assert combos == parse_combos(config["combos"], config["layers"], True)
+
+
+def test_validate_config_combo_errors(config: dict):
+    config["combos"] = [
+        {"keys": ["J"], "key": "ESCAPE"},
+        {"keys": ["J", "NOPE"], "key": "NOT_A_KEY"},
+    ]
+
+    errors = validate_config(config)
+
+    assert len(errors) == 3
+    assert "at least 2 keys" in errors[0]
+    assert "'NOPE' is not on the base layer" in errors[1]
+    assert "unknown key 'NOT_A_KEY'" in errors[2]
+
+
+def test_validate_config_combo_on_encoder(config: dict):
+    encoder = config["layers"][0]["primary_encoder"][0]
+    config["combos"] = [{"keys": ["J", encoder], "key": "ESCAPE"}]
+
+    errors = validate_config(config)
+
+    assert errors == [f"combo 0: {encoder!r} is not on the base layer"]
+
+
+def test_compile_keymap_macros(config: dict):
+    config["macros"] = ["hello", ["LEFT_CONTROL+C", "ENTER"]]
+    config["layers"][0]["primary_keys"][0][0] = "MACRO_1"
+    config["layers"][0]["primary_keys"][0][1] = "MACRO_STOP"
+    assert validate_config(config) == []
+
+    keymap = compile_keymap(config, is_left_side=True)
+
+    with firmware_modules():
+        from roki.firmware.config import load_keymap
+        from roki.firmware.keys import MACRO, MACRO_STOP
+        from roki.firmware.macros import compile_macro
+
+        layers, _, macros = load_keymap(keymap)
+        assert macros == [compile_macro(macro) for macro in config["macros"]]
+        # left side rows are mirrored
+        keys = layers[0].primary_keys
+        assert (keys.kinds[5], keys.codes[5]) == (MACRO, 1)
+        assert (keys.kinds[4], keys.codes[4]) == (MACRO, MACRO_STOP)
+
+
+def test_validate_config_macro_errors(config: dict):
+    config["macros"] = ["héllo", ["LEFT_CONTROL+NOPE"], 3]
+    config["layers"][0]["primary_keys"][0][0] = "MACRO_5"
+
+    errors = validate_config(config)
+
+    assert len(errors) == 4
+    assert "missing macro 5" in errors[0]
+    assert "only ASCII" in errors[1]
+    assert "unknown key 'NOPE'" in errors[2]
+    assert "string or a list" in errors[3]
@@ -0,0 +1,49 @@
+from roki.cli.probes import (
+    bucket_label,
+    format_histograms,
+    parse_probe_line,
+    parse_probe_lines,
+)
+
+
+def test_parse_probe_line():
+    histogram = parse_probe_line("#probe matrix 3 12 8 0,1,0,2\r\n")
+
+    assert histogram is not None
+    assert histogram.name == "matrix"
+    assert histogram.count == 3
+    assert histogram.counts == [0, 1, 0, 2]
+    assert histogram.mean == 4.0
+    assert histogram.percentile(0.5) == 8
+
+
+def test_parse_probe_line_ignores_other_output():
+    assert parse_probe_line("[   INFO   ] Running...") is None
+    assert parse_probe_line("#probe broken") is None
+
+
+def test_parse_probe_lines_keeps_latest():
+    histograms = parse_probe_lines(
+        [
+            "#probe matrix 1 1 1 0,1",
+            "noise",
+            "#probe matrix 2 2 1 0,2",
+        ]
+    )
+
+    assert histograms["matrix"].count == 2
+
+
+def test_bucket_label():
+    assert bucket_label(0, 4) == "0 us"
+    assert bucket_label(2, 4) == "2-3 us"
+    assert bucket_label(3, 4) == ">= 4 us"
+
+
+def test_format_histograms():
+    assert format_histograms({}) == "No probe data found."
+
+    output = format_histograms(parse_probe_lines(["#probe ble_send 4 10 4 0,2,2"]))
+
+    assert "ble_send: 4 samples" in output
+    assert "1-1 us" in output
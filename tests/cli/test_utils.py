@@ -1,6 +1,6 @@
 import json
 from textwrap import dedent
-from unittest.mock import MagicMock, mock_open, patch
+from unittest.mock import MagicMock, call, mock_open, patch
 
 import pytest
 
@@ -172,3 +172,23 @@ def test_replace_params(python_code: str):
                 debug=False,
             )""").strip()
     )
+
+
+def test_soft_reload():
+    from roki.cli.utils import soft_reload
+
+    with patch("serial.Serial") as m:
+        soft_reload("/dev/ttyACM0")
+
+    conn = m.return_value.__enter__.return_value
+    assert conn.write.call_args_list == [call(b"\x03"), call(b"\x04")]
+
+
+def test_push_config():
+    from roki.cli.utils import push_config
+
+    with patch("serial.Serial") as m:
+        push_config("/dev/ttyACM0", b'{"layers":[]}')
+
+    conn = m.return_value.__enter__.return_value
+    conn.write.assert_called_once_with(b'\x02{"layers":[]}\x03')
@@ -2,6 +2,8 @@ from unittest.mock import MagicMock, mock_open, patch
 
 import pytest
 
+from roki.firmware.scheduler import StepClock, TimerWheel
+
 
 @pytest.fixture(autouse=True)
 def mock_config_json():
@@ -28,3 +30,24 @@ def mock_hid_service(mock_find_device: tuple[MagicMock, MagicMock, MagicMock]):
     with patch("roki.firmware.keys.HIDService") as m:
         m.return_value = mm
         yield m
+
+
+@pytest.fixture
+def calls() -> list:
+    return []
+
+
+@pytest.fixture
+def send(calls: list):
+    """Records the keys sent by tap-hold and combos as `(code, pressed)`."""
+    return lambda kind, code, pressed: calls.append((code, pressed))
+
+
+@pytest.fixture
+def clock() -> StepClock:
+    return StepClock(step=10)
+
+
+@pytest.fixture
+def timers(clock: StepClock) -> TimerWheel:
+    return TimerWheel(clock.now())
@@ -0,0 +1,61 @@
+def test_linear_table():
+    from roki.firmware.acceleration import Acceleration
+
+    acceleration = Acceleration(speed=10)
+
+    assert acceleration.table[0] == 0
+    assert acceleration.table[127] == 10 << 8
+    assert acceleration.move(127, -127) == (10, -10)
+
+
+def test_curve_slows_small_deflections():
+    from roki.firmware.acceleration import Acceleration
+
+    linear = Acceleration(speed=10)
+    curved = Acceleration(speed=10, curve=2.0)
+
+    assert curved.table[127] == linear.table[127]
+    assert curved.table[32] < linear.table[32]
+
+
+def test_slow_movements_accumulate():
+    from roki.firmware.acceleration import Acceleration
+
+    acceleration = Acceleration(speed=10)
+    # 10 * 6 / 127 px per tick, lost when truncated every tick
+    moves = [acceleration.move(6, -6) for _ in range(10)]
+
+    assert moves[0] == (0, 0)
+    assert sum(dx for dx, _ in moves) == 4
+    assert sum(dy for _, dy in moves) == -4
+
+
+def test_center_drops_remainder():
+    from roki.firmware.acceleration import Acceleration
+
+    acceleration = Acceleration(speed=10)
+    acceleration.move(6, 6)
+    acceleration.move(0, 0)
+
+    assert (acceleration.x, acceleration.y) == (0, 0)
+
+
+def test_shared_table_keeps_own_remainders():
+    from roki.firmware.acceleration import Acceleration
+
+    first = Acceleration(speed=10)
+    second = Acceleration(table=first.table)
+
+    assert second.table is first.table
+    first.move(6, 6)
+    assert second.move(0, 0) == (0, 0)
+    assert first.x and not second.x
+
+
+def test_fast_speed_does_not_overflow():
+    from roki.firmware.acceleration import Acceleration
+    from roki.firmware.calibration import AXIS_MAX
+
+    acceleration = Acceleration(speed=1000)
+
+    assert acceleration.move(AXIS_MAX, -AXIS_MAX) == (1000, -1000)
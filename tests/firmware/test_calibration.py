@@ -129,6 +129,7 @@ def test_calibration_read(calibration: "Calibration"):
 
 
 def test_calibration_get_normalized(calibration: "Calibration"):
+    calibration.read()
     x, y = calibration.get_normalized(15, 80)
 
     assert x < 0
@@ -140,3 +141,15 @@ def test_calibration_get_normalized(calibration: "Calibration"):
     assert y < 0
 
     assert calibration.get_normalized(51, 49) == (0, 0)
+
+
+def test_calibration_get_normalized_range(calibration: "Calibration"):
+    assert calibration.get_normalized(0, 100) == (0, 0)
+
+    calibration.read()
+
+    assert calibration.get_normalized(0, 100) == (-127, 127)
+    assert calibration.get_normalized(-50, 150) == (-127, 127)
+    x, y = calibration.get_normalized(25, 75)
+    assert -65 < x < -55
+    assert 55 < y < 65
@@ -0,0 +1,145 @@
+from typing import TYPE_CHECKING
+
+import pytest
+
+from roki.firmware.scheduler import StepClock, TimerWheel
+
+if TYPE_CHECKING:
+    from roki.firmware.combos import Combos
+
+J = 1
+K = 2
+L = 3
+OTHER_KEY = 4
+# secondary half
+D = 0x100 | 1
+
+JK = 40
+JKL = 41
+JD = 42
+
+
+@pytest.fixture
+def combos(clock: StepClock, timers: TimerWheel, calls: list, send) -> "Combos":
+    from roki.firmware.combos import Combos
+    from roki.firmware.keys import KEYBOARD
+
+    return Combos(
+        clock,
+        timers,
+        [
+            ((J, K), KEYBOARD, JK),
+            ((J, K, L), KEYBOARD, JKL),
+            ((J, D), KEYBOARD, JD),
+        ],
+        lambda position, pressed: calls.append((position, pressed)),
+        term=50,
+        send=send,
+    )
+
+
+def wait(clock: StepClock, timers: TimerWheel, ms: int) -> None:
+    for _ in range(ms // clock.step):
+        clock.advance()
+        timers.update(clock.now())
+
+
+def test_combos_index(combos: "Combos"):
+    assert combos.bits == {J: 0, K: 1, L: 2, D: 3}
+    assert list(combos.masks) == [0b0011, 0b0111, 0b1001]
+    assert list(combos.combos_of) == [0b111, 0b011, 0b010, 0b100]
+
+
+def test_other_keys_pass_through(combos: "Combos", calls: list):
+    assert not combos.handle(OTHER_KEY, True)
+    assert not combos.handle(OTHER_KEY, False)
+    assert calls == []
+
+
+def test_combo_across_halves(combos: "Combos", calls: list):
+    assert combos.handle(J, True)
+    assert combos.handle(D, True)
+    assert calls == [(JD, True)]
+
+    assert combos.handle(D, False)
+    assert calls == [(JD, True), (JD, False)]
+    assert combos.handle(J, False)
+    assert len(calls) == 2
+
+
+def test_combo_waits_for_longer_candidate(
+    combos: "Combos",
+    clock: StepClock,
+    timers: TimerWheel,
+    calls: list,
+):
+    combos.handle(K, True)
+    combos.handle(J, True)
+    assert calls == []
+
+    wait(clock, timers, 50)
+    assert calls == [(JK, True)]
+
+
+def test_longer_combo(combos: "Combos", calls: list):
+    combos.handle(J, True)
+    combos.handle(K, True)
+    combos.handle(L, True)
+    assert calls == [(JKL, True)]
+
+
+def test_release_fires_matching_combo(combos: "Combos", calls: list):
+    combos.handle(J, True)
+    combos.handle(K, True)
+    combos.handle(J, False)
+    assert calls == [(JK, True), (JK, False)]
+
+    assert combos.handle(K, False)
+    assert len(calls) == 2
+
+
+def test_flush_when_no_combo_can_match(combos: "Combos", calls: list):
+    assert combos.handle(K, True)
+    assert not combos.handle(OTHER_KEY, True)
+    # replayed before the caller processes the new key
+    assert calls == [(K, True)]
+
+    combos.handle(J, True)
+    combos.handle(J, False)
+    assert calls == [(K, True), (J, True)]
+    assert combos.queued == 0
+
+
+def test_flush_when_window_expires(
+    combos: "Combos",
+    clock: StepClock,
+    timers: TimerWheel,
+    calls: list,
+):
+    combos.handle(L, True)
+    wait(clock, timers, 40)
+    assert calls == []
+
+    wait(clock, timers, 10)
+    assert calls == [(L, True)]
+    assert not combos.handle(L, False)
+
+
+def test_repeated_key_flushes(combos: "Combos", calls: list):
+    combos.handle(J, True)
+    combos.handle(J, True)
+    assert calls == [(J, True)]
+    assert combos.queued == 1
+
+
+def test_release_fired_combos(combos: "Combos", calls: list):
+    combos.handle(J, True)
+    combos.handle(D, True)
+    combos.handle(L, True)
+    assert calls == [(JD, True)]
+
+    combos.release()
+    assert calls == [(JD, True), (JD, False)]
+    assert combos.queued == 0
+    assert not combos.held
+    assert not combos.handle(J, False)
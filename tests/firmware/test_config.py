@@ -1,4 +1,4 @@
-from unittest.mock import patch
+from unittest.mock import mock_open, patch
 
 import pytest
 
@@ -81,3 +81,295 @@ def test_layer_from_dict(layer_dict: dict):
     assert isinstance(layer, Layer)
 
     print(layer)
+
+
+def test_compiled_layer_from_dict(layer_dict: dict):
+    from roki.firmware.config import (
+        PRIMARY_ENCODER_CW,
+        CompiledLayer,
+    )
+    from roki.firmware.keys import KEYBOARD, LAYER, MEDIA, NOOP
+
+    layer = CompiledLayer.from_dict(layer_dict)
+
+    assert len(layer.primary_keys) == 30
+    assert len(layer.secondary_keys) == 30
+    # left side rows are mirrored
+    assert layer.primary_keys.kinds[0] == KEYBOARD
+    assert layer.primary_keys.codes[0] == 0x22  # FIVE
+    assert layer.primary_keys.kinds[23] == LAYER
+    assert layer.secondary_keys.is_extras(5)
+    assert not layer.secondary_keys.is_extras(4)
+    assert layer.encoders.kinds[PRIMARY_ENCODER_CW] == MEDIA
+    assert NOOP not in layer.primary_keys.kinds
+
+
+def test_config_compiled(layer_dict: dict):
+    from roki.firmware.config import CompiledLayer, Config
+
+    config = Config([layer_dict, layer_dict], compiled=True)
+
+    assert config.compiled
+    assert all(isinstance(layer, CompiledLayer) for layer in config.layers)
+
+
+def test_config_read_prefers_compiled_keymap():
+    from roki.firmware.config import Config
+
+    keymap = b"RKM\x01\x00\x00"
+    with (
+        patch("roki.firmware.config._config", None),
+        patch("roki.firmware.config.os.stat"),
+        patch("builtins.open", mock_open(read_data=keymap)) as m,
+    ):
+        config = Config.read()
+
+    m.assert_called_once_with("keymap-left.bin", "rb")
+    assert config.compiled
+    assert len(config.layers) == 0
+
+
+def test_layers_share_keys(layer_dict: dict):
+    from roki.firmware.config import Layer
+
+    a = Layer.from_dict(layer_dict)
+    b = Layer.from_dict(layer_dict)
+
+    assert all(x is y for x, y in zip(a.primary_keys, b.primary_keys))
+    # "ESCAPE" is on both sides
+    assert a.primary_keys[5] is a.secondary_keys[24]
+
+
+@pytest.fixture
+def transparent_layers(layer_dict: dict) -> list[dict]:
+    top = {
+        "name": "top",
+        "primary_keys": [["TRNS", "F1"]],
+        "secondary_keys": [["TRNS"]],
+        "primary_encoder": ["TRNS", "MUTE"],
+    }
+    return [layer_dict, top]
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_config_resolves_transparent_keys(
+    transparent_layers: list[dict],
+    compiled: bool,
+):
+    from roki.firmware.config import PRIMARY_ENCODER_CCW, PRIMARY_ENCODER_CW, Config
+    from roki.firmware.keys import KEYBOARD, MEDIA, TRANSPARENT, encode
+
+    config = Config(transparent_layers, compiled=compiled)
+    assert config.layer is config.layers[0]
+
+    config.layer_index = 1
+    layer = config.layer
+    assert layer is not config.layers[1]
+    assert layer.name == "top"
+
+    # left side rows are mirrored, the transparent key falls through to "FOUR"
+    if compiled:
+        keys = layer.primary_keys
+        assert (keys.kinds[0], keys.codes[0]) == encode("F1")
+        assert (keys.kinds[1], keys.codes[1]) == encode("FOUR")
+        assert (keys.kinds[0], keys.kinds[1]) == (KEYBOARD, KEYBOARD)
+        assert layer.secondary_keys.kinds[0] == KEYBOARD
+        assert layer.encoders.kinds[PRIMARY_ENCODER_CW] == MEDIA
+        assert layer.encoders.codes[PRIMARY_ENCODER_CCW] == encode("MUTE")[1]
+        assert TRANSPARENT in config.layers[1].primary_keys.kinds
+    else:
+        base = config.layers[0]
+        assert layer.primary_keys[0].key_code == encode("F1")[1]
+        assert layer.primary_keys[1] is base.primary_keys[1]
+        assert layer.secondary_keys[0] is base.secondary_keys[0]
+        assert layer.primary_encoder_cw is base.primary_encoder_cw
+        assert layer.primary_encoder_ccw.key_code == encode("MUTE")[1]
+
+    config.layer_index = 0
+    config.layer_index = 1
+    assert config.layer is layer
+
+
+def test_transparent_key_on_base_layer_is_noop(layer_dict: dict):
+    from roki.firmware.config import Config
+    from roki.firmware.keys import TransparentKey
+
+    layer_dict["primary_keys"][0][0] = "TRNS"
+    config = Config([layer_dict])
+
+    key = config.layer.primary_keys[5]
+    assert isinstance(key, TransparentKey)
+    key.press()
+    key.release()
+
+
+def test_config_combos(layer_dict: dict):
+    from roki.firmware.config import SECONDARY_SIDE, Config
+    from roki.firmware.keys import encode
+
+    config = Config(
+        [layer_dict],
+        combos=[
+            {"keys": ["J", "K"], "key": "ESCAPE"},
+            {"keys": ["A", "J"], "key": "LAYER_1_HOLD"},
+            {"keys": ["A", "NOT_THERE"], "key": "B"},
+        ],
+    )
+
+    # left side: primary rows are mirrored, J and K are on the secondary half
+    assert config.combos == [
+        ((SECONDARY_SIDE | 13, SECONDARY_SIDE | 14), *encode("ESCAPE")),
+        ((16, SECONDARY_SIDE | 13), *encode("LAYER_1_HOLD")),
+    ]
+
+
+def test_config_macros(layer_dict: dict):
+    from roki.firmware.config import Config
+    from roki.firmware.keys import macros
+    from roki.firmware.macros import compile_macro
+
+    Config([layer_dict], macros=["hello", ["LEFT_CONTROL+C"]])
+
+    assert macros == [compile_macro("hello"), compile_macro(["LEFT_CONTROL+C"])]
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_config_reload_keeps_unchanged_layers(
+    transparent_layers: list[dict],
+    compiled: bool,
+):
+    from roki.firmware.config import Config
+
+    config = Config(transparent_layers, compiled=compiled)
+    base = config.layers[0]
+    base_only = config.layer
+    config.layer_on(1)
+
+    top = dict(transparent_layers[1], name="new top")
+    assert config.reload([transparent_layers[0], top]) == 0b10
+
+    assert config.layers[0] is base
+    assert config.is_layer_on(1)
+    assert config.layer.name == "new top"
+    # merged layers without the changed one are kept
+    assert config.resolved_layers == {0b01: base_only, 0b11: config.layer}
+
+    assert config.reload([transparent_layers[0], top]) == 0
+
+
+def test_config_signs_layers_on_first_reload(transparent_layers: list[dict]):
+    from roki.firmware.config import Config, layer_signature
+
+    with patch(
+        "roki.firmware.config.layer_signature", side_effect=layer_signature
+    ) as m:
+        config = Config(transparent_layers)
+        m.assert_not_called()
+
+        config.reload(transparent_layers)
+        # the current and the new layers
+        assert m.call_count == 2 * len(transparent_layers)
+
+        config.reload(transparent_layers)
+        assert m.call_count == 3 * len(transparent_layers)
+
+
+def test_config_reload_fewer_layers(transparent_layers: list[dict]):
+    from roki.firmware.config import Config
+
+    config = Config(transparent_layers, combos=[{"keys": ["J", "K"], "key": "B"}])
+    config.set_default_layer(1)
+    config.layer_on(1)
+
+    assert config.reload(transparent_layers[:1]) == 0b10
+    assert config.layer_index == 0
+    assert config.layer is config.layers[0]
+    assert config.combos == []
+
+
+def test_config_reload_bad_macro_keeps_config(transparent_layers: list[dict]):
+    from roki.firmware.config import Config
+
+    config = Config(transparent_layers, combos=[{"keys": ["J", "K"], "key": "B"}])
+    layers = config.layers
+    combos = config.combos
+    top = dict(transparent_layers[1], name="new top")
+
+    with pytest.raises(AttributeError):
+        config.reload([transparent_layers[0], top], [], [[1]])
+
+    assert config.layers is layers
+    assert config.layers[1].name != "new top"
+    assert config.combos is combos
+
+
+def test_config_reload_keymap(transparent_layers: list[dict]):
+    from roki.firmware.config import Config
+
+    config = Config(transparent_layers, compiled=True)
+
+    assert config.reload_keymap(b"RKM\x01\x00\x00") == 0b11
+    assert len(config.layers) == 0
+
+
+def test_layers_are_built_when_used(transparent_layers: list[dict]):
+    from roki.firmware.config import Config
+
+    config = Config(transparent_layers)
+    assert config.layers.resident[1] is None
+
+    config.layer_on(1)
+    assert config.layers.resident[1] is not None
+    assert config.layer.name == "top"
+
+
+def test_lazy_layers_evict_least_recently_used(layer_dict: dict):
+    from unittest.mock import MagicMock
+
+    from roki.firmware.config import LazyLayers, Layer
+
+    layers = LazyLayers([layer_dict] * 3, Layer.from_dict, max_resident=2)
+    layers.on_evict = MagicMock()
+    first = layers[0]
+    layers[1]
+    assert layers[0] is first
+
+    layers[2]
+    layers.on_evict.assert_called_once_with(1)
+    assert layers.used == [0, 2]
+
+    # active layers stay
+    layers.pinned = 0b101
+    layers[1]
+    assert layers.used == [0, 2, 1]
+
+
+def test_config_evicts_inactive_layers(layer_dict: dict):
+    from roki.firmware.config import Config
+    from roki.firmware.params import Params
+
+    with patch.object(Params(), "MAX_RESIDENT_LAYERS", 2):
+        config = Config([layer_dict, dict(layer_dict, name="1"), layer_dict])
+
+    config.layer_move(1)
+    assert 0b11 in config.resolved_layers
+
+    config.layer_move(2)
+    assert config.layers.resident[1] is None
+    assert 0b11 not in config.resolved_layers
+    assert config.layer is config.layers[2]
+
+
+def test_config_reload_keeps_active_layers_resident(layer_dict: dict):
+    from roki.firmware.config import Config
+    from roki.firmware.params import Params
+
+    layers = [layer_dict, dict(layer_dict, name="1"), dict(layer_dict, name="2")]
+    with patch.object(Params(), "MAX_RESIDENT_LAYERS", 2):
+        config = Config(layers)
+    config.layer_on(1)
+    active = config.layers[0], config.layers[1]
+
+    config.reload([*layers[:2], dict(layer_dict, name="new 2")])
+
+    assert (config.layers.resident[0], config.layers.resident[1]) == active
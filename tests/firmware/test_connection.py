@@ -0,0 +1,66 @@
+from typing import TYPE_CHECKING
+from unittest.mock import MagicMock
+
+import pytest
+
+if TYPE_CHECKING:
+    from roki.firmware.connection import ConnectionTuner
+
+
+@pytest.fixture
+def connection() -> MagicMock:
+    connection = MagicMock()
+    connection.connected = True
+    connection.connection_interval = 7.5
+    return connection
+
+
+@pytest.fixture
+def tuner(connection: MagicMock) -> "ConnectionTuner":
+    from roki.firmware.connection import ConnectionTuner
+
+    tuner = ConnectionTuner(7.5, 30.0, idle_after=100)
+    tuner.attach(connection, 0)
+    return tuner
+
+
+def test_idle_then_active(tuner: "ConnectionTuner", connection: MagicMock):
+    tuner.update(99)
+    assert connection.connection_interval == 7.5
+
+    tuner.update(100)
+    assert connection.connection_interval == 30.0
+    assert tuner.interval == 30.0
+
+    tuner.touch(400)
+    assert connection.connection_interval == 7.5
+    assert tuner.switches == 2
+    assert tuner.fast_ms == 100
+    assert tuner.idle_ms == 300
+    # 100 / 7.5 + 300 / 30
+    assert tuner.connection_events == 23
+
+
+def test_activity_delays_idle(tuner: "ConnectionTuner", connection: MagicMock):
+    tuner.touch(80)
+    tuner.update(150)
+    assert connection.connection_interval == 7.5
+    assert tuner.switches == 0
+
+
+def test_disconnected(tuner: "ConnectionTuner", connection: MagicMock):
+    connection.connected = False
+    tuner.update(100)
+
+    assert connection.connection_interval == 7.5
+    assert tuner.interval == 30.0
+
+
+def test_same_intervals_never_switch(connection: MagicMock):
+    from roki.firmware.connection import ConnectionTuner
+
+    tuner = ConnectionTuner(7.5, 7.5, idle_after=10)
+    tuner.attach(connection, 0)
+    tuner.update(1000)
+
+    assert tuner.switches == 0
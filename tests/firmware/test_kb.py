@@ -4,10 +4,11 @@ from unittest.mock import MagicMock, PropertyMock, call, patch
 
 import pytest
 
-from roki.firmware.messages import ENCODER, KEY, THUMB_STICK
+from roki.firmware.messages import ENCODER, KEY, MATRIX, THUMB_STICK
 
 if TYPE_CHECKING:
     from roki.firmware.calibration import BaseCalibration
+    from roki.firmware.config import Config
     from roki.firmware.kb import Primary, Secondary
 
 
@@ -66,8 +67,8 @@ def mocked_calibration():
         def read(self) -> None:
             return
 
-    MockedCalibration._get_normalized_x.side_effect = cycle([0.0, 1.0])
-    MockedCalibration._get_normalized_y.side_effect = cycle([0.0, 1.0])
+    MockedCalibration._get_normalized_x.side_effect = cycle([0, 127])
+    MockedCalibration._get_normalized_y.side_effect = cycle([0, 127])
 
     return MockedCalibration
 
@@ -146,15 +147,20 @@ def mock_provide_services_advertisement():
 @pytest.fixture
 def mock_received_message():
     m = MagicMock()
-    m.return_value = (0, KEY, 0, 0)
+    m.return_value = (0, 0, KEY, 0, 0)
     return m
 
 
 @pytest.fixture
 def mocked_roki_service(mock_received_message: MagicMock):
+    def readinto(buffer: bytearray) -> int:
+        buffer[:] = bytes(mock_received_message())
+        return len(buffer)
+
     m = MagicMock()
     m.write = lambda _: None
-    m.readinto = mock_received_message
+    m.readinto = readinto
+    m.packet_size.return_value = 20
     return m
 
 
@@ -237,8 +243,16 @@ def mock_mouse():
 def mock_key_events():
     from keypad import EventQueue
 
-    with patch.object(EventQueue, "get") as m:
-        m.return_value = None
+    m = MagicMock()
+    m.return_value = None
+
+    def get_into(_, event) -> bool:
+        if not (e := m()):
+            return False
+        event.__init__(e.key_number, e.pressed)
+        return True
+
+    with patch.object(EventQueue, "get_into", get_into):
         yield m
 
 
@@ -340,8 +354,8 @@ def test_primary_run_with_remote_key_press(
 ):
     mock_received_message.side_effect = cycle(
         [
-            (1, KEY, 1, 0),
-            (2, KEY, 1, 1),
+            (0, 1, KEY, 1, 0),
+            (0, 2, KEY, 1, 1),
         ]
     )
     with patch.object(primary, "_handle_message", wraps=primary._handle_message) as m:
@@ -366,8 +380,8 @@ def test_primary_run_with_remote_thumb_stick_tilt(
 ):
     mock_received_message.side_effect = cycle(
         [
-            (1, THUMB_STICK, 0, 0),
-            (2, THUMB_STICK, 1, 1),
+            (0, 1, THUMB_STICK, 0, 0),
+            (0, 2, THUMB_STICK, 1, 1),
         ]
     )
     with patch.object(primary, "_handle_message", wraps=primary._handle_message) as m:
@@ -389,12 +403,36 @@ def test_primary_run_with_remote_encoder(
     primary: "Primary",
     mock_received_message: MagicMock,
 ):
-    mock_received_message.return_value = (99, ENCODER, 1, 1)
+    mock_received_message.return_value = (0, 99, ENCODER, 1, 1)
     with patch.object(primary, "_handle_message", wraps=primary._handle_message) as m:
         primary.run()
         m.assert_called_with(ENCODER, 1, 1)
 
 
+@pytest.mark.parametrize("ble_max_iter", [2], indirect=True)
+@pytest.mark.usefixtures(
+    "mock_device_info_service",
+    "mock_provide_services_advertisement",
+    "mock_ble_radio_start_scan",
+    "mock_debouncer",
+    "mock_mouse",
+    "mock_key_events",
+)
+def test_primary_run_with_packed_events(
+    primary: "Primary",
+    mock_received_message: MagicMock,
+):
+    mock_received_message.return_value = (0, 7, KEY, 1, 1, KEY, 2, 1, ENCODER, 1, 0)
+    with patch.object(primary, "_handle_message") as m:
+        primary.run()
+
+        assert m.call_args_list == [
+            call(KEY, 1, 1),
+            call(KEY, 2, 1),
+            call(ENCODER, 1, 0),
+        ]
+
+
 @pytest.mark.usefixtures(
     "mock_provide_services_advertisement",
     "mock_debouncer",
@@ -444,11 +482,11 @@ def test_secondary_run_with_encoder(
     rose.side_effect = cycle([True, False])
     fell.side_effect = cycle([False, True])
     diff.side_effect = cycle([1, -1])
-    with patch.object(secondary, "send_message", wraps=secondary.send_message) as m:
+    with patch.object(secondary, "_queue_message", wraps=secondary._queue_message) as m:
         secondary.run()
-        assert call(2, (1, 0)) in m.call_args_list
-        assert call(3, (127, 127)) in m.call_args_list
-        assert call(3, (0, 0)) in m.call_args_list
+        assert call(2, 1, 0) in m.call_args_list
+        assert call(3, 127, 127) in m.call_args_list
+        assert call(3, 0, 0) in m.call_args_list
 
 
 @pytest.mark.parametrize("ble_max_iter", [2], indirect=True)
@@ -473,5 +511,497 @@ def test_secondary_run_with_key_press(
     )
     with patch.object(secondary, "send_message", wraps=secondary.send_message) as m:
         secondary.run()
-        assert call(KEY, (1, 1)) in m.call_args_list
-        assert call(KEY, (1, 0)) in m.call_args_list
+        assert call(KEY, 1, 1) in m.call_args_list
+        assert call(KEY, 1, 0) in m.call_args_list
+
+
+@pytest.mark.usefixtures("mock_mouse")
+def test_primary_process_keys_drains_event_queue(
+    primary: "Primary",
+    mock_key_events: MagicMock,
+):
+    events = []
+    for key_number in (1, 2, 3):
+        event = MagicMock()
+        event.key_number = key_number
+        event.pressed = True
+        events.append(event)
+    mock_key_events.side_effect = [*events, None]
+    with patch.object(primary, "_process_key") as m:
+        primary.process_primary_keys()
+        assert m.call_count == 3
+
+
+@pytest.mark.usefixtures("mock_mouse")
+def test_primary_process_keys_respects_budget(
+    primary: "Primary",
+    mock_key_events: MagicMock,
+):
+    event = MagicMock()
+    event.key_number = 1
+    event.pressed = True
+    mock_key_events.return_value = event
+    primary.max_events_per_tick = 2
+    with patch.object(primary, "_process_key") as m:
+        primary.process_primary_keys()
+        assert m.call_count == 2
+
+
+@pytest.fixture
+def compiled_config():
+    import json
+
+    from roki.firmware.config import Config
+
+    with open("config.json") as file:
+        layers = json.load(file)["layers"]
+    return Config(layers, compiled=True)
+
+
+@pytest.fixture
+def mock_dispatch():
+    with patch("roki.firmware.config.dispatch") as m:
+        yield m
+
+
+@pytest.mark.usefixtures("mock_mouse")
+def test_primary_process_keys_with_compiled_keymap(
+    primary: "Primary",
+    compiled_config: "Config",
+    mock_key_events: MagicMock,
+    mock_dispatch: MagicMock,
+):
+    event = MagicMock()
+    event.key_number = 1
+    event.pressed = True
+    mock_key_events.side_effect = [event, None]
+    primary.config = compiled_config
+    keys = compiled_config.layer.primary_keys
+
+    primary.process_primary_keys()
+
+    mock_dispatch.assert_called_once_with(keys.kinds[1], keys.codes[1], True)
+
+
+def test_primary_handle_message_with_compiled_keymap(
+    primary: "Primary",
+    compiled_config: "Config",
+    mock_dispatch: MagicMock,
+):
+    from roki.firmware.config import SECONDARY_ENCODER_CW
+
+    primary.config = compiled_config
+    layer = compiled_config.layer
+
+    primary._handle_message(KEY, 2, 0)
+    primary._handle_message(ENCODER, 1, 0)
+
+    assert mock_dispatch.call_args_list == [
+        call(layer.secondary_keys.kinds[2], layer.secondary_keys.codes[2], False),
+        call(
+            layer.encoders.kinds[SECONDARY_ENCODER_CW],
+            layer.encoders.codes[SECONDARY_ENCODER_CW],
+            True,
+        ),
+        call(
+            layer.encoders.kinds[SECONDARY_ENCODER_CW],
+            layer.encoders.codes[SECONDARY_ENCODER_CW],
+            False,
+        ),
+    ]
+
+
+@pytest.mark.usefixtures("mock_mouse")
+def test_primary_oneshot_layer_lasts_one_key(
+    primary: "Primary",
+    compiled_config: "Config",
+    mock_key_events: MagicMock,
+    mock_dispatch: MagicMock,
+):
+    events = []
+    for pressed in (True, False):
+        event = MagicMock()
+        event.key_number = 1
+        event.pressed = pressed
+        events.append(event)
+    mock_key_events.side_effect = [*events, None]
+    primary.config = compiled_config
+    compiled_config.oneshot_on(1)
+    keys = compiled_config.layer.primary_keys
+
+    primary.process_primary_keys()
+
+    assert mock_dispatch.call_args_list == [
+        call(keys.kinds[1], keys.codes[1], True),
+        call(keys.kinds[1], keys.codes[1], False),
+    ]
+    assert compiled_config.layer_index == 0
+    assert not compiled_config.oneshot_state
+
+
+def test_primary_tap_hold_key(
+    primary: "Primary",
+    compiled_config: "Config",
+    mock_dispatch: MagicMock,
+):
+    from roki.firmware.keys import TAP_HOLD, encode
+
+    primary.config = compiled_config
+    keys = compiled_config.layer.primary_keys
+    keys.kinds[1], keys.codes[1] = encode("A|LEFT_CONTROL")
+
+    with patch("roki.firmware.kb.dispatch") as tap_hold_dispatch:
+        assert primary.tap_hold_at(1) == keys.codes[1]
+        assert keys.kinds[1] == TAP_HOLD
+        primary._handle_key(1, True)
+        primary._handle_key(2, True)
+        mock_dispatch.assert_not_called()
+
+        primary._handle_key(1, False)
+
+    assert tap_hold_dispatch.call_args_list == [
+        call(*encode("A"), True),
+        call(*encode("A"), False),
+    ]
+    mock_dispatch.assert_called_once_with(keys.kinds[2], keys.codes[2], True)
+
+
+@pytest.mark.usefixtures("mock_mouse")
+def test_primary_oneshot_layer_rollover(primary: "Primary"):
+    from adafruit_hid.keycode import Keycode
+
+    from roki.firmware import keys
+    from roki.firmware.config import Config, side_key_names
+    from roki.firmware.layer_handler import LayerHandler
+
+    layers = [
+        {"primary_keys": [["LAYER_1_ONESHOT", "A", "B"]]},
+        {"primary_keys": [["TRNS", "F2", "F1"]]},
+    ]
+    config = Config(layers)
+    primary.config = config
+    names, _, _ = side_key_names(layers[0], config.is_left_side)
+    oneshot, a, b = (names.index(n) for n in ("LAYER_1_ONESHOT", "A", "B"))
+    kb = MagicMock()
+
+    with (
+        patch.object(keys, "kb", kb),
+        patch.object(keys, "lh", LayerHandler(config)),
+    ):
+        for position, pressed in (
+            (oneshot, True),
+            (oneshot, False),
+            (a, True),
+            (b, True),
+            (a, False),
+            (b, False),
+        ):
+            primary._handle_key(position, pressed)
+
+    assert kb.press.call_args_list == [call(Keycode.F2), call(Keycode.F1)]
+    assert kb.release.call_args_list == [call(Keycode.F2), call(Keycode.F1)]
+    assert not config.oneshot_state
+
+
+def test_primary_oneshot_layer_used_by_tap_hold_key(
+    primary: "Primary",
+    compiled_config: "Config",
+    mock_dispatch: MagicMock,
+):
+    from roki.firmware.keys import encode
+
+    primary.config = compiled_config
+    compiled_config.oneshot_on(1)
+    keys = compiled_config.layer.primary_keys
+    keys.kinds[1], keys.codes[1] = encode("A|LEFT_CONTROL")
+
+    with patch("roki.firmware.kb.dispatch") as m:
+        primary._handle_key(1, True)
+        assert compiled_config.oneshot_state
+        primary._handle_key(1, False)
+
+    assert m.call_args_list == [
+        call(*encode("A"), True),
+        call(*encode("A"), False),
+    ]
+    assert compiled_config.layer_index == 0
+    assert not compiled_config.oneshot_state
+
+
+def test_primary_oneshot_layer_used_by_combo(primary: "Primary"):
+    from roki.firmware.combos import Combos
+    from roki.firmware.keys import encode
+
+    primary.combos = Combos(
+        primary.clock,
+        primary.timers,
+        [((1, 2), *encode("ESCAPE"))],
+        primary._handle_tap_hold,
+        primary.combo_term,
+        send=primary._dispatch,
+    )
+    primary.config.oneshot_on(1)
+
+    with patch("roki.firmware.kb.dispatch") as m:
+        primary._handle_key(1, True)
+        primary._handle_key(2, True)
+        primary._handle_key(1, False)
+
+    assert m.call_args_list == [
+        call(*encode("ESCAPE"), True),
+        call(*encode("ESCAPE"), False),
+    ]
+    assert not primary.config.oneshot_state
+
+
+def test_primary_reset_keys(primary: "Primary"):
+    combos = primary.combos
+    with patch("roki.firmware.kb.release_all") as m:
+        primary.reset_keys()
+
+    m.assert_called_once()
+    assert primary.combos is not combos
+    assert primary.tap_hold.pending == -1
+
+
+@pytest.mark.usefixtures("mock_mouse")
+def test_primary_layer_tap_held_across_reload(
+    primary: "Primary",
+    compiled_config: "Config",
+):
+    import json
+
+    from roki.firmware import keys
+    from roki.firmware.keys import encode
+    from roki.firmware.layer_handler import LayerHandler
+
+    primary.config = compiled_config
+    table = compiled_config.layer.primary_keys
+    table.kinds[1], table.codes[1] = encode("SPACEBAR|LAYER_1_HOLD")
+    with open("config.json") as file:
+        layers = json.load(file)["layers"]
+
+    with (
+        patch.object(keys, "kb", MagicMock()),
+        patch.object(keys, "lh", LayerHandler(compiled_config)),
+    ):
+        primary._handle_key(1, True)
+        primary.tap_hold.expire()
+        assert compiled_config.layer_mask == 0b11
+
+        compiled_config.reload(layers)
+        primary.reset_keys()
+        assert compiled_config.layer_mask == 0b1
+
+        primary._handle_key(1, False)
+        assert compiled_config.layer_mask == 0b1
+
+
+@pytest.mark.usefixtures(
+    "mock_provide_services_advertisement",
+    "mock_debouncer",
+    "mock_roki_service",
+)
+def test_secondary_packs_events(
+    secondary: "Secondary",
+    mocked_roki_service: MagicMock,
+):
+    secondary.run()
+    secondary.flush_messages()
+    packets = []
+    mocked_roki_service.write = lambda buffer: packets.append(bytes(buffer))
+    # room for two events after the sequence number
+    secondary.packet_size = 9
+
+    secondary.send_message(KEY, 1, 1)
+    secondary.send_message(KEY, 2, 1)
+    assert packets == []
+
+    secondary.send_message(THUMB_STICK, 3, 4)
+    assert len(packets) == 1
+    assert packets[0][2:] == bytes((KEY, 1, 1, KEY, 2, 1))
+
+    assert secondary.flush_messages()
+    assert packets[1][2:] == bytes((THUMB_STICK, 3, 4))
+    assert packets[1][:2] != packets[0][:2]
+    assert not secondary.flush_messages()
+
+
+@pytest.mark.usefixtures(
+    "mock_provide_services_advertisement",
+    "mock_debouncer",
+    "mock_roki_service",
+)
+def test_secondary_flushes_once_per_connection_interval(
+    secondary: "Secondary",
+    mocked_roki_service: MagicMock,
+):
+    secondary.run()
+    assert secondary.scheduler.get("ble").period == int(secondary.connection_interval)
+
+    views = []
+    mocked_roki_service.write = views.append
+    for _ in range(2):
+        secondary.send_message(KEY, 1, 1)
+        secondary.flush_messages()
+
+    # the same view of the buffer every time
+    assert views[0] is views[1]
+    assert bytes(views[0])[2:] == bytes((KEY, 1, 1))
+
+
+@pytest.mark.usefixtures("mock_mouse")
+def test_primary_drains_packets(primary: "Primary"):
+    from roki.firmware.service import PacketSequence
+
+    packets = [
+        bytes((0, 1, KEY, 1, 1)),
+        bytes((0, 1, KEY, 1, 1)),
+        bytes((0, 4, KEY, 2, 1, KEY, 1, 0)),
+    ]
+
+    def get_message() -> int:
+        if not packets:
+            return 0
+        packet = packets.pop(0)
+        primary.buffer[: len(packet)] = packet
+        return len(packet)
+
+    primary.peripheral_conn = MagicMock(connected=True)
+    primary.buffer = bytearray(244)
+    primary.sequence = PacketSequence()
+    with (
+        patch.object(primary, "get_message", side_effect=get_message),
+        patch.object(primary, "_handle_message") as m,
+    ):
+        primary.process_peripheral_messages()
+
+    assert m.call_args_list == [call(KEY, 1, 1), call(KEY, 2, 1), call(KEY, 1, 0)]
+    assert primary.sequence.received == 2
+    assert primary.sequence.duplicates == 1
+    assert primary.sequence.lost == 2
+
+
+@pytest.mark.usefixtures("mock_mouse")
+def test_primary_matrix_snapshot_fixes_missed_keys(primary: "Primary"):
+    with patch.object(primary, "_handle_key") as m:
+        primary._handle_message(KEY, 1, 1)
+        primary._handle_message(KEY, 9, 1)
+        assert list(primary.matrix[:2]) == [0b10, 0b10]
+        m.reset_mock()
+
+        # in sync
+        primary._handle_message(MATRIX, 0, 0b10)
+        m.assert_not_called()
+
+        # release of 1 and press of 3 were lost
+        primary._handle_message(MATRIX, 0, 0b1000)
+        # out of range
+        primary._handle_message(MATRIX, 99, 0xFF)
+
+    assert m.call_args_list == [call(0x100 | 1, False), call(0x100 | 3, True)]
+    assert list(primary.matrix[:2]) == [0b1000, 0b10]
+
+
+@pytest.mark.usefixtures(
+    "mock_provide_services_advertisement",
+    "mock_debouncer",
+    "mock_roki_service",
+)
+def test_secondary_sends_matrix_on_change(
+    secondary: "Secondary",
+    mock_key_events: MagicMock,
+):
+    secondary.run()
+    event = MagicMock()
+    event.key_number = 9
+    event.pressed = True
+    mock_key_events.side_effect = [event, None]
+
+    with patch.object(secondary, "_queue_message") as m:
+        secondary.process_keys()
+
+    assert m.call_args_list == [
+        call(KEY, 9, 1),
+        call(MATRIX, 0, 0),
+        call(MATRIX, 1, 0b10),
+        call(MATRIX, 2, 0),
+        call(MATRIX, 3, 0),
+    ]
+
+
+@pytest.mark.usefixtures("mock_mouse")
+def test_primary_moves_with_last_secondary_position(
+    primary: "Primary",
+    mock_mouse: MagicMock,
+):
+    from roki.firmware.utils import encode_axis
+
+    primary._handle_message(THUMB_STICK, encode_axis(127), encode_axis(0))
+    for _ in range(3):
+        primary.process_secondary_thumb_stick()
+    assert mock_mouse.move.call_count == 3
+
+    primary._handle_message(THUMB_STICK, 0, 0)
+    with patch.object(type(primary.secondary_acceleration), "move") as m:
+        primary.process_secondary_thumb_stick()
+    m.assert_not_called()
+    assert mock_mouse.move.call_count == 3
+    assert primary.secondary_acceleration.x == primary.secondary_acceleration.y == 0
+
+
+@pytest.mark.usefixtures(
+    "mock_provide_services_advertisement",
+    "mock_debouncer",
+    "mock_roki_service",
+)
+def test_secondary_thumb_stick_rate_and_threshold(secondary: "Secondary"):
+    secondary.run()
+    secondary.config.extras = True
+    clock = secondary.clock
+    secondary.stick_sent_at = clock.now() - secondary.thumb_stick_send_period
+
+    def tilt(x: int, wait: int = 0) -> tuple[int, int]:
+        for _ in range(wait // clock.step):
+            clock.advance()
+        with patch.object(secondary.calibration, "get_normalized") as m:
+            m.return_value = (x, 0)
+            secondary.process_thumb_stick()
+        return secondary.stick_x, secondary.stick_y
+
+    assert tilt(50) == (50, 0)
+    # too soon
+    assert tilt(60) == (50, 0)
+    # below the threshold
+    assert tilt(51, wait=20) == (50, 0)
+    assert tilt(60) == (60, 0)
+    # back in the middle right away
+    assert tilt(0) == (0, 0)
+    assert secondary.stick_pending
+
+
+@pytest.mark.usefixtures(
+    "mock_provide_services_advertisement",
+    "mock_debouncer",
+    "mock_roki_service",
+)
+def test_secondary_thumb_stick_yields_to_keys(
+    secondary: "Secondary",
+    mocked_roki_service: MagicMock,
+):
+    secondary.run()
+    secondary.flush_messages()
+    packets = []
+    mocked_roki_service.write = lambda buffer: packets.append(bytes(buffer))
+    # room for two events after the sequence number
+    secondary.packet_size = 8
+
+    secondary.stick_x = 127
+    secondary.stick_pending = True
+    secondary.send_message(KEY, 1, 1)
+    secondary.send_message(KEY, 2, 1)
+    secondary.flush_messages()
+    secondary.flush_messages()
+
+    assert packets[0][2:] == bytes((KEY, 1, 1, KEY, 2, 1))
+    assert packets[1][2:] == bytes((THUMB_STICK, 127, 0))
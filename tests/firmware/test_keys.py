@@ -1,10 +1,10 @@
 from typing import TYPE_CHECKING
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, call, patch
 
 import pytest
 
 if TYPE_CHECKING:
-    from roki.firmware.keys import Mouse
+    from roki.firmware.keys import Keyboard, Mouse
 
 
 @pytest.fixture
@@ -26,21 +26,56 @@ def wrap_mouse_move(mouse: "Mouse"):
 
 def test_mouse(mouse: "Mouse", wrap_mouse_move: MagicMock):
     mouse.press("u")
-    wrap_mouse_move.assert_called_with(y=-20)
-    mouse.press("d")
-    wrap_mouse_move.assert_called_with(y=20)
-    mouse.press("l")
-    wrap_mouse_move.assert_called_with(x=-20)
-    mouse.press("r")
-    wrap_mouse_move.assert_called_with(x=20)
-    mouse.press("su")
-    wrap_mouse_move.assert_called_with(wheel=2)
-    mouse.press("sd")
-    wrap_mouse_move.assert_called_with(wheel=-2)
+    wrap_mouse_move.assert_not_called()
+    mouse.update()
+    mouse.update()
+    # 1000 px/s every 16 ms, ramping over 31 updates
+    assert wrap_mouse_move.call_args_list == [call(0, -1, 0)]
+    mouse.release("u")
+    assert mouse.held == 0
+    mouse.update()
+    assert wrap_mouse_move.call_count == 1
+
     mouse.press(1)
     mouse.release(1)
 
 
+def test_mouse_keys_ramp_up(mouse: "Mouse", wrap_mouse_move: MagicMock):
+    mouse.configure(period=10, movement_speed=1000, scroll_speed=100, ramp_time=50)
+    mouse.press("r")
+    mouse.press("su")
+    for _ in range(10):
+        mouse.update()
+
+    moves = [c.args for c in wrap_mouse_move.call_args_list]
+    assert [x for x, _, _ in moves][-3:] == [10, 10, 10]
+    assert sum(x for x, _, _ in moves) == 2 + 4 + 6 + 8 + 10 * 6
+    assert sum(wheel for _, _, wheel in moves) == 7
+
+
+def test_mouse_keys_diagonal(mouse: "Mouse", wrap_mouse_move: MagicMock):
+    mouse.configure(period=10, movement_speed=1000, scroll_speed=0, ramp_time=10)
+    mouse.press("d")
+    mouse.press("l")
+    mouse.update()
+
+    # one report, about 10 px overall
+    wrap_mouse_move.assert_called_once_with(-7, 7, 0)
+
+    mouse.release("l")
+    mouse.update()
+    wrap_mouse_move.assert_called_with(0, 10, 0)
+
+
+def test_mouse_keys_opposite_directions(mouse: "Mouse", wrap_mouse_move: MagicMock):
+    mouse.press("u")
+    mouse.press("d")
+    for _ in range(40):
+        mouse.update()
+
+    wrap_mouse_move.assert_not_called()
+
+
 def test_mouse_button():
     from roki.firmware.keys import MouseButton
 
@@ -79,3 +114,284 @@ def test_key_wrapper(mock_hid_service: MagicMock):
         kw = BaseKey.build(k)
         kw.press()
         kw.release()
+
+
+def test_encode():
+    from roki.firmware.keys import (
+        KEYBOARD,
+        LAYER,
+        MEDIA,
+        MOUSE,
+        MOUSE_MOVEMENT,
+        NOOP,
+        commands,
+        encode,
+    )
+    from roki.firmware.layer_handler import OnHoldCommand
+
+    assert encode("A") == (KEYBOARD, 0x04)
+    assert encode("MUTE") == (MEDIA, 0xE2)
+    assert encode("LEFT_BUTTON") == (MOUSE, 1)
+    assert encode("MOUSE_MOVE_DOWN") == (MOUSE, MOUSE_MOVEMENT + 1)
+    assert encode("") == (NOOP, 0)
+    assert encode("UNKNOWN") == (NOOP, 0)
+
+    kind, code = encode("LAYER_1_HOLD")
+    assert kind == LAYER
+    assert isinstance(commands[code], OnHoldCommand)
+    assert encode("LAYER_1_HOLD") == (LAYER, code)
+
+
+def test_encode_keys():
+    from roki.firmware.keys import KEYBOARD, NOOP, encode_keys
+
+    kinds, codes = encode_keys(["A", None, "B"])
+
+    assert list(kinds) == [KEYBOARD, NOOP, KEYBOARD]
+    assert list(codes) == [0x04, 0, 0x05]
+    assert codes.typecode == "H"
+
+
+def test_dispatch():
+    from roki.firmware import keys
+    from roki.firmware.keys import (
+        KEYBOARD,
+        MEDIA,
+        MOUSE,
+        MOUSE_MOVEMENT,
+        NOOP,
+        dispatch,
+    )
+
+    with (
+        patch.object(keys, "kb") as kb,
+        patch.object(keys, "mouse") as mouse,
+        patch.object(keys, "media") as media,
+    ):
+        dispatch(KEYBOARD, 0x04, True)
+        dispatch(KEYBOARD, 0x04, False)
+        dispatch(MOUSE, 1, True)
+        dispatch(MOUSE, 1, False)
+        dispatch(MOUSE, MOUSE_MOVEMENT + 4, True)
+        dispatch(MOUSE, MOUSE_MOVEMENT + 4, False)
+        dispatch(MEDIA, 0xE2, True)
+        dispatch(MEDIA, 0xE2, False)
+        dispatch(NOOP, 0, True)
+
+    kb.press.assert_called_once_with(0x04)
+    kb.release.assert_called_once_with(0x04)
+    mouse.press.assert_called_once_with(1)
+    mouse.release.assert_called_once_with(1)
+    mouse.hold.assert_called_once_with(1 << 4)
+    mouse.unhold.assert_called_once_with(1 << 4)
+    media.press.assert_called_once_with(0xE2)
+    media.release.assert_called_once_with()
+
+
+@pytest.fixture
+def keyboard(mock_find_device: tuple[MagicMock, MagicMock, MagicMock]):
+    from roki.firmware.keys import Keyboard
+
+    keyboard = Keyboard([])
+    keyboard.batched = True
+    return keyboard
+
+
+def test_keyboard_batches_chord(keyboard: "Keyboard"):
+    device = keyboard._keyboard_device
+
+    keyboard.press(0x04)
+    keyboard.press(0x05)
+    device.send_report.assert_not_called()
+
+    keyboard.flush()
+    device.send_report.assert_called_once()
+    assert keyboard.report[2:4] == bytes((0x04, 0x05))
+
+    keyboard.flush()
+    device.send_report.assert_called_once()
+
+
+def test_keyboard_batch_keeps_taps(keyboard: "Keyboard"):
+    device = keyboard._keyboard_device
+    reports: list[bytes] = []
+    device.send_report.side_effect = lambda report: reports.append(bytes(report))
+
+    keyboard.press(0x04)
+    keyboard.release(0x04)
+    keyboard.flush()
+
+    assert reports == [bytes((0, 0, 0x04, 0, 0, 0, 0, 0)), bytes(8)]
+
+
+def test_keyboard_batch_merges_roll(keyboard: "Keyboard"):
+    device = keyboard._keyboard_device
+    keyboard.press(0x04)
+    keyboard.flush()
+
+    keyboard.release(0x04)
+    keyboard.press(0x05)
+    keyboard.flush()
+
+    assert device.send_report.call_count == 2
+    assert keyboard.report[2:4] == bytes((0x05, 0))
+
+
+def test_mouse_batches_movement(mouse: "Mouse"):
+    device = mouse._mouse_device
+    mouse.batched = True
+
+    mouse.configure(period=10, movement_speed=2000, scroll_speed=0, ramp_time=10)
+    mouse.move(10, 5)
+    mouse.press("u")
+    mouse.update()
+    mouse.move(wheel=1)
+    device.send_report.assert_not_called()
+
+    mouse.flush()
+    device.send_report.assert_called_once()
+    x, y, wheel = mouse.report[1:]
+    assert (x, y, wheel) == (10, (5 - 20) & 0xFF, 1)
+
+
+def test_media_batch(mock_find_device: tuple[MagicMock, MagicMock, MagicMock]):
+    from roki.firmware.keys import Media
+
+    media = Media([])
+    media.batched = True
+    device = media._consumer_device
+
+    media.press(0xE2)
+    media.release()
+    media.flush()
+
+    assert device.send_report.call_count == 2
+
+
+def test_batch_reports(mock_hid_service: MagicMock):
+    from roki.firmware import keys
+    from roki.firmware.config import Config
+
+    with (
+        patch.object(keys, "hid", None),
+        patch.object(keys, "kb", None),
+        patch.object(keys, "mouse", None),
+        patch.object(keys, "media", None),
+    ):
+        keys.init(Config())
+        keys.batch_reports(True)
+        keys.kb.press(0x04)
+        keys.kb._keyboard_device.send_report.assert_not_called()
+
+        assert keys.flush_reports()
+        keys.kb._keyboard_device.send_report.assert_called_once()
+        assert not keys.flush_reports()
+
+        keys.batch_reports(False)
+        keys.kb.release(0x04)
+        assert keys.kb._keyboard_device.send_report.call_count == 2
+
+
+def test_build_key_index():
+    from roki.firmware.keys import (
+        KEYBOARD,
+        MEDIA,
+        MOUSE,
+        MOUSE_MOVEMENT,
+        build_key_index,
+    )
+
+    index = build_key_index()
+
+    assert index["A"] == KEYBOARD << 16 | 0x04
+    assert index["MUTE"] == MEDIA << 16 | 0xE2
+    assert index["LEFT_BUTTON"] == MOUSE << 16 | 1
+    assert index["MOUSE_SCROLL_DOWN"] == MOUSE << 16 | MOUSE_MOVEMENT + 5
+    assert build_key_index() is index
+
+
+def test_build_from_index():
+    from roki.firmware.keys import (
+        BaseKey,
+        KeyboardKey,
+        LayerHandlerKey,
+        MouseKey,
+        MultiMediaKey,
+        NoopKey,
+        key_index,
+    )
+    from roki.firmware.layer_handler import OnPressCommand
+
+    assert isinstance(BaseKey.build("A"), KeyboardKey)
+    assert isinstance(BaseKey.build("MUTE"), MultiMediaKey)
+    assert BaseKey.build("MOUSE_MOVE_LEFT").key_code == "l"
+    assert isinstance(BaseKey.build("MOUSE_MOVE_LEFT"), MouseKey)
+    assert isinstance(BaseKey.build(None), NoopKey)
+    assert isinstance(BaseKey.build("NOT_A_KEY"), NoopKey)
+    assert "NOT_A_KEY" in key_index
+
+    key = BaseKey.build("layer_2_press")
+    assert isinstance(key, LayerHandlerKey)
+    assert isinstance(key.key_code, OnPressCommand)
+    assert key.key_code.index == 2
+    assert BaseKey.build("layer_2_press").key_code is key.key_code
+
+
+def test_key_pool():
+    from roki.firmware.keys import KEYBOARD, NOOP, BaseKey, KeyPool, NoopKey
+
+    pool = KeyPool()
+
+    a = pool.get(KEYBOARD, 0x04)
+    assert pool.get(KEYBOARD, 0x04) is a
+    assert isinstance(pool.get(NOOP, 0), NoopKey)
+    assert pool.report() == "3 keys requested, 2 unique instances"
+
+    assert BaseKey.build("A") is BaseKey.build("A")
+    assert BaseKey.build("") is BaseKey.build(None)
+
+
+def test_transparent_key_encoding():
+    from roki.firmware.keys import TRANSPARENT, BaseKey, TransparentKey, encode
+
+    assert encode("TRNS") == (TRANSPARENT, 0)
+    assert isinstance(BaseKey.build("TRNS"), TransparentKey)
+
+
+def test_tap_hold_key_encoding():
+    from roki.firmware.keys import TAP_HOLD, BaseKey, TapHoldKey, encode, tap_holds
+
+    kind, code = encode("A|LEFT_CONTROL")
+    assert kind == TAP_HOLD
+    assert tap_holds[code] == encode("A") + encode("LEFT_CONTROL")
+    key = BaseKey.build("A|LEFT_CONTROL")
+    assert isinstance(key, TapHoldKey)
+    assert key.key_code == code
+
+
+def test_tap_hold_key_with_layer_command():
+    from roki.firmware import keys
+    from roki.firmware.config import Config
+    from roki.firmware.keys import LAYER, TAP_HOLD, dispatch, encode, tap_holds
+    from roki.firmware.layer_handler import Commands, LayerHandler
+
+    assert "LAYER_1_TOGGLE|LEFT_SHIFT" not in Commands()
+    kind, code = encode("LAYER_1_TOGGLE|LEFT_SHIFT")
+    assert kind == TAP_HOLD
+    tap_kind, tap_code, _, _ = tap_holds[code]
+    assert tap_kind == LAYER
+
+    config = Config([{"name": "base"}, {"name": "top"}])
+    with patch.object(keys, "lh", LayerHandler(config)):
+        dispatch(tap_kind, tap_code, True)
+        dispatch(tap_kind, tap_code, False)
+
+    assert config.is_layer_on(1)
+
+
+def test_macro_key_encoding():
+    from roki.firmware.keys import MACRO, MACRO_STOP, BaseKey, MacroKey, encode
+
+    assert encode("MACRO_3") == (MACRO, 3)
+    assert encode("MACRO_STOP") == (MACRO, MACRO_STOP)
+    assert isinstance(BaseKey.build("MACRO_3"), MacroKey)
@@ -10,8 +10,11 @@ from roki.firmware.layer_handler import (
     OnHoldCommand,
     OnPressCommand,
     OnPressDecrementCommand,
+    OnPressDefaultCommand,
     OnPressExtrasCommand,
     OnPressIncrementCommand,
+    OnPressOneShotCommand,
+    OnPressToggleCommand,
 )
 
 if TYPE_CHECKING:
@@ -108,3 +111,96 @@ def test_layer_handler_on_press_and_release_layer_1_hold(layer_handler: LayerHan
     assert layer_handler.config.layer_index == 1
     layer_handler.on_release(command)
     assert layer_handler.config.layer_index == 0
+
+
+@pytest.fixture
+def stacked_handler():
+    from roki.firmware.config import Config
+
+    config = Config(
+        [{"name": name, "primary_keys": [["A"]]} for name in ("base", "one", "two")]
+    )
+    return LayerHandler(config)
+
+
+def test_highest_layer():
+    from roki.firmware.config import highest_layer
+
+    assert highest_layer(0) == 0
+    assert highest_layer(0b1) == 0
+    assert highest_layer(0b1011) == 3
+    assert highest_layer(1 << 15) == 15
+
+
+def test_layer_handler_nested_holds(stacked_handler: LayerHandler):
+    config = stacked_handler.config
+    one, two = OnHoldCommand(1), OnHoldCommand(2)
+
+    stacked_handler.on_press(one)
+    stacked_handler.on_press(two)
+    assert config.layer_index == 2
+    assert config.layer_mask == 0b111
+
+    stacked_handler.on_release(two)
+    assert config.layer_index == 1
+    assert config.layer.name == "one"
+
+    stacked_handler.on_press(two)
+    stacked_handler.on_release(one)
+    assert config.layer_index == 2
+    stacked_handler.on_release(two)
+    assert config.layer_index == 0
+
+
+def test_layer_handler_hold_inside_toggle(stacked_handler: LayerHandler):
+    config = stacked_handler.config
+    toggle = OnPressToggleCommand(1)
+
+    stacked_handler.on_press(toggle)
+    stacked_handler.on_release(toggle)
+    assert config.layer_index == 1
+
+    hold = OnHoldCommand(2)
+    stacked_handler.on_press(hold)
+    assert config.layer_index == 2
+    stacked_handler.on_release(hold)
+    assert config.layer_index == 1
+
+    stacked_handler.on_press(toggle)
+    assert config.layer_index == 0
+
+
+def test_layer_handler_oneshot(stacked_handler: LayerHandler):
+    config = stacked_handler.config
+    oneshot = OnPressOneShotCommand(2)
+
+    stacked_handler.on_press(oneshot)
+    stacked_handler.on_release(oneshot)
+    assert config.layer_index == 2
+    assert not config.oneshot_used
+
+    config.oneshot_off()
+    assert config.layer_index == 0
+
+
+def test_layer_handler_default_layer(stacked_handler: LayerHandler):
+    config = stacked_handler.config
+
+    stacked_handler.on_press(OnPressDefaultCommand(1))
+    assert config.layer_index == 1
+
+    stacked_handler.on_press(OnHoldCommand(2))
+    assert config.layer_index == 2
+    stacked_handler.on_release(OnHoldCommand(2))
+    assert config.layer_index == 1
+
+
+def test_config_caches_resolved_layer_per_mask(stacked_handler: LayerHandler):
+    config = stacked_handler.config
+    config.layer_on(2)
+    layer = config.layer
+    config.layer_off(2)
+    config.layer_on(2)
+
+    assert config.layer is layer
+    assert set(config.resolved_layers) == {0b001, 0b101}
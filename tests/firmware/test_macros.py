@@ -0,0 +1,84 @@
+from unittest.mock import MagicMock, call
+
+
+def test_compile_macro_text():
+    from adafruit_hid.keycode import Keycode
+
+    from roki.firmware.macros import compile_macro
+
+    steps = compile_macro("aB!")
+
+    assert steps == bytes(
+        [
+            *(0, Keycode.A, 0, 0),
+            *(Keycode.SHIFT, Keycode.B, 0, 0),
+            *(Keycode.SHIFT, Keycode.ONE, 0, 0),
+        ]
+    )
+
+
+def test_compile_macro_keys():
+    from adafruit_hid.keycode import Keycode
+
+    from roki.firmware.macros import compile_macro
+
+    steps = compile_macro(["LEFT_CONTROL+C", "ENTER", "NOT_A_KEY"])
+
+    assert steps == bytes(
+        [
+            *(Keycode.LEFT_CONTROL, Keycode.C, 0, 0),
+            *(Keycode.ENTER, 0, 0, 0),
+            *(0, 0, 0, 0),
+        ]
+    )
+
+
+def test_compile_macro_max_steps():
+    from roki.firmware.macros import STEP_SIZE, compile_macro
+
+    assert len(compile_macro("x" * 10, max_steps=4)) == 4 * STEP_SIZE
+
+
+def test_macro_player_rate():
+    from adafruit_hid.keycode import Keycode
+
+    from roki.firmware.macros import MacroPlayer, compile_macro
+
+    keyboard = MagicMock()
+    player = MacroPlayer(keyboard, rate=2)
+    player.play(compile_macro("abc"))
+
+    player.update()
+    assert keyboard.press.call_args_list == [call(Keycode.A), call(Keycode.B)]
+    assert keyboard.release.call_args_list == [call(Keycode.A), call(Keycode.B)]
+    assert keyboard.flush.call_count == 2
+    assert player.playing
+
+    player.update()
+    assert keyboard.press.call_args_list[-1] == call(Keycode.C)
+    assert not player.playing
+
+    player.update()
+    assert keyboard.press.call_count == 3
+
+
+def test_macro_player_queue_and_stop():
+    from adafruit_hid.keycode import Keycode
+
+    from roki.firmware.macros import STEP_SIZE, MacroPlayer, compile_macro
+
+    keyboard = MagicMock()
+    player = MacroPlayer(keyboard, max_steps=3)
+
+    player.play(compile_macro("ab"))
+    player.play(compile_macro("cd"))
+    assert player.tail == 3 * STEP_SIZE
+
+    player.update()
+    player.stop()
+    player.update()
+    assert keyboard.press.call_args_list == [call(Keycode.A)]
+
+    # the queue is reused from the start once empty
+    player.play(compile_macro("e"))
+    assert (player.head, player.tail) == (0, STEP_SIZE)
@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+from roki.firmware.memory import AllocationMonitor, IdleCollector
+
+
+def test_allocation_monitor_samples_every_n_iterations():
+    with patch("roki.firmware.memory.mem_free") as m:
+        m.return_value = 1000
+        monitor = AllocationMonitor(every=3)
+
+        m.return_value = 900
+        monitor.update()
+        monitor.update()
+        assert monitor.allocated == 0
+
+        monitor.update()
+        assert monitor.iterations == 0
+        assert monitor.allocated == 100
+        assert monitor.max_allocated == 100
+
+
+def test_allocation_monitor_counts_collections():
+    with patch("roki.firmware.memory.mem_free") as m:
+        m.return_value = 500
+        monitor = AllocationMonitor(every=1)
+
+        m.return_value = 2000
+        monitor.update()
+        assert monitor.collections == 1
+        assert monitor.allocated == 0
+
+        monitor.update()
+        assert monitor.allocated == 0
+        assert monitor.max_allocated == 0
+
+
+def test_idle_collector_waits_for_quiet_window():
+    collector = IdleCollector(idle_after=50, min_free=100)
+    collector.touch(1000)
+    with (
+        patch("roki.firmware.memory.mem_free") as mem_free,
+        patch("roki.firmware.memory.collect") as collect,
+    ):
+        mem_free.return_value = 10
+
+        collector.update(1049)
+        collect.assert_not_called()
+
+        collector.update(1050)
+        collector.update(1100)
+        collect.assert_called_once()
+        assert collector.collections == 1
+
+        collector.touch(1200)
+        collector.update(1250)
+        assert collect.call_count == 2
+
+
+def test_idle_collector_skips_when_memory_is_available():
+    collector = IdleCollector(idle_after=0, min_free=100)
+    with (
+        patch("roki.firmware.memory.mem_free") as mem_free,
+        patch("roki.firmware.memory.collect") as collect,
+    ):
+        mem_free.return_value = 1000
+        collector.update(0)
+
+    collect.assert_not_called()
+    assert collector.collected
+
+
+def test_idle_collector_reports_duration():
+    collector = IdleCollector()
+    with (
+        patch("roki.firmware.memory.collect"),
+        patch("roki.firmware.memory.monotonic_ns") as monotonic_ns,
+    ):
+        monotonic_ns.side_effect = [1_000, 251_000]
+        assert collector.collect() == 250
+
+    assert collector.last_duration == 250
+    assert collector.max_duration == 250
@@ -0,0 +1,138 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from roki.firmware import probes
+from roki.firmware.probes import MARKER, Histogram
+
+
+@pytest.fixture
+def histogram():
+    return Histogram("test", size=4)
+
+
+@pytest.fixture
+def restore_instrumented_classes():
+    from roki.firmware import config, kb
+    from roki.firmware.kb import Primary, Roki, Secondary
+    from roki.firmware.memory import IdleCollector
+    from roki.firmware.keys import (
+        KeyboardKey,
+        LayerHandlerKey,
+        MouseKey,
+        MultiMediaKey,
+    )
+
+    with (
+        patch.object(Roki, "next_key_event", Roki.next_key_event),
+        patch.object(Primary, "get_message", Primary.get_message),
+        patch.object(Secondary, "flush_messages", Secondary.flush_messages),
+        patch.object(IdleCollector, "collect", IdleCollector.collect),
+        patch.object(KeyboardKey, "press", KeyboardKey.press),
+        patch.object(MouseKey, "press", MouseKey.press),
+        patch.object(MultiMediaKey, "press", MultiMediaKey.press),
+        patch.object(LayerHandlerKey, "press", LayerHandlerKey.press),
+        patch.object(config, "dispatch", config.dispatch),
+        patch.object(kb, "dispatch", kb.dispatch),
+        patch.object(kb, "flush_reports", kb.flush_reports),
+        patch.dict(probes.histograms, clear=True),
+    ):
+        yield
+
+
+def test_histogram_record(histogram: Histogram):
+    for value in (0, 1, 3, 100):
+        histogram.record(value)
+
+    assert list(histogram.counts) == [1, 1, 1, 1]
+    assert histogram.count == 4
+    assert histogram.total == 104
+    assert histogram.max == 100
+
+
+def test_histogram_dump_and_reset(histogram: Histogram):
+    histogram.record(2)
+
+    assert histogram.dump() == f"{MARKER} test 1 2 2 0,0,1,0"
+
+    histogram.reset()
+    assert histogram.count == 0
+    assert list(histogram.counts) == [0, 0, 0, 0]
+
+
+def test_timed(histogram: Histogram):
+    class Target:
+        def work(self, value: int) -> int:
+            return value
+
+    probes.timed(Target, "work", histogram, lambda result: bool(result))
+
+    assert Target().work(0) == 0
+    assert histogram.count == 0
+    assert Target().work(1) == 1
+    assert histogram.count == 1
+
+
+def test_aged(histogram: Histogram):
+    class Target:
+        key_event = MagicMock(timestamp=10)
+
+        def __init__(self, available: bool) -> None:
+            self.available = available
+
+        def next_key_event(self) -> bool:
+            return self.available
+
+    probes.aged(Target, "next_key_event", histogram)
+
+    with patch("roki.firmware.probes.ticks_ms") as m:
+        m.return_value = 13
+        assert not Target(False).next_key_event()
+        assert Target(True).next_key_event()
+
+    assert histogram.count == 1
+    assert histogram.max == 3000
+
+
+def test_timed_function(histogram: Histogram):
+    module = MagicMock()
+    module.work.return_value = True
+
+    probes.timed(module, "work", histogram, bool)
+
+    assert module.work(1, 2) is True
+    assert histogram.count == 1
+
+
+@pytest.mark.usefixtures("restore_instrumented_classes")
+def test_install():
+    from roki.firmware.kb import Primary
+
+    assert not probes.installed()
+    original = Primary.get_message
+
+    probes.install()
+    assert probes.installed()
+    assert Primary.get_message is not original
+    assert set(probes.histograms) == {
+        "matrix",
+        "ble_send",
+        "ble_receive",
+        "key_press",
+        "dispatch",
+        "report",
+        "gc",
+    }
+
+    wrapped = Primary.get_message
+    probes.install()
+    assert Primary.get_message is wrapped
+
+
+@pytest.mark.usefixtures("restore_instrumented_classes")
+def test_dump(capsys: pytest.CaptureFixture[str]):
+    probes.get_histogram("stage").record(5)
+
+    probes.dump()
+
+    assert capsys.readouterr().out.startswith(f"{MARKER} stage 1 5 5")
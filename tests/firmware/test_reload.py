@@ -0,0 +1,165 @@
+import io
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+if TYPE_CHECKING:
+    from roki.firmware.config import Config
+    from roki.firmware.reload import ConfigReloader
+
+
+LAYERS = [
+    {"name": "main", "primary_keys": [["A", "B"]]},
+    {"name": "other", "primary_keys": [["C", "D"]]},
+]
+
+
+class FakeStream:
+    def __init__(self) -> None:
+        self.data = b""
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.data)
+
+    def read(self, size: int) -> bytes:
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+@pytest.fixture(autouse=True)
+def mock_init():
+    with patch("roki.firmware.keys.init") as m:
+        m.return_value = None
+        yield m
+
+
+@pytest.fixture
+def config() -> "Config":
+    from roki.firmware.config import Config
+
+    return Config(LAYERS)
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"layers": LAYERS}))
+    return str(path)
+
+
+@pytest.fixture
+def stream() -> FakeStream:
+    return FakeStream()
+
+
+@pytest.fixture
+def on_reload() -> MagicMock:
+    return MagicMock()
+
+
+@pytest.fixture
+def reloader(
+    config: "Config",
+    path: str,
+    stream: FakeStream,
+    on_reload: MagicMock,
+) -> "ConfigReloader":
+    from roki.firmware.reload import ConfigReloader
+
+    return ConfigReloader(config, lambda: path, stream, on_reload, period=1000)
+
+
+def test_apply(reloader: "ConfigReloader", config: "Config", on_reload: MagicMock):
+    layers = [LAYERS[0], dict(LAYERS[1], name="changed")]
+
+    assert reloader.apply(json.dumps({"layers": layers}).encode())
+
+    on_reload.assert_called_once()
+    assert config.layers[1].name == "changed"
+    assert reloader.reloads == 1
+
+
+def test_apply_invalid(
+    reloader: "ConfigReloader",
+    config: "Config",
+    on_reload: MagicMock,
+):
+    layers = config.layers
+
+    assert not reloader.apply(b"{not json")
+    assert not reloader.apply(b'{"layers": [{"color": "nope"}]}')
+
+    on_reload.assert_not_called()
+    assert config.layers is layers
+
+
+def test_file_change(reloader: "ConfigReloader", config: "Config", path: str):
+    Path(path).write_text(json.dumps({"layers": LAYERS[:1]}))
+
+    reloader.update(999)
+    assert len(config.layers) == 2
+
+    with patch("builtins.open", io.open):
+        reloader.update(1000)
+    assert len(config.layers) == 1
+
+    # unchanged file
+    reloader.update(2000)
+    assert reloader.reloads == 1
+
+
+def test_file_located_again(
+    config: "Config",
+    path: str,
+    tmp_path,
+    on_reload: MagicMock,
+):
+    from roki.firmware.reload import ConfigReloader
+
+    keymap = tmp_path / "keymap-left.bin"
+    keymap.write_bytes(b"RKM\x01\x00\x00")
+    reloader = ConfigReloader(
+        config,
+        lambda: str(keymap) if keymap.exists() else path,
+        on_reload=on_reload,
+    )
+    assert reloader.path == str(keymap)
+
+    # uploading config.json removes the keymap
+    keymap.unlink()
+    with patch("builtins.open", io.open):
+        reloader.update(1000)
+
+    assert reloader.path == path
+    assert reloader.reloads == 1
+    on_reload.assert_called_once()
+
+
+def test_serial_push(reloader: "ConfigReloader", config: "Config", stream: FakeStream):
+    from roki.firmware.reload import FRAME_END, FRAME_START
+
+    frame = FRAME_START + json.dumps({"layers": LAYERS[:1]}).encode() + FRAME_END
+    stream.data = b">>> noise" + frame[:10]
+    reloader.update(0)
+    assert reloader.frame is not None
+    assert len(config.layers) == 2
+
+    stream.data = frame[10:] + b"more noise"
+    reloader.update(0)
+    assert reloader.frame is None
+    assert len(config.layers) == 1
+    assert reloader.reloads == 1
+
+
+def test_serial_push_too_large(reloader: "ConfigReloader", stream: FakeStream):
+    from roki.firmware.reload import FRAME_START, MAX_FRAME
+
+    stream.data = FRAME_START + bytes(MAX_FRAME + 1)
+    reloader.update(0)
+
+    assert reloader.frame is None
+    assert reloader.reloads == 0
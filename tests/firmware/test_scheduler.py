@@ -0,0 +1,156 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from roki.firmware.scheduler import Clock, Scheduler, StepClock
+
+
+@pytest.fixture
+def clock():
+    return StepClock(step=1)
+
+
+@pytest.fixture
+def scheduler(clock: StepClock):
+    return Scheduler(clock)
+
+
+def test_clock():
+    with patch("roki.firmware.scheduler.ticks_ms") as m:
+        m.return_value = 42
+        clock = Clock()
+        assert clock.now() == 42
+        clock.advance()
+        assert clock.now() == 42
+
+
+def test_step_clock(clock: StepClock):
+    assert clock.now() == 0
+    clock.advance()
+    clock.advance()
+    assert clock.now() == 2
+
+
+def test_scheduler_orders_tasks_by_priority(scheduler: Scheduler):
+    calls: list[str] = []
+    scheduler.add("low", lambda: calls.append("low"), priority=3)
+    scheduler.add("high", lambda: calls.append("high"), priority=0)
+    scheduler.add("mid", lambda: calls.append("mid"), priority=1)
+
+    scheduler.reset()
+    scheduler.tick()
+
+    assert calls == ["high", "mid", "low"]
+
+
+def test_scheduler_respects_task_period(scheduler: Scheduler):
+    fast = MagicMock()
+    slow = MagicMock()
+    scheduler.add("fast", fast, period=0)
+    scheduler.add("slow", slow, period=5)
+
+    scheduler.reset()
+    for _ in range(10):
+        scheduler.tick()
+
+    assert fast.call_count == 10
+    assert slow.call_count == 2
+    assert scheduler.get("slow").runs == 2
+
+
+def test_scheduler_get_unknown_task(scheduler: Scheduler):
+    with pytest.raises(KeyError):
+        scheduler.get("unknown")
+
+
+def test_scheduler_run_until(clock: StepClock):
+    scheduler = Scheduler(clock, max_ticks=4)
+    task = MagicMock()
+    scheduler.add("task", task)
+
+    scheduler.run_until(lambda: False)
+
+    assert task.call_count == 4
+    assert clock.now() == 4
+
+
+def test_scheduler_run_until_stop_condition(scheduler: Scheduler):
+    task = MagicMock()
+    scheduler.add("task", task)
+
+    scheduler.run_until(lambda: task.call_count >= 3)
+
+    assert task.call_count == 3
+
+
+def test_buzzer_queue_notes():
+    from roki.firmware.buzzer import OFF, ON, Buzzer
+    from roki.firmware.scheduler import StepClock
+
+    pwm = MagicMock()
+    clock = StepClock(step=5)
+    buzzer = Buzzer(pwm, clock)
+    buzzer.queue_notes((("C3", 1), ("", 1)), 0.01)
+
+    buzzer.update()
+    assert buzzer.playing
+    assert pwm.duty_cycle == ON
+    assert pwm.frequency == 131
+
+    clock.advance()
+    buzzer.update()
+    assert pwm.duty_cycle == ON
+
+    clock.advance()
+    buzzer.update()
+    assert pwm.duty_cycle == OFF
+
+    clock.advance()
+    clock.advance()
+    buzzer.update()
+    assert not buzzer.playing
+
+
+def test_timer_wheel_fires_due_timers():
+    from roki.firmware.scheduler import Timer, TimerWheel
+
+    wheel = TimerWheel(now=0, slots=4, resolution=10)
+    fired: list[str] = []
+    soon = Timer(lambda: fired.append("soon"))
+    late = Timer(lambda: fired.append("late"))
+    wheel.schedule(soon, 15)
+    # more than a full turn ahead
+    wheel.schedule(late, 95)
+
+    wheel.update(14)
+    assert fired == []
+    wheel.update(15)
+    assert fired == ["soon"]
+    assert not soon.active
+
+    wheel.update(60)
+    assert fired == ["soon"]
+    wheel.update(100)
+    assert fired == ["soon", "late"]
+    assert wheel.count == 0
+
+
+def test_timer_wheel_cancel_and_reschedule():
+    from roki.firmware.scheduler import Timer, TimerWheel
+
+    wheel = TimerWheel(now=0)
+    callback = MagicMock()
+    timer = Timer(callback)
+
+    wheel.schedule(timer, 20)
+    wheel.cancel(timer)
+    wheel.update(30)
+    callback.assert_not_called()
+
+    wheel.schedule(timer, 50)
+    wheel.schedule(timer, 70)
+    assert wheel.count == 1
+    wheel.update(60)
+    callback.assert_not_called()
+    wheel.update(70)
+    callback.assert_called_once()
@@ -4,7 +4,7 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 if TYPE_CHECKING:
-    from roki.firmware.service import RokiService
+    from roki.firmware.service import PacketSequence, RokiService
 
 
 @pytest.fixture
@@ -18,6 +18,13 @@ def roki_service():
     return service
 
 
+@pytest.fixture
+def sequence() -> "PacketSequence":
+    from roki.firmware.service import PacketSequence
+
+    return PacketSequence()
+
+
 @pytest.fixture
 def mock_packet_buffer_characteristic():
     from roki.firmware.service import PacketBufferCharacteristic
@@ -30,10 +37,12 @@ def test_roki_service_read(
     roki_service: "RokiService",
     mock_packet_buffer_characteristic: MagicMock,
 ):
-    b = bytearray(4)
-    r = roki_service.readinto(b)
+    with patch.object(roki_service, "packets") as m:
+        m.readinto.return_value = 4
+        b = bytearray(4)
+        r = roki_service.readinto(b)
 
-    assert r == (0, 0, 0, 0)
+    assert r == 4
     mock_packet_buffer_characteristic.assert_called()
 
 
@@ -46,7 +55,7 @@ def test_roki_service_read_no_value(
         b = bytearray(4)
         r = roki_service.readinto(b)
 
-    assert r == (0, 0, 0, 0)
+    assert r == 0
     mock_packet_buffer_characteristic.assert_called()
 
 
@@ -57,3 +66,57 @@ def test_roki_service_write(
     roki_service.write(bytes((1, 2, 3, 4)))
 
     mock_packet_buffer_characteristic.assert_called()
+
+
+@pytest.mark.parametrize(
+    ("length", "expected"),
+    [(None, 20), (0, 20), (64, 64), (512, 244)],
+)
+def test_roki_service_packet_size(
+    roki_service: "RokiService",
+    mock_packet_buffer_characteristic: MagicMock,
+    length: int | None,
+    expected: int,
+):
+    with patch.object(roki_service, "packets") as m:
+        m.outgoing_packet_length = length
+        assert roki_service.packet_size() == expected
+
+
+def test_sequence_round_trip():
+    from roki.firmware.service import read_sequence, write_sequence
+
+    buffer = bytearray(2)
+    write_sequence(buffer, 0x1234)
+
+    assert buffer == b"\x12\x34"
+    assert read_sequence(buffer) == 0x1234
+
+
+def test_packet_sequence(sequence: "PacketSequence"):
+    assert sequence.accept(10)
+    assert sequence.accept(11)
+    assert not sequence.accept(11)
+    assert not sequence.accept(9)
+    assert sequence.accept(14)
+
+    assert sequence.received == 3
+    assert sequence.duplicates == 2
+    assert sequence.lost == 2
+
+
+def test_packet_sequence_wraps(sequence: "PacketSequence"):
+    assert sequence.accept(0xFFFF)
+    # 0 is a sequence number like the others
+    assert sequence.accept(0)
+    assert sequence.accept(1)
+    assert sequence.lost == 0
+
+
+def test_packet_sequence_reset(sequence: "PacketSequence"):
+    sequence.accept(500)
+    sequence.reset()
+
+    assert sequence.accept(1)
+    assert sequence.lost == 0
+    assert sequence.received == 2
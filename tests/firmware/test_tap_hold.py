@@ -0,0 +1,182 @@
+from typing import TYPE_CHECKING, Iterator
+from unittest.mock import patch
+
+import pytest
+
+from roki.firmware.scheduler import StepClock, TimerWheel
+
+if TYPE_CHECKING:
+    from roki.firmware.tap_hold import TapHold
+
+NO_KEY = -1
+TAP_HOLD_KEY = 1
+OTHER_KEY = 2
+SECOND_TAP_HOLD_KEY = 3
+
+
+@pytest.fixture
+def engine(
+    clock: StepClock, timers: TimerWheel, calls: list, send
+) -> Iterator["TapHold"]:
+    from roki.firmware.keys import KEYBOARD
+    from roki.firmware.tap_hold import TapHold
+
+    # taps send 100 + position, holds 200 + position
+    tap_holds = []
+    definitions = {}
+    for position in (TAP_HOLD_KEY, SECOND_TAP_HOLD_KEY):
+        definitions[position] = len(tap_holds)
+        tap_holds.append((KEYBOARD, 100 + position, KEYBOARD, 200 + position))
+
+    with patch("roki.firmware.tap_hold.tap_holds", tap_holds):
+        yield TapHold(
+            clock,
+            timers,
+            lambda position: definitions.get(position, NO_KEY),
+            lambda position, pressed: calls.append((position, pressed)),
+            term=200,
+            send=send,
+        )
+
+
+def wait(clock: StepClock, timers: TimerWheel, ms: int) -> None:
+    for _ in range(ms // clock.step):
+        clock.advance()
+        timers.update(clock.now())
+
+
+def test_tap(engine: "TapHold", clock: StepClock, timers: TimerWheel, calls: list):
+    assert engine.handle(TAP_HOLD_KEY, True)
+    wait(clock, timers, 100)
+    assert calls == []
+
+    assert engine.handle(TAP_HOLD_KEY, False)
+    assert calls == [(101, True), (101, False)]
+    assert engine.pending == NO_KEY
+    assert not engine.timer.active
+
+
+def test_hold_after_term(
+    engine: "TapHold",
+    clock: StepClock,
+    timers: TimerWheel,
+    calls: list,
+):
+    engine.handle(TAP_HOLD_KEY, True)
+    engine.handle(OTHER_KEY, True)
+    wait(clock, timers, 190)
+    assert calls == []
+
+    wait(clock, timers, 10)
+    assert calls == [(201, True), (OTHER_KEY, True)]
+
+    # no longer queued once decided
+    assert not engine.handle(OTHER_KEY, False)
+    assert engine.handle(TAP_HOLD_KEY, False)
+    assert calls[-1] == (201, False)
+    assert engine.held == {}
+
+
+def test_other_keys_are_not_handled(engine: "TapHold"):
+    assert not engine.handle(OTHER_KEY, True)
+    assert not engine.handle(OTHER_KEY, False)
+
+
+def test_permissive_hold(engine: "TapHold", calls: list):
+    engine.handle(TAP_HOLD_KEY, True)
+    engine.handle(OTHER_KEY, True)
+    assert calls == []
+
+    engine.handle(OTHER_KEY, False)
+    assert calls == [(201, True), (OTHER_KEY, True), (OTHER_KEY, False)]
+
+    engine.handle(TAP_HOLD_KEY, False)
+    assert calls[-1] == (201, False)
+
+
+def test_roll_without_permissive_hold(engine: "TapHold", calls: list):
+    engine.permissive_hold = False
+    engine.handle(TAP_HOLD_KEY, True)
+    engine.handle(OTHER_KEY, True)
+    engine.handle(OTHER_KEY, False)
+    assert calls == []
+
+    engine.handle(TAP_HOLD_KEY, False)
+    assert calls == [
+        (101, True),
+        (101, False),
+        (OTHER_KEY, True),
+        (OTHER_KEY, False),
+    ]
+
+
+def test_roll_releases_tap_hold_key_first(engine: "TapHold", calls: list):
+    engine.handle(TAP_HOLD_KEY, True)
+    engine.handle(OTHER_KEY, True)
+    engine.handle(TAP_HOLD_KEY, False)
+
+    assert calls == [(101, True), (101, False), (OTHER_KEY, True)]
+
+
+def test_replayed_tap_hold_key_is_decided_again(engine: "TapHold", calls: list):
+    engine.permissive_hold = False
+    engine.handle(TAP_HOLD_KEY, True)
+    engine.handle(SECOND_TAP_HOLD_KEY, True)
+    engine.handle(SECOND_TAP_HOLD_KEY, False)
+    engine.handle(TAP_HOLD_KEY, False)
+
+    assert calls == [(101, True), (101, False), (103, True), (103, False)]
+    assert engine.pending == NO_KEY
+
+
+def test_release_after_term_before_timer_fired(
+    engine: "TapHold",
+    clock: StepClock,
+    calls: list,
+):
+    engine.handle(TAP_HOLD_KEY, True)
+    for _ in range(20):
+        clock.advance()
+
+    engine.handle(TAP_HOLD_KEY, False)
+    assert calls == [(201, True), (201, False)]
+
+
+def test_full_queue_selects_hold(engine: "TapHold", calls: list):
+    engine.permissive_hold = False
+    engine.handle(TAP_HOLD_KEY, True)
+    for i in range(len(engine.queue)):
+        assert engine.handle(10 + i, True)
+
+    # the queue is replayed, the new event is left to the caller
+    assert not engine.handle(OTHER_KEY, True)
+    assert calls[0] == (201, True)
+    assert len(calls) == len(engine.queue) + 1
+
+
+def test_reset(engine: "TapHold", calls: list):
+    engine.handle(TAP_HOLD_KEY, True)
+    engine.handle(OTHER_KEY, True)
+    engine.reset()
+
+    assert engine.pending == NO_KEY
+    assert engine.queued == 0
+    assert not engine.timer.active
+    assert not engine.handle(OTHER_KEY, False)
+    assert calls == []
+
+
+def test_reset_releases_held_keys(
+    engine: "TapHold",
+    clock: StepClock,
+    timers: TimerWheel,
+    calls: list,
+):
+    engine.handle(TAP_HOLD_KEY, True)
+    wait(clock, timers, 200)
+    assert calls == [(201, True)]
+
+    engine.reset()
+    assert calls == [(201, True), (201, False)]
+    assert engine.held == {}
+    assert not engine.handle(TAP_HOLD_KEY, False)
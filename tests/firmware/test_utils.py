@@ -3,22 +3,16 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from roki.firmware.utils import (
-    Cycle,
     Debouncer,
     Loop,
-    decode_float,
+    decode_axis,
     decode_vector,
-    encode_float,
+    encode_axis,
     encode_vector,
     get_coords,
 )
 
 
-@pytest.fixture
-def cycle():
-    return Cycle()
-
-
 @pytest.fixture
 def debouncer():
     return Debouncer(0)
@@ -40,18 +34,6 @@ def test_decode_vector():
     assert result == (5, 7)
 
 
-def test_encode_float():
-    assert encode_float(-1) == 255
-    assert encode_float(1) == 127
-    assert encode_float(0) == 0
-
-
-def test_decode_float():
-    assert decode_float(0) == 0
-    assert decode_float(127) == 1
-    assert decode_float(255) == -1
-
-
 def test_loop():
     loop = Loop(5)
     i = 0
@@ -61,15 +43,6 @@ def test_loop():
     assert i == 5
 
 
-def test_cycle(cycle: Cycle):
-    assert cycle.value == 0
-    cycle.increment()
-    assert cycle.value == 1
-    cycle.value = 99
-    cycle.increment()
-    assert cycle.value == 0
-
-
 def test_debouncer(debouncer: Debouncer):
     debouncer.update(1)
     assert debouncer.changed is True
@@ -90,3 +63,15 @@ def test_blink_led(mock_sleep: MagicMock):
     blink_led()
 
     mock_sleep.assert_called()
+
+
+def test_encode_axis():
+    assert encode_axis(-127) == 255
+    assert encode_axis(127) == 127
+    assert encode_axis(0) == 0
+    assert encode_axis(-1) == 129
+
+
+def test_decode_axis():
+    for value in (-127, -1, 0, 1, 127):
+        assert decode_axis(encode_axis(value)) == value
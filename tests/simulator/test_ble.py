@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def clock():
+    return SimpleNamespace(value=0)
+
+
+@pytest.fixture
+def link(clock: SimpleNamespace):
+    from roki.simulator.ble import Link
+
+    return Link(clock, interval=5, packets_per_event=1, buffer_size=2)
+
+
+def test_link_delivers_on_connection_events(clock: SimpleNamespace, link):
+    buf = bytearray(4)
+    clock.value = 1
+    link.secondary.write(bytes((1, 1, 0, 0)))
+    link.secondary.write(bytes((2, 1, 1, 0)))
+
+    assert link.primary.readinto(buf) == 0
+
+    clock.value = 5
+    assert link.primary.readinto(buf) == 4
+    assert buf[0] == 1
+    assert link.primary.readinto(buf) == 0
+
+    clock.value = 10
+    assert link.primary.readinto(buf) == 4
+    assert buf[0] == 2
+
+
+def test_link_drops_oldest_when_buffer_is_full(clock: SimpleNamespace, link):
+    link.packets_per_event = 4
+    for i in range(3):
+        link.secondary.write(bytes((i, 0, 0, 0)))
+
+    clock.value = 5
+    buf = bytearray(4)
+    link.primary.readinto(buf)
+
+    assert buf[0] == 1
+    assert link.to_primary.dropped == 1
+
+
+def test_loopback_service(clock: SimpleNamespace, link):
+    from roki.simulator.ble import Connection, LoopbackService
+
+    service = link.peripheral_service()
+    assert isinstance(service, LoopbackService)
+    service.write(bytes((7, 1, 2, 3)))
+
+    connection = Connection(link)
+    connection.connection_interval = 1
+    clock.value = 1
+    buf = bytearray(4)
+    assert connection[None].readinto(buf) == 4
+    assert buf == bytes((7, 1, 2, 3))
+    assert connection.connected
+    connection.disconnect()
+    assert not connection.connected
+
+
+def test_radio(link):
+    from roki.simulator.ble import Radio
+
+    radio = Radio(link)
+    radio.start_advertising()
+    assert radio.advertising
+    radio.stop_advertising()
+
+    adv = next(radio.start_scan())
+    assert link.peripheral_service in adv.services
+    radio.stop_scan()
+
+    connection = radio.connect(adv)
+    assert radio.connections == [connection]
+    assert radio.connected
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+from roki.simulator.hardware import (
+    ADC_CENTER,
+    AnalogIn,
+    Event,
+    EventQueue,
+    HIDService,
+    PWMOut,
+    Timeline,
+    build_modules,
+)
+
+
+def test_timeline():
+    clock = SimpleNamespace(value=0)
+    timeline = Timeline(0)
+    timeline.set(10, 1)
+    timeline.set(5, 2)
+
+    assert timeline.value == 0
+
+    timeline.clock = clock
+    assert timeline.value == 0
+    clock.value = 5
+    assert timeline.value == 2
+    clock.value = 20
+    assert timeline.value == 1
+
+
+def test_analog_in_defaults_to_center():
+    assert AnalogIn("AIN7").value == ADC_CENTER
+
+
+def test_event_queue_releases_events_on_time():
+    clock = SimpleNamespace(value=0)
+    queue = EventQueue(max_events=2)
+    queue.clock = clock
+    queue.schedule([Event(1, True, 5), Event(1, False, 10)])
+
+    assert queue.get() is None
+    assert len(queue) == 0
+
+    clock.value = 10
+    assert len(queue) == 2
+    event = Event()
+    assert queue.get_into(event)
+    assert (event.key_number, event.pressed) == (1, True)
+    assert queue.get().released  # type: ignore
+    assert not queue.get_into(event)
+
+
+def test_event_queue_overflow():
+    clock = SimpleNamespace(value=0)
+    queue = EventQueue(max_events=1)
+    queue.clock = clock
+    queue.schedule([Event(1, True, 0), Event(2, True, 0)])
+
+    assert len(queue) == 1
+    assert queue.overflowed
+    queue.clear()
+    assert not queue.overflowed
+
+
+def test_pwm_out_counts_tones():
+    pwm = PWMOut("P0_06", variable_frequency=True)
+    pwm.duty_cycle = 2**15
+    pwm.duty_cycle = 2**15
+    pwm.duty_cycle = 0
+    pwm.duty_cycle = 2**15
+
+    assert pwm.tones == 2
+
+
+def test_hid_service_records_reports():
+    hid = HIDService()
+    hid.keyboard.clock = SimpleNamespace(value=3)
+    hid.keyboard.send_report(bytearray(8))
+
+    assert hid.keyboard.reports == [(3, bytes(8))]
+
+
+def test_build_modules():
+    modules = build_modules()
+
+    assert modules["board"].P0_24 == "P0_24"
+    assert issubclass(modules["_bleio"].BluetoothError, Exception)
+    assert modules["_bleio"].adapter is not None
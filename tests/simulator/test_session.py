@@ -0,0 +1,120 @@
+import json
+import threading
+
+import pytest
+
+from roki.simulator.session import (
+    DEFAULT_CONFIG,
+    LockstepClock,
+    SimulationReport,
+    Simulator,
+)
+
+
+def test_lockstep_clock_takes_turns():
+    clock = LockstepClock(step=2, parties=2)
+    order: list[tuple[int, int]] = []
+
+    def party(index: int):
+        view = clock.view(index)
+        for _ in range(3):
+            order.append((index, view.now()))
+            view.advance()
+        clock.leave(index)
+
+    threads = [threading.Thread(target=party, args=(i,)) for i in (1, 0)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert order == [(0, 0), (1, 0), (0, 2), (1, 2), (0, 4), (1, 4)]
+
+
+def test_lockstep_clock_stalls():
+    clock = LockstepClock(parties=2, timeout=0.01)
+
+    with pytest.raises(RuntimeError):
+        clock.view(1).now()
+
+
+def test_simulator_reports_latency():
+    simulator = Simulator(ticks=200, snapshot_period=0)
+    simulator.roll("primary", (7, 8, 9), start=5, gap=5)
+    simulator.roll("secondary", (7, 8, 9), start=5, gap=5)
+
+    report = simulator.run()
+
+    assert isinstance(report, SimulationReport)
+    assert report.key_presses == 6
+    assert report.messages_sent == 6
+    assert report.messages_received == 6
+    assert len(report.latencies_ms["primary"]) == 3
+    assert len(report.latencies_ms["secondary"]) == 3
+    assert report.latency_summary("primary") == (0, 0, 0)
+    assert min(report.latencies_ms["secondary"]) > 0
+    assert "Latency (secondary)" in report.format()
+
+
+def test_simulator_is_repeatable():
+    def run():
+        simulator = Simulator(ticks=150)
+        simulator.roll("secondary", (7, 8, 9, 10), start=0, gap=2)
+        return simulator.run().latencies_ms
+
+    assert run() == run()
+
+
+def test_simulator_with_extras():
+    simulator = Simulator(ticks=50, extras=True)
+    simulator.tilt("secondary", 5, 2**16 - 1, 2**15)
+    simulator.tilt("secondary", 20, 2**15, 2**15)
+    simulator.turn("primary", 10, 1)
+
+    report = simulator.run()
+
+    assert report.messages_sent > 0
+    assert report.hid_reports > 0
+
+
+def test_simulator_packs_simultaneous_events():
+    simulator = Simulator(ticks=100, snapshot_period=0)
+    simulator.roll("secondary", (7, 8, 9), start=5, gap=0)
+
+    report = simulator.run()
+
+    assert report.key_presses == 3
+    # presses in one packet, releases in another
+    assert report.messages_sent == 2
+    assert len(set(report.latencies_ms["secondary"])) == 1
+
+
+def test_simulator_tap_hold_times_out(tmp_path):
+    with open(DEFAULT_CONFIG) as file:
+        data = json.load(file)
+    # key 7 of the left half
+    data["layers"][0]["primary_keys"][1][4] = "R|LEFT_CONTROL"
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(data))
+    simulator = Simulator(ticks=500, config_path=str(config_path))
+    simulator.tap("primary", 7, at=10, hold=400)
+    simulator.tap("primary", 8, at=300)
+
+    report = simulator.run()
+
+    # the hold was decided at the tapping term, not by the next key
+    assert report.latencies_ms["primary"] == [0]
+
+
+def test_simulator_relaxes_idle_link():
+    def run(idle_interval: float):
+        simulator = Simulator(ticks=2000, idle_connection_interval=idle_interval)
+        simulator.roll("secondary", (7, 8, 9), start=10, gap=15)
+        return simulator.run()
+
+    fixed = run(7.5)
+    adaptive = run(30.0)
+
+    assert adaptive.connection_events < fixed.connection_events
+    # typing happens at the fast interval
+    assert adaptive.latencies_ms["secondary"] == fixed.latencies_ms["secondary"]